@@ -1,64 +1,156 @@
+from datetime import timedelta
+from functools import lru_cache
+
 from django.apps import apps as django_apps
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
 
-SETTINGS = None
+# the BASE_BACKEND settings, the dict is updated in place by load_settings so the modules importing it always see the
+# current settings.
+SETTINGS = {}
 
 
 def load_settings():
-    global SETTINGS
-    try:
-        SETTINGS = settings.BASE_BACKEND
-    except AttributeError:
-        SETTINGS = {}
+    SETTINGS.clear()
+    SETTINGS.update(getattr(settings, 'BASE_BACKEND', {}))
 
 
 load_settings()
 
 
+def reload_settings():
+    """
+    reloads the settings and forgets everything the resolvers below cached, it's called when the settings change
+    (see apps.py), from override_settings in the tests for instance.
+    """
+    load_settings()
+    for resolver in (get_password_reset_table, get_otp_verification_table, get_access_token_table, get_outbox_table,
+                     get_otp_ttl, get_password_reset_ttl, get_otp_store_class, get_send_sms_function):
+        resolver.cache_clear()
+
+    from .tokens import get_local_tokens, get_token_uses
+    # the pending uses are handed over to the new recorder, they're still written.
+    pending = set()
+    if get_token_uses.cache_info().currsize:
+        previous = get_token_uses()
+        with previous.lock:
+            pending, previous.used = previous.used, set()
+    get_local_tokens.cache_clear()
+    get_token_uses.cache_clear()
+    get_token_uses().used.update(pending)
+
+
+def _get_table(use_base_table_setting: str, base_table: str, table_setting: str):
+    """
+    Return the base backend model if use_base_table_setting is set, the model named by table_setting otherwise.
+    """
+    if SETTINGS.get(use_base_table_setting, False):
+        return django_apps.get_model(base_table, require_ready=False)
+    table = SETTINGS.get(table_setting, None)
+    if table is None:
+        raise ImproperlyConfigured("either %s or %s must be provided in the settings."
+                                   % (use_base_table_setting, table_setting))
+    try:
+        return django_apps.get_model(table, require_ready=False)
+    except ValueError:
+        raise ImproperlyConfigured("%s must be of the form 'app_label.model_name'" % table_setting)
+    except LookupError:
+        raise ImproperlyConfigured("%s refers to model '%s' that has not been installed" % (table_setting, table))
+
+
+# the resolvers are called on the hot paths, they are memoized until the settings change.
+
+@lru_cache(maxsize=None)
 def get_password_reset_table():
     """
     Return the Password Reset model that is active in this project.
     """
-    if SETTINGS.get("USE_BASE_BACKEND_RESET_PASSWORD_TABLE", False):
-        return django_apps.get_model("base_backend.PasswordReset", require_ready=False)
-    else:
-        try:
-            return django_apps.get_model(SETTINGS.get("PASSWORD_RESET_TABLE", None), require_ready=False)
-        except ValueError:
-            raise ImproperlyConfigured("PHONE_VERIFICATION_OTP_TABLE must be of the form 'app_label.model_name'")
-        except LookupError:
-            raise ImproperlyConfigured(
-                "PHONE_VERIFICATION_OTP_TABLE refers to model '%s' that has not been installed"
-                % settings.PASSWORD_RESET_TABLE)
+    return _get_table("USE_BASE_BACKEND_RESET_PASSWORD_TABLE", "base_backend.PasswordReset", "PASSWORD_RESET_TABLE")
 
 
+@lru_cache(maxsize=None)
 def get_otp_verification_table():
     """
     Return the OTP Verification model that is active in this project.
     """
-    if SETTINGS.get("USE_BASE_BACKEND_OTP_TABLE", False):
-        return django_apps.get_model("base_backend.SmsVerification", require_ready=False)
-    else:
-        try:
-            return django_apps.get_model(SETTINGS.get("PHONE_VERIFICATION_OTP_TABLE", None), require_ready=False)
-        except ValueError:
-            raise ImproperlyConfigured("PHONE_VERIFICATION_OTP_TABLE must be of the form 'app_label.model_name'")
-        except LookupError:
-            raise ImproperlyConfigured(
-                "PHONE_VERIFICATION_OTP_TABLE refers to model '%s' that has not been installed"
-                % settings.PHONE_VERIFICATION_OTP_TABLE)
+    return _get_table("USE_BASE_BACKEND_OTP_TABLE", "base_backend.SmsVerification", "PHONE_VERIFICATION_OTP_TABLE")
+
+
+@lru_cache(maxsize=None)
+def get_access_token_table():
+    """
+    Return the Access Token model that is active in this project.
+    """
+    return _get_table("USE_BASE_BACKEND_ACCESS_TOKEN_TABLE", "base_backend.AccessToken", "ACCESS_TOKEN_TABLE")
+
+
+@lru_cache(maxsize=None)
+def get_outbox_table():
+    """
+    Return the Outbox model, used when USE_BASE_BACKEND_OUTBOX_TABLE is set to queue the outgoing sms, emails and
+    notifications.
+    """
+    if not SETTINGS.get("USE_BASE_BACKEND_OUTBOX_TABLE", False):
+        raise ImproperlyConfigured("you are trying to use the outbox, but USE_BASE_BACKEND_OUTBOX_TABLE is not set in "
+                                   "the settings.")
+    return django_apps.get_model("base_backend.OutboxMessage", require_ready=False)
+
+
+@lru_cache(maxsize=None)
+def get_otp_ttl():
+    """
+    Return how long an OTP stays valid as a timedelta, OTP_TTL is expressed in seconds (default 15 minutes).
+    None means the OTPs never expire.
+    """
+    ttl = SETTINGS.get("OTP_TTL", 15 * 60)
+    return timedelta(seconds=ttl) if ttl is not None else None
 
 
+@lru_cache(maxsize=None)
+def get_password_reset_ttl():
+    """
+    Return how long a password reset request stays valid as a timedelta, PASSWORD_RESET_TTL is expressed in seconds
+    (default 1 hour). None means the requests never expire.
+    """
+    ttl = SETTINGS.get("PASSWORD_RESET_TTL", 60 * 60)
+    return timedelta(seconds=ttl) if ttl is not None else None
+
+
+@lru_cache(maxsize=None)
+def get_otp_store_class():
+    """
+    Return the OTP store class that is active in this project, OTP_STORE is its dotted path
+    (default 'base_backend.otp.ModelOtpStore').
+    """
+    try:
+        return import_string(SETTINGS.get("OTP_STORE", "base_backend.otp.ModelOtpStore"))
+    except ImportError as e:
+        raise ImproperlyConfigured("OTP_STORE couldn't be imported: %s" % e)
+
+
+def get_otp_store():
+    """
+    Return an instance of the OTP store that is active in this project.
+    """
+    return get_otp_store_class()()
+
+
+@lru_cache(maxsize=None)
 def get_send_sms_function():
     """
     return the implemented function for sending sms, it should accept the named params:
     phone: Phone number.
     message: A message.
+    SEND_SMS_FUNC is either the function or its dotted path, it's read from BASE_BACKEND then from the settings module.
     """
-
-    if SETTINGS.get("SEND_SMS_FUNC", None):
-        return settings.SEND_SMS_FUNC
-    else:
+    function = SETTINGS.get("SEND_SMS_FUNC", None) or getattr(settings, 'SEND_SMS_FUNC', None)
+    if not function:
         raise ImproperlyConfigured("you are trying to send an sms, but the SEND_SMS_FUNC is not provided in the"
                                    " settings.")
+    if isinstance(function, str):
+        try:
+            return import_string(function)
+        except ImportError as e:
+            raise ImproperlyConfigured("SEND_SMS_FUNC couldn't be imported: %s" % e)
+    return function
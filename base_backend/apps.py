@@ -1,5 +1,56 @@
 from django.apps import AppConfig
+from django.core import checks
+from django.core.signals import setting_changed
+from django.db.models.signals import m2m_changed, post_save, post_delete
+
+
+def settings_changed(setting, **kwargs):
+    if setting in ('BASE_BACKEND', 'SEND_SMS_FUNC'):
+        from . import reload_settings
+        reload_settings()
+    elif setting == 'AUTHENTICATION_BACKENDS':
+        from .authorization import permissions_from_model_backend
+        permissions_from_model_backend.cache_clear()
 
 
 class AccountsConfig(AppConfig):
     name = 'base_backend'
+
+    def ready(self):
+        from .checks import check_settings
+        checks.register(check_settings)
+        setting_changed.connect(settings_changed, dispatch_uid='base_backend_settings_changed')
+
+        from .caching import model_changed
+        from .signals import soft_deleted
+        post_save.connect(model_changed, dispatch_uid='base_backend_response_cache_save')
+        post_delete.connect(model_changed, dispatch_uid='base_backend_response_cache_delete')
+        soft_deleted.connect(model_changed, dispatch_uid='base_backend_response_cache_soft_delete')
+
+        from django.contrib.auth import get_user_model
+        from django.contrib.auth.models import Group
+        from .authorization import group_changed, user_authorization_changed
+        user_model = get_user_model()
+        for field_name in ('groups', 'user_permissions'):
+            # the user models without django's PermissionsMixin have neither.
+            if hasattr(user_model, field_name):
+                m2m_changed.connect(user_authorization_changed, sender=getattr(user_model, field_name).through,
+                                    dispatch_uid='base_backend_authorization_user_%s' % field_name)
+        m2m_changed.connect(group_changed, sender=Group.permissions.through,
+                            dispatch_uid='base_backend_authorization_group_permissions')
+        post_save.connect(group_changed, sender=Group, dispatch_uid='base_backend_authorization_group_save')
+        post_delete.connect(group_changed, sender=Group, dispatch_uid='base_backend_authorization_group_delete')
+
+        from . import SETTINGS
+        if SETTINGS.get("USE_BASE_BACKEND_REGIONS", False):
+            from .geo import reset_city_index
+            from .regions import reset_reference_data
+            for model_name in ('Region', 'State', 'City'):
+                model = self.get_model(model_name)
+                post_save.connect(reset_reference_data, sender=model,
+                                  dispatch_uid='base_backend_%s_reference_data_save' % model_name.lower())
+                post_delete.connect(reset_reference_data, sender=model,
+                                    dispatch_uid='base_backend_%s_reference_data_delete' % model_name.lower())
+            city_model = self.get_model('City')
+            post_save.connect(reset_city_index, sender=city_model, dispatch_uid='base_backend_city_index_save')
+            post_delete.connect(reset_city_index, sender=city_model, dispatch_uid='base_backend_city_index_delete')
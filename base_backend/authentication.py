@@ -0,0 +1,47 @@
+"""
+django rest framework authentication over the base backend access tokens (see the tokens module).
+"""
+
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework.exceptions import AuthenticationFailed
+
+from .tokens import get_access_token, get_token_user
+
+
+class AccessTokenAuthentication(BaseAuthentication):
+    """
+    Authenticates the requests with an "Authorization: Bearer <token>" header.
+    the tokens are resolved from the process and shared caches, their last use is written in batches, the user is
+    loaded on each request with a primary key lookup, so a deactivated or deleted user is rejected right away.
+    """
+    keyword = 'Bearer'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+
+        if len(auth) != 2:
+            raise AuthenticationFailed(_('Invalid token header. The token must be provided without spaces.'))
+
+        try:
+            token = auth[1].decode()
+        except UnicodeError:
+            raise AuthenticationFailed(_('Invalid token header. The token contains invalid characters.'))
+
+        return self.authenticate_credentials(token)
+
+    def authenticate_credentials(self, token):
+        access_token = get_access_token(token)
+        if access_token is None:
+            raise AuthenticationFailed(_('Invalid or expired token.'))
+
+        user = get_token_user(access_token)
+        if user is None:
+            raise AuthenticationFailed(_('User inactive or deleted.'))
+
+        return user, access_token
+
+    def authenticate_header(self, request):
+        return self.keyword
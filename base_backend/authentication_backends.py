@@ -7,17 +7,20 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.backends import ModelBackend
 from django.db.models import Q
 
-UserModel = get_user_model()
+from .utils import phone_lookup
 
 
 class PhoneOrEmailBackend(ModelBackend):
     def authenticate(self, request, username: str = None, password: str = None, **kwargs):
+        # resolved here rather than at import time, so importing the backend doesn't require the app registry.
+        UserModel = get_user_model()
         if username is None:
             username = kwargs.get(UserModel.USERNAME_FIELD)
         if username is None or password is None:
             return
         try:
-            user = UserModel.objects.get(Q(phone__iexact=username) | Q(email__iexact=username))
+            # both lookups are index scans: the phones GIN index and the upper(email) index of the user model.
+            user = UserModel._default_manager.get(phone_lookup(username) | Q(email__iexact=username))
         except UserModel.DoesNotExist:
             # Run the default password hasher once to reduce the timing
             # difference between an existing and a nonexistent user (#20760).
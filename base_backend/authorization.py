@@ -0,0 +1,199 @@
+"""
+Authorization context of the requests: the group names and the permissions of a user are loaded once, with two
+queries, into frozensets shared by the templatetags, the rest framework permissions and the view decorators, every check
+afterwards is a set lookup.
+the context is kept on the user instance, so for the request, and in the shared django cache when AUTHORIZATION_CACHE
+is set. the cached contexts are forgotten when the groups or the permissions of a user change (m2m_changed, see
+apps.py), the changes of a group (renamed, deleted, its permissions) forget all of them.
+the permissions are the ones of django's ModelBackend (the user's own and its groups'), superusers have them all. the
+permission checks (user_has_perm, user_has_perms) only use the context when ModelBackend is the only backend answering
+them, they're left to user.has_perm otherwise so the permissions granted by the other backends still count.
+
+settings:
+AUTHORIZATION_CACHE: the django cache alias the contexts are shared through (default None, each request loads its own).
+AUTHORIZATION_CACHE_TTL: seconds a context is kept in the shared cache (default 300).
+"""
+
+import time
+from collections import namedtuple
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+from . import SETTINGS
+
+key_prefix = 'base_backend:authorization'
+
+# the attribute of the user instance holding its context.
+context_attribute = '_base_backend_authorization'
+
+
+class Authorization(namedtuple('Authorization', ['groups', 'permissions', 'is_active', 'is_superuser'])):
+    """
+    what a user is allowed to do, the permissions in django's <app_label>.<codename> format.
+    """
+    __slots__ = ()
+
+    def has_group(self, name: str) -> bool:
+        return name in self.groups
+
+    def has_any_group(self, names) -> bool:
+        return not self.groups.isdisjoint(names)
+
+    def has_perm(self, perm: str) -> bool:
+        return self.is_active and (self.is_superuser or perm in self.permissions)
+
+    def has_perms(self, perms) -> bool:
+        return self.is_active and (self.is_superuser or self.permissions.issuperset(perms))
+
+    def has_module_perms(self, app_label: str) -> bool:
+        prefix = app_label + '.'
+        return self.is_active and (self.is_superuser or any(perm.startswith(prefix) for perm in self.permissions))
+
+
+ANONYMOUS = Authorization(frozenset(), frozenset(), False, False)
+
+
+def get_cache():
+    alias = SETTINGS.get("AUTHORIZATION_CACHE", None)
+    return caches[alias] if alias is not None else None
+
+
+def get_version(cache) -> int:
+    """
+    the version of the groups, part of the cache keys so a change of a group forgets all the contexts at once.
+    """
+    key = '%s:version' % key_prefix
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+
+def make_cache_key(pk, version) -> str:
+    return '%s:%s:%s' % (key_prefix, version, pk)
+
+
+def load_authorization(user) -> tuple:
+    """
+    :return: the group names and the permissions of the user, read from the database.
+    """
+    from django.contrib.auth.models import Permission
+    # loaded whatever is_active and is_superuser are, they're read from the user instance so the cached context holds.
+    groups = frozenset(user.groups.values_list('name', flat=True))
+    rows = Permission.objects.filter(Q(user=user) | Q(group__user=user)).values_list(
+        'content_type__app_label', 'codename').order_by().distinct()
+    return groups, frozenset('%s.%s' % row for row in rows)
+
+
+def get_authorization(user) -> Authorization:
+    """
+    :return: the authorization context of the user, loaded at most once per user instance.
+    """
+    if user is None or not user.is_authenticated:
+        return ANONYMOUS
+    authorization = user.__dict__.get(context_attribute)
+    if authorization is None:
+        cache = get_cache()
+        if cache is None:
+            groups, permissions = load_authorization(user)
+        else:
+            key = make_cache_key(user.pk, get_version(cache))
+            cached = cache.get(key)
+            if cached is None:
+                cached = load_authorization(user)
+                cache.set(key, cached, SETTINGS.get("AUTHORIZATION_CACHE_TTL", 300))
+            groups, permissions = cached
+        authorization = Authorization(groups, permissions, user.is_active, user.is_superuser)
+        user.__dict__[context_attribute] = authorization
+    return authorization
+
+
+# the methods of ModelBackend answering the permission checks, a backend overriding one of them has its own answer.
+PERMISSION_METHODS = ('has_perm', 'has_module_perms', 'get_all_permissions', 'get_user_permissions',
+                      'get_group_permissions', '_get_permissions', '_get_user_permissions', '_get_group_permissions')
+
+
+@lru_cache(maxsize=None)
+def permissions_from_model_backend() -> bool:
+    """
+    :return: whether the permissions are only answered by ModelBackend, the ModelBackend subclasses keeping its
+    permission methods (PhoneOrEmailBackend for instance) included. cleared when AUTHENTICATION_BACKENDS changes.
+    """
+    for path in settings.AUTHENTICATION_BACKENDS:
+        backend = import_string(path)
+        if not (issubclass(backend, ModelBackend) and
+                all(getattr(backend, name, None) is getattr(ModelBackend, name, None) for name in PERMISSION_METHODS)):
+            return False
+    return True
+
+
+def user_has_perm(user, perm: str) -> bool:
+    """
+    user.has_perm answered from the authorization context when only ModelBackend grants permissions.
+    """
+    if permissions_from_model_backend():
+        return get_authorization(user).has_perm(perm)
+    return user.has_perm(perm)
+
+
+def user_has_perms(user, perms) -> bool:
+    """
+    user.has_perms answered from the authorization context when only ModelBackend grants permissions.
+    """
+    if permissions_from_model_backend():
+        return get_authorization(user).has_perms(perms)
+    return user.has_perms(perms)
+
+
+def forget_users(*pks) -> None:
+    """
+    forgets the cached contexts of the users.
+    """
+    cache = get_cache()
+    if cache is not None and pks:
+        version = get_version(cache)
+        cache.delete_many([make_cache_key(pk, version) for pk in pks])
+
+
+def forget_all() -> None:
+    """
+    forgets all the cached contexts.
+    """
+    cache = get_cache()
+    if cache is not None:
+        try:
+            cache.incr('%s:version' % key_prefix)
+        except ValueError:
+            cache.set('%s:version' % key_prefix, int(time.time() * 1000), None)
+
+
+def user_authorization_changed(sender, instance, action, reverse, pk_set, **kwargs) -> None:
+    """
+    connected to the m2m_changed of User.groups and User.user_permissions in apps.py.
+    """
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        # the user's own instance loads its context again.
+        instance.__dict__.pop(context_attribute, None)
+        forget_users(instance.pk)
+    elif pk_set is not None:
+        forget_users(*pk_set)
+    else:
+        # group.user_set.clear(), the users aren't known.
+        forget_all()
+
+
+def group_changed(sender, **kwargs) -> None:
+    """
+    connected to the changes of the groups and of their permissions in apps.py.
+    """
+    action = kwargs.get('action')
+    if action is None or action.startswith('post_'):
+        forget_all()
@@ -0,0 +1,192 @@
+"""
+Response caching with conditional GETs.
+each cached model has a version counter in the cache (RESPONSE_CACHE alias, default 'default'), bumped when one of its
+rows is saved, deleted or soft deleted. a response is cached under its url, its user and the versions of the models it
+reads, its ETag is derived from the same key: a client sending back the ETag gets a 304 as long as the versions didn't
+move, and the cached body and headers otherwise, without the view running nor the database being queried. the
+counters never expire, a response can't be orphaned by its version being dropped.
+the counters are only kept for the models the cached views read, watched as soon as the views are declared, the
+writes of the other models cost no cache round trip. they're bumped by the signals connected in apps.py once the
+writing transaction commits, a response computed meanwhile from the old rows is cached under the old version.
+the bulk operations sending no signal (QuerySet.update, bulk_create...) must call bump_model_version themselves.
+"""
+
+import hashlib
+import time
+from functools import wraps
+
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+
+from . import SETTINGS
+
+key_prefix = 'base_backend:response'
+
+# the models whose counters are bumped, the cached views register the ones they read.
+watched_models = set()
+
+
+def watch_models(models) -> None:
+    watched_models.update(models)
+
+
+def get_cache():
+    return caches[SETTINGS.get("RESPONSE_CACHE", "default")]
+
+
+def version_key(model) -> str:
+    return '%s:version:%s' % (key_prefix, model._meta.label_lower)
+
+
+def get_model_versions(models) -> tuple:
+    """
+    :return: the versions of the models, read at once. the missing counters (never set or evicted) are started from
+    the current time, so they can't go back to a version a cached response was stored under.
+    """
+    cache = get_cache()
+    keys = [version_key(model) for model in models]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, int(time.time() * 1000), None)
+            versions[key] = cache.get(key)
+    return tuple(versions[key] for key in keys)
+
+
+def bump_model_version(model) -> None:
+    """
+    invalidates the cached responses reading the model.
+    """
+    cache = get_cache()
+    try:
+        cache.incr(version_key(model))
+    except ValueError:
+        cache.set(version_key(model), int(time.time() * 1000), None)
+
+
+def model_changed(sender, using=None, **kwargs) -> None:
+    """
+    bumps the version of the saved, deleted or soft deleted model once the transaction commits, connected to
+    post_save, post_delete and soft_deleted in apps.py. the models no cached view reads are skipped.
+    """
+    if sender in watched_models:
+        transaction.on_commit(lambda: bump_model_version(sender), using=using)
+
+
+def get_response_digest(request, models, per_user: bool = True) -> str:
+    """
+    :return: the digest of the response's url, user, negotiated headers and models versions, the same for the
+    requests expecting the same body. it's both the cache key and the ETag of the response.
+    """
+    user = getattr(request, 'user', None)
+    scope = user.pk if per_user and user is not None and user.is_authenticated else ''
+    parts = [request.get_full_path(), str(scope), request.headers.get('accept', ''),
+             request.headers.get('accept-language', '')]
+    parts.extend(str(version) for version in get_model_versions(models))
+    return hashlib.sha256('\n'.join(parts).encode()).hexdigest()
+
+
+def get_cached_response(request, models, compute, per_user: bool = True, timeout: int = None):
+    """
+    answers the request from the cache, computes and caches the response on a miss.
+    :param models: the models the response reads
+    :param compute: the function returning the response, called on a miss. only the rendered 200 responses are cached
+    :param per_user: whether the users get their own responses, leave it on unless the response is the same for all
+    :param timeout: how long the responses are kept, RESPONSE_CACHE_TIMEOUT (default 300 seconds) by default
+    :return: the response, a 304 if the client's ETag still matches
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return compute()
+    digest = get_response_digest(request, models, per_user)
+    key = '%s:response:%s' % (key_prefix, digest)
+    etag = '"%s"' % digest[:32]
+    if etag in parse_etags(request.headers.get('if-none-match', '')):
+        response = HttpResponseNotModified()
+    else:
+        cache = get_cache()
+        cached = cache.get(key)
+        if cached is not None:
+            content, headers = cached
+            response = HttpResponse(content, headers=headers)
+        else:
+            response = compute()
+            if response.status_code != 200 or response.streaming:
+                return response
+            if hasattr(response, 'render'):
+                response.render()
+            # the headers the view set (Cache-Control, Link...) are restored on the hits, the cookies aren't cached.
+            cache.set(key, (response.content, dict(response.items())),
+                      timeout or SETTINGS.get("RESPONSE_CACHE_TIMEOUT", 300))
+    response['ETag'] = etag
+    patch_vary_headers(response, ('Accept', 'Accept-Language', 'Authorization', 'Cookie') if per_user else
+                       ('Accept', 'Accept-Language'))
+    return response
+
+
+def cache_response(*models, per_user: bool = True, timeout: int = None):
+    """
+    view decorator caching the GET responses, see get_cached_response. it must be applied under the decorators
+    authenticating the request (api_login_required...) so the users don't share their responses.
+        @api_login_required
+        @cache_response(City, State)
+        def cities(request):
+            return DefaultApiResponse(data=...).as_response()
+    """
+
+    watch_models(models)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapped_view(request, *args, **kwargs):
+            return get_cached_response(request, models, lambda: view(request, *args, **kwargs), per_user, timeout)
+
+        return wrapped_view
+
+    return decorator
+
+
+class CachedResponseMixin(object):
+    """
+    caches the list and retrieve responses of a rest framework view, after the authentication and the permissions
+    checks. cache_models are the models the responses read, the view's queryset model by default.
+    """
+    cache_models = None
+    cache_per_user = True
+    cache_timeout = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.cache_models is not None:
+            watch_models(cls.cache_models)
+        elif getattr(cls, 'queryset', None) is not None:
+            watch_models([cls.queryset.model])
+
+    def get_cache_models(self):
+        return self.cache_models if self.cache_models is not None else (self.get_queryset().model,)
+
+    def cached(self, request, compute):
+        models = tuple(self.get_cache_models())
+        # the model of a view overriding get_queryset is only known now.
+        watch_models(models)
+        return get_cached_response(request, models, compute, self.cache_per_user, self.cache_timeout)
+
+    def list(self, request, *args, **kwargs):
+        return self.cached(request, lambda: self.render_for_cache(super(CachedResponseMixin, self).list(
+            request, *args, **kwargs)))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached(request, lambda: self.render_for_cache(super(CachedResponseMixin, self).retrieve(
+            request, *args, **kwargs)))
+
+    def render_for_cache(self, response):
+        """
+        renders the rest framework response now, its body is cached before the view finalizes it.
+        """
+        if response.status_code == 200 and not getattr(response, 'is_rendered', True):
+            response.accepted_renderer = self.request.accepted_renderer
+            response.accepted_media_type = self.request.accepted_media_type
+            response.renderer_context = self.get_renderer_context()
+        return response
@@ -0,0 +1,80 @@
+"""
+System checks validating the BASE_BACKEND settings at startup, instead of failing on the first request using them.
+"""
+
+from django.core.checks import Error, Warning
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+from . import SETTINGS, get_password_reset_table, get_otp_verification_table, get_access_token_table
+
+KNOWN_SETTINGS = {
+    "ACCESS_TOKEN_CACHE", "ACCESS_TOKEN_CACHE_TTL", "ACCESS_TOKEN_LAST_USED_FLUSH_INTERVAL", "ACCESS_TOKEN_LIFETIME",
+    "ACCESS_TOKEN_LRU_SIZE", "ACCESS_TOKEN_LRU_TTL", "ACCESS_TOKEN_TABLE", "APP_NAME", "AUTHORIZATION_CACHE",
+    "AUTHORIZATION_CACHE_TTL", "GENDERS",
+    "NOTIFICATIONS_MAX_WORKERS", "OTP_CACHE", "OTP_ISSUE_MAX_ATTEMPTS", "OTP_MAX_ATTEMPTS", "OTP_STORE", "OTP_TTL",
+    "OUTBOX_CONCURRENCY", "OUTBOX_LEASE", "OUTBOX_MAX_ATTEMPTS", "OUTBOX_MAX_RETRY_DELAY", "OUTBOX_RETRY_DELAY",
+    "PASSWORD_RESET_TABLE", "PASSWORD_RESET_TTL", "PHONE_VALIDATOR", "PHONE_VERIFICATION_OTP_TABLE", "PURGE_BATCH_SIZE",
+    "REFERENCE_DATA_CACHE", "REFERENCE_DATA_CHECK_INTERVAL",
+    "REGIONS_TRIGRAM_INDEXES", "REGISTER_BASE_BACKEND_MODELS", "REQUIRED_FIELDS", "RESPONSE_CACHE",
+    "RESPONSE_CACHE_TIMEOUT", "SEND_SMS_FUNC", "SMS_BACKEND", "SMS_HTTP_BATCH_SIZE", "SMS_HTTP_HEADERS",
+    "SMS_HTTP_POOL_SIZE", "SMS_HTTP_TIMEOUT", "SMS_HTTP_URL", "SMS_RATE_LIMIT", "SYNC_MAX_PAGE_SIZE", "SYNC_PAGE_SIZE",
+    "SYNC_SAFETY_MARGIN", "USERNAME_FIELD", "USER_TYPES", "USE_BASE_BACKEND_ACCESS_TOKEN_TABLE",
+    "USE_BASE_BACKEND_OTP_TABLE", "USE_BASE_BACKEND_OUTBOX_TABLE", "USE_BASE_BACKEND_PROFILE_MODEL",
+    "USE_BASE_BACKEND_REGIONS", "USE_BASE_BACKEND_RESET_PASSWORD_TABLE", "USE_BASE_BACKEND_USER_MODEL",
+}
+
+# the settings expressed as positive numbers, None is allowed for the ones that can be disabled.
+POSITIVE_SETTINGS = {
+    "ACCESS_TOKEN_CACHE_TTL": False, "ACCESS_TOKEN_LAST_USED_FLUSH_INTERVAL": False, "ACCESS_TOKEN_LIFETIME": True,
+    "ACCESS_TOKEN_LRU_SIZE": False, "ACCESS_TOKEN_LRU_TTL": False, "AUTHORIZATION_CACHE_TTL": False,
+    "NOTIFICATIONS_MAX_WORKERS": False,
+    "OTP_ISSUE_MAX_ATTEMPTS": False, "OTP_MAX_ATTEMPTS": False, "OTP_TTL": True, "OUTBOX_CONCURRENCY": False,
+    "OUTBOX_LEASE": False, "OUTBOX_MAX_ATTEMPTS": False, "OUTBOX_MAX_RETRY_DELAY": False, "OUTBOX_RETRY_DELAY": False,
+    "PASSWORD_RESET_TTL": True, "PURGE_BATCH_SIZE": False, "REFERENCE_DATA_CHECK_INTERVAL": False,
+    "RESPONSE_CACHE_TIMEOUT": False,
+    "SMS_HTTP_BATCH_SIZE": False, "SMS_HTTP_POOL_SIZE": False, "SMS_HTTP_TIMEOUT": False, "SMS_RATE_LIMIT": True,
+    "SYNC_MAX_PAGE_SIZE": False, "SYNC_PAGE_SIZE": False,
+}
+
+# the settings holding dotted paths.
+IMPORTABLE_SETTINGS = ("OTP_STORE", "SMS_BACKEND")
+
+# the tables resolvers, checked when one of their settings is provided.
+TABLES = (
+    (("USE_BASE_BACKEND_RESET_PASSWORD_TABLE", "PASSWORD_RESET_TABLE"), get_password_reset_table),
+    (("USE_BASE_BACKEND_OTP_TABLE", "PHONE_VERIFICATION_OTP_TABLE"), get_otp_verification_table),
+    (("USE_BASE_BACKEND_ACCESS_TOKEN_TABLE", "ACCESS_TOKEN_TABLE"), get_access_token_table),
+)
+
+
+def check_settings(app_configs=None, **kwargs):
+    errors = []
+
+    for name in sorted(set(SETTINGS) - KNOWN_SETTINGS):
+        errors.append(Warning("BASE_BACKEND contains the unknown setting '%s'." % name,
+                              hint="check the setting's name for typos.", id='base_backend.W001'))
+
+    for name, nullable in POSITIVE_SETTINGS.items():
+        if name not in SETTINGS or (nullable and SETTINGS[name] is None):
+            continue
+        value = SETTINGS[name]
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+            errors.append(Error("BASE_BACKEND['%s'] must be a positive number%s."
+                                % (name, " or None" if nullable else ""), id='base_backend.E001'))
+
+    for name in IMPORTABLE_SETTINGS:
+        if name in SETTINGS:
+            try:
+                import_string(SETTINGS[name])
+            except ImportError as e:
+                errors.append(Error("BASE_BACKEND['%s'] couldn't be imported: %s" % (name, e), id='base_backend.E002'))
+
+    for names, resolver in TABLES:
+        if any(SETTINGS.get(name) for name in names):
+            try:
+                resolver()
+            except ImproperlyConfigured as e:
+                errors.append(Error(str(e), id='base_backend.E003'))
+
+    return errors
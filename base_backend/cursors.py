@@ -0,0 +1,56 @@
+"""
+Opaque cursors of the keyset pagination, shared by the incremental sync (see sync.py) and the KeysetPagination (see
+pagination.py).
+a cursor holds the position of the last returned row, a (timestamp, pk) pair matching the (timestamp, pk) ordering of
+the rows, the next page is then read from the index where the previous one stopped instead of skipping OFFSET rows.
+"""
+
+import base64
+import binascii
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(timestamp, pk) -> str:
+    """
+    :return: the url safe cursor of the position
+    """
+    # isoformat keeps the microseconds, DjangoJSONEncoder would round them to milliseconds and repeat rows.
+    payload = json.dumps([timestamp.isoformat(), pk], cls=DjangoJSONEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """
+    :return: the (timestamp, pk) position of the cursor
+    :raise InvalidCursor: if the cursor wasn't produced by encode_cursor
+    """
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        timestamp, pk = json.loads(payload)
+        timestamp = parse_datetime(timestamp)
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        raise InvalidCursor("invalid cursor.")
+    if timestamp is None:
+        raise InvalidCursor("invalid cursor.")
+    return timestamp, pk
+
+
+def keyset_filter(field: str, timestamp, pk, descending: bool = False) -> Q:
+    """
+    builds the filter of the rows following the position in the (field, pk) ordering.
+    :param descending: whether the rows are ordered from the newest
+    :return: Q
+    """
+    lookup = 'lt' if descending else 'gt'
+    # the redundant bound on the field alone is the range the index scan starts from, the planner can't derive it
+    # from the OR.
+    return Q(**{'%s__%se' % (field, lookup): timestamp}) & \
+        (Q(**{'%s__%s' % (field, lookup): timestamp}) | Q(**{'pk__%s' % lookup: pk}))
@@ -2,7 +2,9 @@ from django.contrib.auth import REDIRECT_FIELD_NAME
 from django.contrib.auth.decorators import user_passes_test
 from functools import wraps
 from django.core.exceptions import PermissionDenied
-from django.contrib.auth import get_user_model
+
+from .authorization import get_authorization, user_has_perms
+from .tokens import resolve_access_token
 
 
 def super_user_required(view_func=None, redirect_field_name=REDIRECT_FIELD_NAME, login_url='admin:login'):
@@ -18,18 +20,56 @@ def super_user_required(view_func=None, redirect_field_name=REDIRECT_FIELD_NAME,
     return actual_decorator
 
 
-def api_login_required_factory():
+def group_required(*group_names, raise_exception=False, redirect_field_name=REDIRECT_FIELD_NAME, login_url=None):
+    """
+    view's permission decorator, allows only the members of one of the groups. the groups are loaded once per request
+    (see authorization.py), raise_exception answers 403 instead of redirecting to the login page.
+    """
+
+    def check_groups(user):
+        if get_authorization(user).has_any_group(group_names):
+            return True
+        if raise_exception:
+            raise PermissionDenied
+        return False
+
+    return user_passes_test(check_groups, login_url=login_url, redirect_field_name=redirect_field_name)
+
+
+def perms_required(*perms, raise_exception=False, redirect_field_name=REDIRECT_FIELD_NAME, login_url=None):
+    """
+    like django's permission_required, the permissions are checked against the request's authorization context (see
+    authorization.py).
     """
 
+    def check_perms(user):
+        if user_has_perms(user, perms):
+            return True
+        if raise_exception:
+            raise PermissionDenied
+        return False
+
+    return user_passes_test(check_perms, login_url=login_url, redirect_field_name=redirect_field_name)
+
+
+def api_login_required_factory():
+    """
+    view's permission decorator, allows only the requests carrying a valid access token in the Authorization header
+    (either the raw token or prefixed with a keyword like "Bearer"), the token's user is set as request.user.
+    the tokens are resolved through the tokens module caches, the user is loaded with a primary key lookup.
     """
 
     def decorator(function):
         @wraps(function)
         def wrapped_function(*args, **kwargs):
             request = args[0]
-            if request and request.headers.get('authorization') is not None:
-                user = get_user_model().objects.filter(access_token=request.headers.get('authorization'))
-                if user.exists():
+            authorization = request.headers.get('authorization', '').split() if request else None
+            # either the token alone or a keyword and the token, a lone keyword carries no token.
+            if authorization and (len(authorization) == 2 or
+                                  len(authorization) == 1 and authorization[0].lower() != 'bearer'):
+                user = resolve_access_token(authorization[-1])
+                if user is not None:
+                    request.user = user
                     return function(*args, **kwargs)
             raise PermissionDenied
 
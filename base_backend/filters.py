@@ -0,0 +1,29 @@
+"""
+Filter backends of the django rest framework scoping the querysets to the rows of the request's user, the list
+counterparts of the owner permissions (see permissions.py): the ownership is a single predicate on the owner's
+foreign key column, run by the database, instead of an object permission checked row by row.
+"""
+
+from rest_framework.filters import BaseFilterBackend
+
+from .ownership import filter_owned
+
+
+class IsOwnerFilterBackend(BaseFilterBackend):
+    """
+    keeps only the rows owned by the request's user, none for the anonymous users. pairs with permissions.IsOwner.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        return filter_owned(queryset, request.user)
+
+
+class IsAdminOrIsOwnerFilterBackend(IsOwnerFilterBackend):
+    """
+    like IsOwnerFilterBackend, the staff gets all the rows. pairs with permissions.IsAdminOrIsOwner.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        if request.user and request.user.is_staff:
+            return queryset
+        return super(IsAdminOrIsOwnerFilterBackend, self).filter_queryset(request, queryset, view)
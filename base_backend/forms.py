@@ -3,6 +3,28 @@ from django.contrib.auth.models import Group
 from django.contrib.postgres.forms import SimpleArrayField, SplitArrayWidget
 
 from .models import User, Profile, City, _
+from .regions import city_choices
+
+
+class CityChoiceField(forms.TypedChoiceField):
+    """
+    choice field of the cities, the choices come from the cached reference data (see regions.py) so rendering it
+    doesn't query the database, only the submitted city is fetched.
+    """
+
+    def __init__(self, empty_label=_('Select a city'), state_id=None, **kwargs):
+        kwargs.setdefault('choices', lambda: [('', empty_label)] + city_choices(state_id))
+        super(CityChoiceField, self).__init__(coerce=int, empty_value=None, **kwargs)
+
+    def clean(self, value):
+        pk = super(CityChoiceField, self).clean(value)
+        if pk is None:
+            return None
+        city = City.objects.filter(pk=pk).first()
+        if city is None:
+            raise forms.ValidationError(self.error_messages['invalid_choice'], code='invalid_choice',
+                                        params={'value': value})
+        return city
 
 
 class LoginForm(forms.Form):
@@ -119,7 +141,7 @@ class ProfileForm(forms.ModelForm):
             }
         )
     )
-    city = forms.ModelChoiceField(City.objects.all(), empty_label=_('Select a city'), required=False)
+    city = CityChoiceField(empty_label=_('Select a city'), required=False)
     birth_date = forms.DateField(
         widget=forms.DateInput(
             attrs={
@@ -0,0 +1,183 @@
+"""
+In-process spatial index of the cities, answering "nearest city/state to this point" and "cities within a radius"
+without PostGIS.
+the cities coordinates are projected on the unit sphere and kept in a k-d tree over flat arrays, the straight line
+(chord) distance between two projected points grows with their great-circle distance, so the tree searches with
+cheap euclidean distances and only the results are converted to kilometers.
+the index is built on first use from the cached reference data (see regions.py), once per process, and again when the
+reference data is reloaded.
+"""
+
+import math
+import threading
+from array import array
+from collections import namedtuple
+
+from .regions import get_reference_data
+
+EARTH_RADIUS_KM = 6371.0088
+# the number of points below which a tree node is scanned linearly.
+LEAF_SIZE = 8
+
+GeoMatch = namedtuple('GeoMatch', ['city_id', 'state_id', 'distance'])
+
+
+def to_unit_vector(latitude: float, longitude: float) -> tuple:
+    latitude, longitude = math.radians(latitude), math.radians(longitude)
+    return math.cos(latitude) * math.cos(longitude), math.cos(latitude) * math.sin(longitude), math.sin(latitude)
+
+
+def chord_to_km(squared_chord: float) -> float:
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(squared_chord) / 2))
+
+
+def km_to_chord(distance: float) -> float:
+    return 2 * math.sin(min(math.pi, distance / EARTH_RADIUS_KM) / 2)
+
+
+class GeoIndex(object):
+    """
+    k-d tree over the points, stored as an implicit balanced tree: each node is a slice of the arrays whose middle
+    element splits the rest on the node's axis.
+    """
+
+    def __init__(self, points):
+        """
+        :param points: an iterable of (city_id, state_id, latitude, longitude)
+        """
+        points = [(city_id, state_id, to_unit_vector(latitude, longitude))
+                  for city_id, state_id, latitude, longitude in points]
+        self.build(points, 0, len(points), 0)
+        self.city_ids = array('q', (point[0] for point in points))
+        self.state_ids = array('q', (point[1] or 0 for point in points))
+        self.axes = tuple(array('d', (point[2][axis] for point in points)) for axis in range(3))
+
+    def __len__(self):
+        return len(self.city_ids)
+
+    def build(self, points, start, end, depth):
+        if end - start <= LEAF_SIZE:
+            return
+        axis = depth % 3
+        points[start:end] = sorted(points[start:end], key=lambda point: point[2][axis])
+        middle = (start + end) // 2
+        self.build(points, start, middle, depth + 1)
+        self.build(points, middle + 1, end, depth + 1)
+
+    def squared_chord(self, i, x, y, z):
+        dx, dy, dz = self.axes[0][i] - x, self.axes[1][i] - y, self.axes[2][i] - z
+        return dx * dx + dy * dy + dz * dz
+
+    def match(self, i, squared_chord):
+        return GeoMatch(self.city_ids[i], self.state_ids[i] or None, chord_to_km(squared_chord))
+
+    def nearest(self, latitude: float, longitude: float):
+        """
+        :return: the GeoMatch of the nearest city, None if the index is empty.
+        """
+        if not len(self):
+            return None
+        point = to_unit_vector(latitude, longitude)
+        best = [math.inf, -1]
+
+        def search(start, end, depth):
+            if end - start <= LEAF_SIZE:
+                for i in range(start, end):
+                    distance = self.squared_chord(i, *point)
+                    if distance < best[0]:
+                        best[0], best[1] = distance, i
+                return
+            middle = (start + end) // 2
+            distance = self.squared_chord(middle, *point)
+            if distance < best[0]:
+                best[0], best[1] = distance, middle
+            difference = point[depth % 3] - self.axes[depth % 3][middle]
+            near, far = ((start, middle), (middle + 1, end)) if difference < 0 else ((middle + 1, end), (start, middle))
+            search(near[0], near[1], depth + 1)
+            # the other side can only hold a nearer point if the splitting plane is nearer than the best one.
+            if difference * difference < best[0]:
+                search(far[0], far[1], depth + 1)
+
+        search(0, len(self), 0)
+        return self.match(best[1], best[0])
+
+    def within(self, latitude: float, longitude: float, radius: float) -> list:
+        """
+        :param radius: the radius in kilometers
+        :return: the GeoMatch of the cities within the radius, nearest first.
+        """
+        point = to_unit_vector(latitude, longitude)
+        limit = km_to_chord(radius) ** 2
+        matches = []
+
+        def search(start, end, depth):
+            if end - start <= LEAF_SIZE:
+                for i in range(start, end):
+                    distance = self.squared_chord(i, *point)
+                    if distance <= limit:
+                        matches.append((distance, i))
+                return
+            middle = (start + end) // 2
+            distance = self.squared_chord(middle, *point)
+            if distance <= limit:
+                matches.append((distance, middle))
+            difference = point[depth % 3] - self.axes[depth % 3][middle]
+            if difference < 0 or difference * difference <= limit:
+                search(start, middle, depth + 1)
+            if difference >= 0 or difference * difference <= limit:
+                search(middle + 1, end, depth + 1)
+
+        search(0, len(self), 0)
+        return [self.match(i, distance) for distance, i in sorted(matches)]
+
+
+# (the reference data the index was built from, the index).
+_city_index = None
+_city_index_lock = threading.Lock()
+
+
+def get_city_index() -> GeoIndex:
+    """
+    returns the index of the cities having coordinates, it's built on first use and again when the reference data is
+    reloaded.
+    """
+    global _city_index
+    data = get_reference_data()
+    if _city_index is None or _city_index[0] is not data:
+        with _city_index_lock:
+            if _city_index is None or _city_index[0] is not data:
+                _city_index = (data, GeoIndex((city.id, city.state_id, city.latitude, city.longitude)
+                                              for city in data.cities.values()
+                                              if city.latitude is not None and city.longitude is not None))
+    return _city_index[1]
+
+
+def reset_city_index(**kwargs) -> None:
+    """
+    drops the index, the next lookup rebuilds it. connected to the City save and delete signals.
+    """
+    global _city_index
+    _city_index = None
+
+
+def nearest_city(latitude: float, longitude: float):
+    """
+    :return: the GeoMatch (city_id, state_id, distance in km) of the city nearest to the point, None without cities.
+    """
+    return get_city_index().nearest(latitude, longitude)
+
+
+def nearest_state(latitude: float, longitude: float):
+    """
+    :return: the id of the state of the city nearest to the point, None without cities.
+    """
+    match = nearest_city(latitude, longitude)
+    return match.state_id if match else None
+
+
+def cities_within(latitude: float, longitude: float, radius: float) -> list:
+    """
+    :param radius: the radius in kilometers
+    :return: the GeoMatch of the cities within the radius, nearest first.
+    """
+    return get_city_index().within(latitude, longitude, radius)
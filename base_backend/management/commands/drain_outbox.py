@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from base_backend import SETTINGS
+from base_backend.outbox import process
+
+
+class Command(BaseCommand):
+    help = "Delivers the sms, emails and notifications queued in the outbox table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=SETTINGS.get("OUTBOX_CONCURRENCY", 4),
+                            help="number of messages delivered at the same time.")
+        parser.add_argument('--batch-size', type=int, default=100, help="number of messages claimed at once.")
+        parser.add_argument('--idle-sleep', type=float, default=1,
+                            help="seconds to wait before polling again when the outbox is empty.")
+        parser.add_argument('--once', action='store_true', help="stop once the outbox is drained.")
+
+    def handle(self, *args, **options):
+        total = 0
+        try:
+            while True:
+                processed = process(options['batch_size'], options['concurrency'])
+                total += processed
+                if not processed:
+                    if options['once']:
+                        break
+                    time.sleep(options['idle_sleep'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS("{0} outbox messages processed.".format(total)))
@@ -0,0 +1,121 @@
+import os
+import time
+from itertools import islice
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connections, transaction, DEFAULT_DB_ALIAS
+
+from base_backend import SETTINGS
+from base_backend.caching import bump_model_version
+from base_backend.geo import reset_city_index
+from base_backend.regions import reset_reference_data
+from base_backend.utils import iter_json
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'fixtures')
+
+
+class Command(BaseCommand):
+    help = "Loads the algerian states (wilayas) and cities (communes) shipped in base_backend/fixtures into the " \
+           "Region, State and City tables, existing rows are updated."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="number of rows written per statement.")
+        parser.add_argument('--region-name', default='Algeria',
+                            help="the fixtures don't group the states in regions, they are all attached to this one.")
+
+    def handle(self, *args, **options):
+        if not SETTINGS.get("USE_BASE_BACKEND_REGIONS", False):
+            raise CommandError("the regions tables are not installed, set USE_BASE_BACKEND_REGIONS in the settings.")
+
+        started = time.perf_counter()
+        batch_size = options['batch_size']
+        region_model = apps.get_model('base_backend', 'Region')
+        state_model = apps.get_model('base_backend', 'State')
+        city_model = apps.get_model('base_backend', 'City')
+
+        with transaction.atomic():
+            self.upsert(region_model, [region_model(pk=1, name=options['region_name'], name_ar='الجزائر',
+                                                    name_fr='Algérie')],
+                        ['name', 'name_ar', 'name_fr', 'updated_at'], batch_size)
+            states = self.upsert(state_model, self.iter_states(state_model),
+                                 ['name', 'name_ar', 'name_fr', 'matricule', 'code_postal', 'region', 'updated_at'],
+                                 batch_size)
+            cities = self.upsert(city_model, self.iter_cities(city_model),
+                                 ['name', 'name_ar', 'name_en', 'code_postal', 'state', 'latitude', 'longitude',
+                                  'updated_at'],
+                                 batch_size)
+            # the rows are inserted with their ids, the sequences must skip them.
+            connection = connections[DEFAULT_DB_ALIAS]
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(no_style(), [region_model, state_model, city_model]):
+                    cursor.execute(sql)
+        # bulk_create doesn't send the save signals, the cached reference data and responses are dropped here.
+        reset_reference_data()
+        reset_city_index()
+        for model in (region_model, state_model, city_model):
+            bump_model_version(model)
+
+        self.stdout.write(self.style.SUCCESS("{0} states and {1} cities loaded in {2:.3f}s.".format(
+            states, cities, time.perf_counter() - started)))
+
+    @staticmethod
+    def upsert(model, objects, update_fields, batch_size) -> int:
+        """
+        inserts the objects batch by batch, the rows already present are updated.
+        :return: the number of written rows
+        """
+        objects = iter(objects)
+        total = 0
+        while True:
+            batch = list(islice(objects, batch_size))
+            if not batch:
+                return total
+            model.objects.bulk_create(batch, update_conflicts=True, unique_fields=['id'], update_fields=update_fields)
+            total += len(batch)
+
+    @staticmethod
+    def open_fixture(name):
+        return open(os.path.join(FIXTURES, name), encoding='utf-8')
+
+    def iter_states(self, state_model):
+        # the arabic names are only in the second wilayas file, keyed by matricule.
+        with self.open_fixture('wilaya (1).json') as file:
+            arabic_names = {int(matricule): wilaya['NAME_AR'] for matricule, wilaya in iter_json(file)}
+        with self.open_fixture('wilaya.json') as file:
+            for wilaya in iter_json(file):
+                fields = wilaya['fields']
+                matricule = fields['matricule']
+                yield state_model(pk=wilaya['pk'], name=fields['name'], name_ar=arabic_names.get(matricule, ''),
+                                  name_fr=fields['name'], matricule=matricule,
+                                  # the algerian postal codes of a wilaya are matricule * 1000 + the office number.
+                                  code_postal=fields['code_postal'] or matricule * 1000, region_id=1)
+
+    def iter_cities(self, city_model):
+        # a few communes share the same id in the file, the cities are matched on their wilaya and commune code (the
+        # postal code, the matricule * 1000 + the commune number) instead. the rows already loaded keep their ids, so
+        # the foreign keys pointing to them (Profile.city...) are left valid, the new ones take their position in the
+        # file as id, or the ids following the last one when it's taken.
+        loaded = {(state_id, code): pk for pk, state_id, code in
+                  city_model._base_manager.values_list('pk', 'state_id', 'code_postal')}
+        taken = set(loaded.values())
+        last_id = max(taken, default=0)
+        moved = []
+        with self.open_fixture('communes.json') as file:
+            for position, commune in enumerate(iter_json(file), 1):
+                state_id, code_postal = int(commune['wilaya_id']), int(commune['code_postal'])
+                city = city_model(pk=loaded.get((state_id, code_postal)), name=commune['nom']['fr'],
+                                  name_ar=commune['nom']['ar'].strip('\u200e'), name_en=commune['nom']['fr'],
+                                  code_postal=code_postal, state_id=state_id, latitude=float(commune['gps']['lat']),
+                                  longitude=float(commune['gps']['lng']))
+                last_id = max(last_id, position)
+                if city.pk is None:
+                    if position in taken:
+                        moved.append(city)
+                        continue
+                    city.pk = position
+                yield city
+        for last_id, city in enumerate(moved, last_id + 1):
+            city.pk = last_id
+            yield city
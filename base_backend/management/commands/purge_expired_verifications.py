@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from base_backend import SETTINGS, get_otp_verification_table, get_password_reset_table, get_otp_ttl, \
+    get_password_reset_ttl
+from base_backend.utils import not_expired
+
+
+class Command(BaseCommand):
+    help = "Deletes the expired OTPs and password reset requests, in small batches so the tables are never locked " \
+           "for long."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=SETTINGS.get("PURGE_BATCH_SIZE", 1000),
+                            help="number of rows deleted per statement.")
+        parser.add_argument('--sleep', type=float, default=0,
+                            help="seconds to wait between two batches, to leave room for the live traffic.")
+
+    def handle(self, *args, **options):
+        tables = []
+        if SETTINGS.get("USE_BASE_BACKEND_OTP_TABLE", False) or SETTINGS.get("PHONE_VERIFICATION_OTP_TABLE", None):
+            tables.append((get_otp_verification_table(), get_otp_ttl()))
+        if SETTINGS.get("USE_BASE_BACKEND_RESET_PASSWORD_TABLE", False) or SETTINGS.get("PASSWORD_RESET_TABLE", None):
+            tables.append((get_password_reset_table(), get_password_reset_ttl()))
+
+        for table, ttl in tables:
+            if ttl is None:
+                self.stdout.write("{0}: no ttl configured, skipped.".format(table._meta.label))
+                continue
+            deleted = self.purge(table, ttl, options['batch_size'], options['sleep'])
+            self.stdout.write(self.style.SUCCESS("{0}: {1} expired rows deleted.".format(table._meta.label, deleted)))
+
+    @staticmethod
+    def purge(table, ttl, batch_size, sleep) -> int:
+        """
+        deletes the expired rows of the table batch by batch, each batch is its own short statement.
+        :return: the number of deleted rows
+        """
+        expired = table.objects.exclude(not_expired(ttl)).order_by('pk').values_list('pk', flat=True)
+        total = 0
+        while True:
+            batch = list(expired[:batch_size])
+            if not batch:
+                return total
+            total += table.objects.filter(pk__in=batch).delete()[0]
+            if sleep:
+                time.sleep(sleep)
@@ -0,0 +1,179 @@
+"""
+The managers of the base models: BaseModel's manager answers the incremental sync queries, DeletableModel's soft
+delete managers extend it, the user's soft delete managers (the user has no updated_at) don't.
+the default manager (objects) only returns the visible rows, all_objects returns all of them. deleting through either
+of them, or deleting an instance, hides the rows (see SoftDeleteQuerySetMixin.soft_delete), hard_delete removes them.
+"""
+
+from collections import namedtuple
+from datetime import timedelta
+
+from django.contrib.auth.models import UserManager
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models, transaction
+from django.utils import timezone
+
+from . import SETTINGS
+from .cursors import decode_cursor, encode_cursor, keyset_filter
+from .ownership import filter_owned
+from .signals import soft_deleted
+from .utils import update_returning
+
+Changes = namedtuple('Changes', ['rows', 'cursor', 'has_more'])
+
+
+class BaseQuerySet(models.QuerySet):
+
+    def changes_since(self, cursor: str = None, limit: int = 100, field: str = 'updated_at') -> Changes:
+        """
+        returns the rows changed after the cursor, ordered by (updated_at, pk) and read through the updated_at index.
+        the rows changed within the last SYNC_SAFETY_MARGIN seconds (default 0) are held back, a transaction
+        committing late with an older timestamp would otherwise be skipped by the clients that moved past it.
+        :param cursor: the cursor of the previous changes, None for the first sync
+        :param limit: the maximum number of rows
+        :param field: the timestamp field of the changes
+        :return: Changes(rows, cursor, has_more), cursor being the one to send next time
+        :raise InvalidCursor: if the cursor is malformed
+        """
+        queryset = self
+        if cursor:
+            queryset = queryset.filter(keyset_filter(field, *decode_cursor(cursor)))
+        margin = SETTINGS.get("SYNC_SAFETY_MARGIN", 0)
+        if margin:
+            queryset = queryset.filter(**{'%s__lte' % field: timezone.now() - timedelta(seconds=margin)})
+        rows = list(queryset.order_by(field, 'pk')[:limit + 1])
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if rows:
+            cursor = encode_cursor(getattr(rows[-1], field), rows[-1].pk)
+        return Changes(rows, cursor, has_more)
+
+    def owned_by(self, user):
+        """
+        returns the rows owned by the user, the model names its owner field in OWNER_FIELD (see OwnedModel).
+        the owner's foreign key column is compared, no join is needed.
+        :param user: the owner, the anonymous users own nothing
+        """
+        return filter_owned(self, user)
+
+
+class BaseManager(models.Manager.from_queryset(BaseQuerySet)):
+    """
+    the default manager of the base models.
+    """
+
+
+class SoftDeleteQuerySetMixin(object):
+    """
+    the soft delete methods of the querysets of the models having a `visible` field.
+    """
+
+    def visible(self):
+        return self.filter(visible=True)
+
+    def hidden(self):
+        return self.filter(visible=False)
+
+    def soft_delete(self) -> int:
+        """
+        hides the visible rows of the queryset with a single UPDATE instead of saving them one by one, the updated_at
+        timestamps are refreshed and the users are deactivated too. the related rows named in the model's
+        soft_delete_cascade are soft deleted first, in the same transaction.
+        no save signal is sent, soft_deleted is sent once with the primary keys of the hidden rows.
+        :return: the number of hidden rows
+        """
+        values = {'visible': False}
+        fields = {field.name for field in self.model._meta.concrete_fields}
+        if 'updated_at' in fields:
+            values['updated_at'] = timezone.now()
+        if 'is_active' in fields:
+            values['is_active'] = False
+        queryset = self.filter(visible=True)
+        with transaction.atomic(using=self.db, savepoint=False):
+            soft_delete_related(queryset)
+            pks = update_returning(queryset, values, self.model._meta.pk.name)
+            if pks is None:
+                pks = list(queryset.select_for_update().values_list('pk', flat=True))
+                self.model._base_manager.using(self.db).filter(pk__in=pks).update(**values)
+            if pks:
+                soft_deleted.send(sender=self.model, pks=pks, using=self.db)
+        return len(pks)
+
+    def delete(self):
+        """
+        soft deletes the rows, see soft_delete, use hard_delete to delete them for real.
+        :return: the number of hidden rows and a dict of it per model label, like QuerySet.delete
+        """
+        count = self.soft_delete()
+        return count, {self.model._meta.label: count}
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def hard_delete(self):
+        """
+        deletes the rows from the database, the hidden ones included.
+        """
+        return super().delete()
+
+    hard_delete.alters_data = True
+    hard_delete.queryset_only = True
+
+
+class SoftDeleteQuerySet(SoftDeleteQuerySetMixin, BaseQuerySet):
+    """
+    the queryset of DeletableModel, soft deletable and synced.
+    """
+
+
+class SoftDeleteUserQuerySet(SoftDeleteQuerySetMixin, models.QuerySet):
+    """
+    the queryset of the base backend user, soft deletable. the user has no updated_at, it's not synced.
+    """
+
+
+def soft_delete_related(queryset) -> None:
+    """
+    soft deletes the rows related to the queryset through the reverse relations named in the model's
+    soft_delete_cascade, the relations whose model isn't installed are skipped.
+    """
+    for name in getattr(queryset.model, 'soft_delete_cascade', ()):
+        try:
+            relation = queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            continue
+        related_model = relation.related_model
+        manager = getattr(related_model, 'all_objects', related_model._base_manager)
+        manager.filter(**{'%s__in' % relation.field.name: queryset.values('pk')}).soft_delete()
+
+
+class SoftDeleteManager(models.Manager.from_queryset(SoftDeleteQuerySet)):
+    """
+    the default manager of the soft deletable models, the hidden rows are left out.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().filter(visible=True)
+
+
+class AllObjectsManager(models.Manager.from_queryset(SoftDeleteQuerySet)):
+    """
+    the escape hatch of the soft deletable models, the hidden rows are included.
+    """
+
+
+class SoftDeleteUserManager(UserManager.from_queryset(SoftDeleteUserQuerySet)):
+    """
+    the default manager of the base backend user, the hidden (deleted) users are left out, logging in included.
+    """
+    # the data migrations must see all the users.
+    use_in_migrations = False
+
+    def get_queryset(self):
+        return super().get_queryset().filter(visible=True)
+
+
+class AllUsersManager(UserManager.from_queryset(SoftDeleteUserQuerySet)):
+    """
+    the escape hatch of the base backend user, the hidden users are included.
+    """
@@ -7,29 +7,60 @@ requires the firebase credentials to be initialized first.
 you can set a global title, for the notifications sent to your apps, that would be used as a default if you don't
 provide a title entry in the message argument. not providing any of them would throw an Exception.
 
-pro-tip: if you are looking for a way to notify all the users of your app at once, since firebase doesn't offer this option
-directly, you can work around that by creating a topic named 'all' or whatever you like, subscribe your users to that
-topic on app launch and then notify them using that! that would work so much better than iterating over all
+pro-tip: if you are looking for a way to notify all the users of your app at once, since firebase doesn't offer this
+option directly, you can work around that by creating a topic named 'all' or whatever you like, subscribe your users to
+that topic on app launch and then notify them using that! that would work so much better than iterating over all
 the available tokens and sending them one by one.
+when you do need to reach a set of users, notify_users sends to their tokens in multicast batches of 500 from a pool
+of threads (NOTIFICATIONS_MAX_WORKERS, default 8), and drops the tokens firebase reports as unregistered.
 
 ENJOY!
 """
 
-from . import SETTINGS
-from firebase_admin import messaging
+from . import SETTINGS, get_outbox_table
 import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from itertools import islice
 
+from django.contrib.auth import get_user_model
 from django.core.exceptions import ImproperlyConfigured
+from django.db.models import QuerySet
+
+from .outbox import outbox_enabled, enqueue
 
 logger = logging.getLogger(__name__)
 
 
+def get_firebase_messaging():
+    """
+    firebase_admin is heavy to import, it's only loaded once a notification is actually sent.
+    """
+    from firebase_admin import messaging
+    return messaging
+
+
+# the maximum number of tokens firebase accepts in a multicast message.
+MULTICAST_BATCH_SIZE = 500
+
+
+def _with_title(message: dict) -> dict:
+    """
+    fills the message title with the APP_NAME setting when it's not provided.
+    """
+    if message.get('title') is None:
+        if SETTINGS.get("APP_NAME", None) is None:
+            raise ImproperlyConfigured("You should provide either a title entry in the message dict, or provide an "
+                                       "APP_NAME property in the settings module.")
+        message['title'] = SETTINGS.get("APP_NAME")
+    return message
+
+
 def notify_user(notifications_token: str, message: dict):
     """
     Notifies a user using his notifications token (provided from the apps)
     :param notifications_token: the user's notification token
     :param message: the message should be a dict normal use case consists of two keys (title,message)
-    :return: None
+    :return: None, the notification is queued in the outbox when USE_BASE_BACKEND_OUTBOX_TABLE is set.
     """
     if notifications_token == '' or notifications_token is None:
         raise ValueError('notifications_token must not be empty, you should provide the user\'s notification token')
@@ -40,17 +71,107 @@ def notify_user(notifications_token: str, message: dict):
     if type(message) is not dict:
         raise TypeError('The message must be a dictionary containing a title and message')
 
-    if message['title'] is None and SETTINGS.get("APP_NAME", None) is not None:
-        message['title'] = SETTINGS.get("APP_NAME")
+    message = _with_title(message)
+    if outbox_enabled():
+        enqueue(get_outbox_table().NOTIFICATION, notifications_token=notifications_token, message=message)
     else:
-        raise ImproperlyConfigured("You should provide either a title entry in the message dict, or provide an APP_NAME"
-                                   "property in the settings module.")
+        deliver_user_notification(notifications_token, message)
 
+
+def deliver_user_notification(notifications_token: str, message: dict):
+    """
+    sends the notification right away.
+    """
+    messaging = get_firebase_messaging()
     msg = messaging.Message(data=message, token=notifications_token)
     response = messaging.send(msg)
     logger.info(response)
 
 
+def notify_users(recipients, message: dict, batch_size: int = MULTICAST_BATCH_SIZE, max_workers: int = None) -> dict:
+    """
+    Notifies many users at once, the tokens are sent in multicast batches from a bounded pool of threads.
+    the tokens firebase reports as unregistered are removed from the users.
+    :param recipients: a queryset of users, or an iterable of users or notification tokens
+    :param message: the message should be a dict normal use case consists of two keys (title,message)
+    :param batch_size: the number of tokens per multicast message, at most 500
+    :param max_workers: the number of batches sent concurrently (default NOTIFICATIONS_MAX_WORKERS)
+    :return: a dict mapping each token to its message id, or to the exception firebase returned for it, the tokens of
+    a batch which failed as a whole (network error...) are mapped to its exception
+    """
+    if type(message) is not dict:
+        raise TypeError('The message must be a dictionary containing a title and message')
+
+    message = _with_title(message)
+    messaging = get_firebase_messaging()
+    tokens = _iter_tokens(recipients)
+    max_workers = max_workers or SETTINGS.get("NOTIFICATIONS_MAX_WORKERS", 8)
+    results = {}
+    unregistered = []
+    # the tokens of each submitted batch.
+    batches = {}
+
+    def collect(future):
+        batch = batches.pop(future)
+        try:
+            responses = future.result()
+        except Exception as e:
+            # the other batches are still collected, the failed one is reported for each of its tokens.
+            logger.exception("a batch of %s notifications failed.", len(batch))
+            results.update(dict.fromkeys(batch, e))
+            return
+        for token, response in responses:
+            results[token] = response.message_id if response.success else response.exception
+            if not response.success and isinstance(response.exception, messaging.UnregisteredError):
+                unregistered.append(token)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = set()
+            while True:
+                batch = list(islice(tokens, min(batch_size, MULTICAST_BATCH_SIZE)))
+                if not batch:
+                    break
+                # bounds the batches waiting in memory when the recipients are streamed from the database.
+                if len(pending) >= max_workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        collect(future)
+                future = executor.submit(_send_batch, batch, message)
+                batches[future] = batch
+                pending.add(future)
+            for future in pending:
+                collect(future)
+    finally:
+        # the tokens reported so far are pruned even if reading the recipients failed.
+        if unregistered:
+            get_user_model().objects.filter(notification_token__in=unregistered).update(notification_token=None)
+    logger.info("notified %s tokens, %s unregistered tokens removed.", len(results), len(unregistered))
+    return results
+
+
+def _iter_tokens(recipients):
+    if isinstance(recipients, QuerySet):
+        recipients = recipients.exclude(notification_token__isnull=True).exclude(notification_token='') \
+            .values_list('notification_token', flat=True).iterator()
+    for recipient in recipients:
+        token = recipient if isinstance(recipient, str) else getattr(recipient, 'notification_token', None)
+        if token:
+            yield token
+
+
+def _send_batch(tokens: list, message: dict) -> list:
+    """
+    sends a multicast message to the tokens.
+    :return: the (token, send response) pairs
+    """
+    messaging = get_firebase_messaging()
+    msg = messaging.MulticastMessage(data=message, tokens=tokens)
+    # send_multicast is deprecated in the recent firebase_admin versions.
+    send = getattr(messaging, 'send_each_for_multicast', None) or messaging.send_multicast
+    return list(zip(tokens, send(msg).responses))
+
+
 def notify_topic(message: dict, topic: str):
     _notify_topic(message, topic)
 
@@ -62,6 +183,7 @@ def _notify_topic(message: dict, topic):
     :param topic: a topic name, topics are to be initialized from the receiving apps (users subscribe to topics)
     :return: None
     """
+    messaging = get_firebase_messaging()
     msg = messaging.Message(data=message, topic=topic)
     response = messaging.send(msg)
     logger.info(response)
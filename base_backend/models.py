@@ -1,10 +1,17 @@
 from datetime import date
 
 from . import SETTINGS
+from django.conf import settings
 from django.db import models
-from django.db.models import Func
+from django.db.models import Func, Q
 from django.contrib.auth.models import AbstractUser
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.db.models.functions import Upper
+from django.utils import timezone
+from .managers import BaseManager, SoftDeleteManager, AllObjectsManager, SoftDeleteUserManager, AllUsersManager
+from .ownership import is_owned_by
+from .utils import normalize_phone
 from .validators import phone_validator
 
 from django.utils.translation import gettext_lazy as _
@@ -17,25 +24,66 @@ class BaseModel(models.Model):
     """
     Base Model with creation and update timestamps.
     """
-    created_at = models.DateTimeField(auto_now_add=True, editable=False)
-    updated_at = models.DateTimeField(auto_now=True)
+    # indexed for the keyset pagination (see pagination.py) and the purge of the expired rows.
+    created_at = models.DateTimeField(auto_now_add=True, editable=False, db_index=True)
+    # indexed for the incremental sync, see BaseQuerySet.changes_since.
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = BaseManager()
 
     class Meta:
         abstract = True
 
 
+def visible_index(*fields, name: str) -> models.Index:
+    """
+    partial index over the visible rows only, the predicate every query of the default soft delete manager carries.
+    """
+    return models.Index(fields=list(fields), name=name, condition=Q(visible=True))
+
+
 class DeletableModel(BaseModel):
     """
-    Soft delete Base model
+    Soft delete Base model, objects only returns the visible rows and all_objects all of them.
+    the reverse relations named in soft_delete_cascade are soft deleted with the instances.
     """
     visible = models.BooleanField(default=True)
 
+    objects = SoftDeleteManager()
+    all_objects = AllObjectsManager()
+
+    soft_delete_cascade = ()
+
     def delete(self, using=None, keep_parents=False):
+        """
+        hides the instance with an UPDATE of its visible and updated_at columns only, see SoftDeleteQuerySet.
+        """
         self.visible = False
-        self.save()
+        return type(self).all_objects.using(using or self._state.db).filter(pk=self.pk).delete()
+
+    class Meta:
+        abstract = True
+
+
+class OwnedModel(BaseModel):
+    """
+    Base model of the rows belonging to a user, see permissions.IsOwner and filters.IsOwnerFilterBackend.
+    the (owner, created_at, id) index serves the user's rows in the keyset pagination order. the foreign key keeps its
+    own index, the subclasses defining their Meta.indexes drop the composite one unless they extend
+    OwnedModel.Meta.indexes.
+    """
+    OWNER_FIELD = 'owner'
+
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=cascade, verbose_name=_('Owner'))
+
+    def is_owned_by(self, user) -> bool:
+        return is_owned_by(self, user)
 
     class Meta:
         abstract = True
+        indexes = [
+            models.Index(fields=['owner', 'created_at', 'id']),
+        ]
 
 
 class SmsVerification(BaseModel):
@@ -51,6 +99,16 @@ class SmsVerification(BaseModel):
 
     class Meta:
         abstract = not SETTINGS.get("USE_BASE_BACKEND_OTP_TABLE", False)
+        constraints = [
+            # a pending code must identify a single verification (the codes are consumed without their phone number),
+            # issuing relies on this constraint to detect collisions in the same statement that inserts the code and
+            # frees the slots of the expired codes on collision, see utils.issue_otp_code.
+            models.UniqueConstraint(fields=['otp_code'], condition=Q(confirmed=False),
+                                    name='%(app_label)s_%(class)s_pending_otp_code'),
+        ]
+        indexes = [
+            models.Index(fields=['number'], condition=Q(confirmed=False), name='bb_sms_pending_number_idx'),
+        ]
 
 
 class PasswordReset(BaseModel):
@@ -69,10 +127,80 @@ class PasswordReset(BaseModel):
 
     class Meta:
         abstract = not SETTINGS.get("USE_BASE_BACKEND_RESET_PASSWORD_TABLE", False)
+        indexes = [
+            models.Index(fields=['token'], condition=Q(used=False), name='bb_reset_pending_token_idx'),
+        ]
+
+
+class AccessToken(BaseModel):
+    """
+    Basic table for recording the api access tokens, only the sha256 hash of a token is stored (see tokens module),
+    the raw token is only known by the client it was issued to.
+    """
+    key = models.CharField(max_length=64, unique=True, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=cascade, related_name='access_tokens')
+    expires_at = models.DateTimeField(null=True, blank=True)
+    last_used_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at is not None and self.expires_at <= timezone.now()
+
+    def __str__(self):
+        return "{}'s token".format(self.user)
+
+    class Meta:
+        abstract = not SETTINGS.get("USE_BASE_BACKEND_ACCESS_TOKEN_TABLE", False)
+
+
+class OutboxMessage(BaseModel):
+    """
+    Basic table queuing the outgoing sms, emails and notifications, the requests only insert a row (in their own
+    transaction) and the drain_outbox command delivers them. the delivered messages are deleted, the ones failing
+    OUTBOX_MAX_ATTEMPTS times are kept as dead letters.
+    """
+    SMS = 'sms'
+    EMAIL = 'email'
+    NOTIFICATION = 'notification'
+    KINDS = ((SMS, _('SMS')), (EMAIL, _('Email')), (NOTIFICATION, _('Notification')))
+
+    PENDING = 'P'
+    DEAD = 'D'
+    STATUSES = ((PENDING, _('Pending')), (DEAD, _('Dead')))
+
+    kind = models.CharField(_('Kind'), max_length=20, choices=KINDS)
+    payload = models.JSONField(_('Payload'))
+    status = models.CharField(_('Status'), max_length=1, choices=STATUSES, default=PENDING)
+    attempts = models.PositiveIntegerField(_('Attempts'), default=0)
+    available_at = models.DateTimeField(_('Available At'), default=timezone.now)
+    last_error = models.TextField(_('Last Error'), blank=True, default='')
+
+    def __str__(self):
+        return "{} {}".format(self.kind, self.get_status_display())
+
+    class Meta:
+        verbose_name = _('Outbox Message')
+        verbose_name_plural = _('Outbox Messages')
+        abstract = not SETTINGS.get("USE_BASE_BACKEND_OUTBOX_TABLE", False)
+        indexes = [
+            models.Index(fields=['available_at'], condition=Q(status='P'), name='bb_outbox_pending_idx'),
+        ]
 
 
 # Basic regions models
 
+def trigram_indexes(prefix: str, fields) -> list:
+    """
+    the pg_trgm GIN indexes of the names fields, used by regions.search_queryset. they are only declared when
+    REGIONS_TRIGRAM_INDEXES is set, their migration must be preceded by the creation of the extension
+    (django.contrib.postgres.operations.TrigramExtension).
+    """
+    if not SETTINGS.get("REGIONS_TRIGRAM_INDEXES", False):
+        return []
+    return [GinIndex(fields=[field], opclasses=['gin_trgm_ops'], name='bb_%s_%s_trgm' % (prefix, field))
+            for field in fields]
+
+
 class Region(BaseModel):
     name = models.CharField(max_length=255, verbose_name=_('Name'))
     name_ar = models.CharField(max_length=255, verbose_name=_('Arabic Name'))
@@ -85,6 +213,7 @@ class Region(BaseModel):
         verbose_name = _('Region')
         verbose_name_plural = _("Regions")
         abstract = not SETTINGS.get("USE_BASE_BACKEND_REGIONS", False)
+        indexes = trigram_indexes('region', ['name', 'name_ar', 'name_fr'])
 
 
 class State(BaseModel):
@@ -102,6 +231,7 @@ class State(BaseModel):
         verbose_name = _('State')
         verbose_name_plural = _("States")
         abstract = not SETTINGS.get("USE_BASE_BACKEND_REGIONS", False)
+        indexes = trigram_indexes('state', ['name', 'name_ar', 'name_fr'])
 
 
 class City(BaseModel):
@@ -110,6 +240,8 @@ class City(BaseModel):
     name_en = models.CharField(max_length=255, verbose_name=_('English Name'))
     code_postal = models.IntegerField(verbose_name=_('Postal Code'))
     state = models.ForeignKey('State', on_delete=models.DO_NOTHING, related_name='cities', verbose_name=_('State'))
+    latitude = models.FloatField(verbose_name=_('Latitude'), null=True, blank=True)
+    longitude = models.FloatField(verbose_name=_('Longitude'), null=True, blank=True)
 
     def __str__(self):
         return self.name
@@ -118,6 +250,7 @@ class City(BaseModel):
         verbose_name = _('City')
         verbose_name_plural = _("Cities")
         abstract = not SETTINGS.get("USE_BASE_BACKEND_REGIONS", False)
+        indexes = trigram_indexes('city', ['name', 'name_ar', 'name_en'])
 
 
 # Basic Authentication Models
@@ -160,6 +293,12 @@ class User(AbstractUser):
 
     visible = models.BooleanField(default=True)
 
+    objects = SoftDeleteUserManager()
+    all_objects = AllUsersManager()
+
+    # the profile is hidden with the user.
+    soft_delete_cascade = ('profile',)
+
     if SETTINGS.get("USERNAME_FIELD", None):
         USERNAME_FIELD = SETTINGS.get("USERNAME_FIELD")
     else:
@@ -188,19 +327,31 @@ class User(AbstractUser):
         """
         return False
 
+    def save(self, *args, **kwargs):
+        # the phones are stored normalized so the login lookups can match them exactly through the index.
+        if self.phones:
+            self.phones = [normalize_phone(phone) for phone in self.phones]
+        super().save(*args, **kwargs)
+
     def delete(self, using=None, keep_parents=False):
         """
         upon user delete we make it invisible so it won't selected and inactive so it can't be logged in with.
         """
         self.visible = False
         self.is_active = False
-        self.save()
+        return type(self).all_objects.using(using or self._state.db).filter(pk=self.pk).delete()
 
     def __str__(self):
         return self.full_name
 
     class Meta:
         abstract = not SETTINGS.get("USE_BASE_BACKEND_USER_MODEL", False)
+        indexes = [
+            # phones @> ARRAY[...] and UPPER(email) = UPPER(...) are the PhoneOrEmailBackend lookups.
+            GinIndex(fields=['phones'], name='bb_user_phones_gin'),
+            models.Index(Upper('email'), name='bb_user_email_upper_idx'),
+            visible_index('user_type', name='bb_user_visible_type_idx'),
+        ]
 
 
 class Profile(DeletableModel):
@@ -208,6 +359,7 @@ class Profile(DeletableModel):
         GENDERS = SETTINGS.get("GENDERS")
     else:
         GENDERS = (('M', 'Male'), ('F', 'Female'))
+    OWNER_FIELD = 'user'
 
     user = models.OneToOneField('User', on_delete=do_nothing, related_name='profile')
     photo = models.ImageField(
@@ -241,6 +393,9 @@ class Profile(DeletableModel):
         verbose_name = _('Profile')
         verbose_name_plural = _('Profiles')
         abstract = not SETTINGS.get("USE_BASE_BACKEND_PROFILE_MODEL", False)
+        indexes = [
+            visible_index('city', name='bb_profile_visible_city_idx'),
+        ]
 
 
 class Round(Func):
@@ -0,0 +1,165 @@
+"""
+OTP stores keep the codes sent over sms for phone verification.
+the store used by the utils functions is selected with the OTP_STORE setting (a dotted path), it defaults to the
+ModelOtpStore which works with the otp verification table. the CacheOtpStore keeps the codes in a django cache instead
+so the verification traffic never reaches the database, the cache alias is set with OTP_CACHE (default 'default').
+"""
+
+import secrets
+
+from django.core.cache import caches
+from django.core.exceptions import PermissionDenied
+from django.db import transaction
+from django.utils import timezone
+
+from . import SETTINGS, get_otp_verification_table, get_otp_ttl
+from .utils import generate_alphabetic_random_code, issue_otp_code, not_expired, update_returning
+
+
+class BaseOtpStore(object):
+    """
+    Base class for the otp stores, subclasses must implement issue, resend and consume.
+    """
+
+    def issue(self, phone: str) -> str:
+        """
+        stores a new code for the phone number.
+        :return: the code
+        """
+        raise NotImplementedError('subclasses of BaseOtpStore must provide an issue() method')
+
+    def resend(self, phone: str) -> str:
+        """
+        returns the live code of the phone number, a new one is issued if there is none.
+        :return: the code
+        """
+        raise NotImplementedError('subclasses of BaseOtpStore must provide a resend() method')
+
+    def consume(self, code: str):
+        """
+        confirms the code, a code can only be consumed once.
+        :return: the phone number the code was issued for, None if the code is unknown, expired or already used.
+        """
+        raise NotImplementedError('subclasses of BaseOtpStore must provide a consume() method')
+
+    def release(self, code: str) -> None:
+        """
+        makes a code consumed in a transaction which was rolled back usable again, the stores keeping their codes in
+        the database have nothing to do, the rollback restored them.
+        """
+
+
+class ModelOtpStore(BaseOtpStore):
+    """
+    Stores the codes in the otp verification table.
+    """
+
+    def issue(self, phone):
+        return issue_otp_code(phone).otp_code
+
+    def resend(self, phone):
+        code = get_otp_verification_table().objects.filter(not_expired(get_otp_ttl()), number=phone, confirmed=False) \
+            .order_by('-created_at').values_list('otp_code', flat=True).first()
+        return code or self.issue(phone)
+
+    def consume(self, code):
+        pending = get_otp_verification_table().objects.filter(not_expired(get_otp_ttl()), otp_code=code,
+                                                              confirmed=False)
+        # a single conditional UPDATE ... RETURNING, the concurrent consumers of the same code are serialized on the
+        # row lock and only the first one still matches confirmed = false.
+        numbers = update_returning(pending, {'confirmed': True, 'updated_at': timezone.now()}, 'number')
+        if numbers is None:
+            return self.lock_and_consume(pending)
+        return numbers[0] if numbers else None
+
+    @staticmethod
+    def lock_and_consume(pending):
+        """
+        consumes the code on the databases which can't return rows from an UPDATE.
+        """
+        with transaction.atomic(using=pending.db):
+            verification = pending.select_for_update().first()
+            if verification is None:
+                return None
+            verification.confirmed = True
+            verification.save(update_fields=['confirmed', 'updated_at'])
+            return verification.number
+
+
+class CacheOtpStore(BaseOtpStore):
+    """
+    Stores the codes in a django cache, they expire with the cache entries after OTP_TTL.
+    the codes are reserved with cache.add (set-if-absent) so two phones never share a live code, and the codes issued
+    per phone number are counted, a phone can't get more than OTP_MAX_ATTEMPTS codes within OTP_TTL.
+    consuming a code within a transaction only claims it, it's removed once the transaction commits. the claim of a
+    rolled back transaction is dropped by release, or expires after claim_timeout seconds. each claim holds a token of
+    the store instance which made it, release only drops the claims of its own instance.
+    """
+    key_prefix = 'base_backend:otp'
+    claim_timeout = 60
+
+    def __init__(self, alias=None):
+        self.cache = caches[alias or SETTINGS.get("OTP_CACHE", "default")]
+        ttl = get_otp_ttl()
+        self.timeout = ttl.total_seconds() if ttl is not None else None
+        # the tokens of the claims made by this instance, by code.
+        self.claims = {}
+
+    def make_key(self, kind, value):
+        return "{0}:{1}:{2}".format(self.key_prefix, kind, value)
+
+    def count_attempt(self, phone):
+        """
+        raises PermissionDenied once the phone number reaches the allowed codes count.
+        """
+        key = self.make_key('attempts', phone)
+        self.cache.add(key, 0, self.timeout)
+        try:
+            attempts = self.cache.incr(key)
+        except ValueError:
+            # the counter expired between the add and the incr.
+            self.cache.add(key, 1, self.timeout)
+            attempts = 1
+        if attempts > SETTINGS.get("OTP_MAX_ATTEMPTS", 5):
+            raise PermissionDenied("too many codes were requested for this phone number.")
+
+    def issue(self, phone):
+        self.count_attempt(phone)
+        for attempt in range(SETTINGS.get("OTP_ISSUE_MAX_ATTEMPTS", 10)):
+            code = generate_alphabetic_random_code()
+            if self.cache.add(self.make_key('code', code), phone, self.timeout):
+                self.cache.set(self.make_key('phone', phone), code, self.timeout)
+                return code
+        raise RuntimeError("couldn't reserve a free otp code.")
+
+    def resend(self, phone):
+        code = self.cache.get(self.make_key('phone', phone))
+        if code is not None and self.cache.get(self.make_key('code', code)) == phone:
+            self.count_attempt(phone)
+            return code
+        return self.issue(phone)
+
+    def consume(self, code):
+        key = self.make_key('code', code)
+        phone = self.cache.get(key)
+        token = secrets.token_hex(16)
+        # only the caller which actually claims the code gets to confirm it.
+        if phone is None or not self.cache.add(self.make_key('claim', code), token, self.claim_timeout):
+            return None
+        self.claims[code] = token
+
+        def remove():
+            self.cache.delete_many([key, self.make_key('phone', phone), self.make_key('claim', code)])
+
+        if transaction.get_connection().in_atomic_block:
+            transaction.on_commit(remove)
+        else:
+            remove()
+        return phone
+
+    def release(self, code):
+        token = self.claims.pop(code, None)
+        key = self.make_key('claim', code)
+        # the claim of another caller is left alone, the code stays in use until its transaction ends.
+        if token is not None and self.cache.get(key) == token:
+            self.cache.delete(key)
@@ -0,0 +1,119 @@
+"""
+Outbox for the outgoing sms, emails and notifications.
+when USE_BASE_BACKEND_OUTBOX_TABLE is set, utils.send_sms, utils.send_email and messaging.notify_user only insert a
+row in the outbox table, in the same transaction as the change that triggered them, and the drain_outbox command
+delivers the queued messages out of the request cycle.
+
+settings:
+OUTBOX_MAX_ATTEMPTS: deliveries tried before a message is kept as a dead letter (default 5).
+OUTBOX_RETRY_DELAY: seconds before the first retry, doubled on each failed attempt (default 30).
+OUTBOX_MAX_RETRY_DELAY: the cap of the retry delay in seconds (default 3600).
+OUTBOX_LEASE: seconds a claimed message is hidden from the other workers while it's being delivered (default 300).
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import SETTINGS, get_outbox_table
+
+logger = logging.getLogger(__name__)
+
+
+def outbox_enabled() -> bool:
+    return SETTINGS.get("USE_BASE_BACKEND_OUTBOX_TABLE", False)
+
+
+def enqueue(kind: str, **payload):
+    """
+    queues a message, this is the only query the caller pays for.
+    :param kind: one of the outbox table KINDS
+    :param payload: the json serializable arguments of the delivery function
+    :return: the outbox message
+    """
+    return get_outbox_table().objects.create(kind=kind, payload=payload)
+
+
+def deliver(message) -> None:
+    """
+    sends a queued message, raises the delivery errors.
+    """
+    table = get_outbox_table()
+    if message.kind == table.SMS:
+        from .utils import deliver_sms
+        deliver_sms(**message.payload)
+    elif message.kind == table.EMAIL:
+        from .utils import deliver_email
+        deliver_email(**message.payload)
+    elif message.kind == table.NOTIFICATION:
+        from .messaging import deliver_user_notification
+        deliver_user_notification(**message.payload)
+    else:
+        raise ValueError("unknown outbox message kind '{0}'".format(message.kind))
+
+
+def claim(batch_size: int) -> list:
+    """
+    takes the next due messages, the rows are locked only while their lease is written, so the deliveries run outside
+    of any transaction and the concurrent workers skip the claimed rows.
+    """
+    table = get_outbox_table()
+    now = timezone.now()
+    with transaction.atomic():
+        messages = list(table.objects.select_for_update(skip_locked=True)
+                        .filter(status=table.PENDING, available_at__lte=now)
+                        .order_by('available_at')[:batch_size])
+        if messages:
+            table.objects.filter(pk__in=[message.pk for message in messages]) \
+                .update(available_at=now + timedelta(seconds=SETTINGS.get("OUTBOX_LEASE", 300)))
+    return messages
+
+
+def retry_delay(attempts: int) -> timedelta:
+    delay = SETTINGS.get("OUTBOX_RETRY_DELAY", 30) * 2 ** (attempts - 1)
+    return timedelta(seconds=min(delay, SETTINGS.get("OUTBOX_MAX_RETRY_DELAY", 3600)))
+
+
+def process(batch_size: int = 100, concurrency: int = 4) -> int:
+    """
+    claims and delivers a batch of messages, the deliveries run in a pool of concurrency threads.
+    the delivered messages are deleted, the failed ones are retried with an exponential backoff until they become
+    dead letters.
+    :return: the number of processed messages
+    """
+    table = get_outbox_table()
+    messages = claim(batch_size)
+    if not messages:
+        return 0
+
+    def attempt(message):
+        try:
+            deliver(message)
+        except Exception as e:
+            logger.exception("outbox message %s delivery failed.", message.pk)
+            return message, e
+        return message, None
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(attempt, messages))
+
+    delivered = [message.pk for message, error in results if error is None]
+    if delivered:
+        table.objects.filter(pk__in=delivered).delete()
+    for message, error in results:
+        if error is None:
+            continue
+        attempts = message.attempts + 1
+        dead = attempts >= SETTINGS.get("OUTBOX_MAX_ATTEMPTS", 5)
+        table.objects.filter(pk=message.pk).update(
+            attempts=F('attempts') + 1,
+            last_error=repr(error),
+            status=table.DEAD if dead else table.PENDING,
+            available_at=timezone.now() + retry_delay(attempts),
+            updated_at=timezone.now(),
+        )
+    return len(messages)
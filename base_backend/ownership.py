@@ -0,0 +1,61 @@
+"""
+The ownership of the rows: a model names the field referring to its owner (the user) in OWNER_FIELD, see
+models.OwnedModel. the owner is compared through its foreign key column, it's never loaded.
+shared by the rest framework permissions, the filter backends and the templatetags, without importing any of them.
+"""
+
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+
+
+def get_owner_field(model):
+    """
+    :param model: the model or one of its instances
+    :return: the model field named by OWNER_FIELD, None if OWNER_FIELD names a plain attribute.
+    :raise ImproperlyConfigured: if the model has no OWNER_FIELD, or if it names a reverse or many to many relation,
+    those have no column holding the owner.
+    """
+    try:
+        name = model.OWNER_FIELD
+    except AttributeError:
+        raise ImproperlyConfigured("If you want to use this permission, you should specify an OWNER_FIELD property "
+                                   "in your object or extend the Owned Model from base_backend models")
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+    if not field.concrete or field.many_to_many:
+        raise ImproperlyConfigured("the OWNER_FIELD of %s must name a field or a foreign key, not the relation '%s'."
+                                   % (model._meta.label, name))
+    return field
+
+
+def get_owner_id(obj):
+    """
+    :return: the primary key of the object's owner, read from the foreign key column so the owner isn't loaded.
+    """
+    field = get_owner_field(obj)
+    if field is not None:
+        return getattr(obj, field.attname)
+    owner = getattr(obj, obj.OWNER_FIELD)
+    return getattr(owner, 'pk', owner)
+
+
+def is_owned_by(obj, user) -> bool:
+    """
+    checks if the user owns the object, without any query.
+    """
+    return bool(user and user.is_authenticated and get_owner_id(obj) == user.pk)
+
+
+def filter_owned(queryset, user):
+    """
+    :return: the rows of the queryset owned by the user, none for the anonymous users. the owner's foreign key column
+    is compared, no join is needed.
+    """
+    if user is None or not user.is_authenticated:
+        return queryset.none()
+    field = get_owner_field(queryset.model)
+    if field is None:
+        raise ImproperlyConfigured("the OWNER_FIELD of %s must name a model field to filter on it."
+                                   % queryset.model._meta.label)
+    return queryset.filter(**{field.attname: user.pk})
@@ -0,0 +1,90 @@
+"""
+Keyset pagination of the base models for the django rest framework, rendered by rest_utils.CustomJSONRenderer.
+"""
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from .cursors import InvalidCursor, decode_cursor, encode_cursor, keyset_filter
+
+
+class KeysetPagination(BasePagination):
+    """
+    paginates on the (created_at, pk) ordering of BaseModel, newest first, with opaque cursors.
+    each page is read from the index where the previous one stopped, a deep page costs what the first one costs, and
+    no COUNT(*) is run. the responses have the shape CustomJSONRenderer expects:
+        {"meta": {"next": url, "next_cursor": "...", "page_size": 100, "has_more": true}, "paginated_results": [...]}
+    """
+    ordering_field = 'created_at'
+    descending = True
+    cursor_query_param = 'cursor'
+    page_size = None
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request) -> int:
+        page_size = self.page_size or api_settings.PAGE_SIZE or 100
+        if self.page_size_query_param in request.query_params:
+            try:
+                requested = int(request.query_params[self.page_size_query_param])
+            except ValueError:
+                return page_size
+            if requested > 0:
+                page_size = min(requested, self.max_page_size)
+        return page_size
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = self.get_page_size(request)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            try:
+                queryset = queryset.filter(keyset_filter(self.ordering_field, *decode_cursor(cursor),
+                                                         descending=self.descending))
+            except InvalidCursor:
+                raise NotFound(self.invalid_cursor_message)
+        ordering = ('-%s' if self.descending else '%s') % self.ordering_field, '-pk' if self.descending else 'pk'
+        rows = list(queryset.order_by(*ordering)[:self.limit + 1])
+        self.has_more = len(rows) > self.limit
+        rows = rows[:self.limit]
+        self.next_cursor = encode_cursor(getattr(rows[-1], self.ordering_field), rows[-1].pk) \
+            if self.has_more else None
+        return rows
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        params = self.request.query_params.copy()
+        params[self.cursor_query_param] = self.next_cursor
+        return self.request.build_absolute_uri('?' + params.urlencode())
+
+    def get_paginated_response(self, data):
+        return Response({
+            'meta': {
+                'next': self.get_next_link(),
+                'next_cursor': self.next_cursor,
+                'page_size': self.limit,
+                'has_more': self.has_more,
+            },
+            'paginated_results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'meta': {
+                    'type': 'object',
+                    'properties': {
+                        'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                        'next_cursor': {'type': 'string', 'nullable': True},
+                        'page_size': {'type': 'integer'},
+                        'has_more': {'type': 'boolean'},
+                    },
+                },
+                'paginated_results': schema,
+            },
+        }
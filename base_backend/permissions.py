@@ -1,6 +1,8 @@
-from django.core.exceptions import ImproperlyConfigured
 from rest_framework.permissions import BasePermission, SAFE_METHODS
 
+from .authorization import get_authorization, user_has_perms
+from .ownership import is_owned_by
+
 
 class IsReadOnly(BasePermission):
     """
@@ -11,10 +13,19 @@ class IsReadOnly(BasePermission):
         return bool(request.method in SAFE_METHODS)
 
 
+class IsOwner(BasePermission):
+    """
+    Object-level permission to only allow the owners of an object, see filters.IsOwnerFilterBackend for the lists.
+    """
+
+    def has_object_permission(self, request, view, obj):
+        return is_owned_by(obj, request.user)
+
+
 class IsOwnerOrReadOnly(BasePermission):
     """
         Object-level permission to only allow owners of an object to edit it.
-        Assumes the model instance has an `owner` attribute.
+        Assumes the model instance has an `OWNER_FIELD` attribute.
         """
 
     def has_object_permission(self, request, view, obj):
@@ -23,25 +34,16 @@ class IsOwnerOrReadOnly(BasePermission):
         if request.method in SAFE_METHODS:
             return True
 
-        # Instance must have an attribute named `owner`.
-        try:
-            return getattr(obj, obj.OWNER_FIELD) == request.user
-        except AttributeError:
-            raise ImproperlyConfigured("If you want to use this permission, you should specify an OWNER_FIELD property"
-                                       "in your object or extend the Owned Model from base_backend models")
+        return is_owned_by(obj, request.user)
 
 
 class IsAdminOrIsOwner(BasePermission):
     """
-    Allow only the user or an admin user to edit.
+    Allow only the user or an admin user to edit, see filters.IsAdminOrIsOwnerFilterBackend for the lists.
     """
 
     def has_object_permission(self, request, view, obj):
-        try:
-            return request.user.is_staff or getattr(obj, obj.OWNER_FIELD) == request.user
-        except AttributeError:
-            raise ImproperlyConfigured("If you want to use this permission, you should specify an OWNER_FIELD property"
-                                       "in your object or extend the Owned Model from base_backend models")
+        return bool(request.user and request.user.is_staff) or is_owned_by(obj, request.user)
 
 
 class IsAdminOrReadOnly(BasePermission):
@@ -51,3 +53,21 @@ class IsAdminOrReadOnly(BasePermission):
 
     def has_permission(self, request, view):
         return bool(request.method in SAFE_METHODS or request.user and request.user.is_staff)
+
+
+class IsInGroup(BasePermission):
+    """
+    Allow only the members of one of the view's `required_groups`.
+    """
+
+    def has_permission(self, request, view):
+        return get_authorization(request.user).has_any_group(getattr(view, 'required_groups', ()))
+
+
+class HasPermissions(BasePermission):
+    """
+    Allow only the users having all the view's `required_permissions`, in the <app_label>.<codename> format.
+    """
+
+    def has_permission(self, request, view):
+        return user_has_perms(request.user, getattr(view, 'required_permissions', ()))
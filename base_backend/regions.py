@@ -0,0 +1,414 @@
+"""
+In-process cache of the Region -> State -> City reference data.
+the three tables are static, they are loaded once per process (three queries) into named tuples, and the lookups,
+choices, localized names and the autocomplete search are then answered without touching the database.
+the cache is dropped when a region, a state or a city is saved or deleted (see apps.py), the next lookup reloads it.
+the other processes are told through a version counter in the shared django cache, bumped once the change commits:
+each process compares it with the version of its copy at most every REFERENCE_DATA_CHECK_INTERVAL seconds (default
+30) and reloads its copy when it moved.
+
+settings:
+REFERENCE_DATA_CACHE: the django cache alias holding the version (default 'default').
+REFERENCE_DATA_CHECK_INTERVAL: seconds a process answers from its copy before checking the version (default 30).
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from collections import namedtuple
+from functools import reduce
+from operator import or_
+
+from django.apps import apps
+from django.contrib.postgres.lookups import TrigramSimilar
+from django.contrib.postgres.search import TrigramSimilarity
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils.translation import get_language
+
+from . import SETTINGS
+from .text_utils import normalize_text
+
+# the minimum similarity of the trigram matches, pg_trgm's default.
+TRIGRAM_THRESHOLD = 0.3
+
+
+class LocalizedMixin(object):
+    __slots__ = ()
+
+    def localized_name(self, language: str = None) -> str:
+        """
+        :param language: a language code (ar, fr, en, fr-dz...), the active language by default
+        :return: the name in the language, the default name if it isn't translated in it.
+        """
+        language = (language or get_language() or '').split('-')[0]
+        return getattr(self, 'name_%s' % language, None) or self.name
+
+    @property
+    def names(self) -> tuple:
+        return tuple(filter(None, (getattr(self, field) for field in self._fields if field.startswith('name'))))
+
+    def __str__(self):
+        return self.name
+
+
+class RegionData(LocalizedMixin, namedtuple('RegionData', ['id', 'name', 'name_ar', 'name_fr', 'state_ids'])):
+    __slots__ = ()
+
+
+class StateData(LocalizedMixin, namedtuple('StateData', ['id', 'name', 'name_ar', 'name_fr', 'matricule',
+                                                         'code_postal', 'region_id', 'city_ids'])):
+    __slots__ = ()
+
+    def __str__(self):
+        return "{0} {1}".format(self.matricule, self.name)
+
+
+class CityData(LocalizedMixin, namedtuple('CityData', ['id', 'name', 'name_ar', 'name_en', 'code_postal', 'state_id',
+                                                       'latitude', 'longitude'])):
+    __slots__ = ()
+
+
+def _group(items, key) -> dict:
+    groups = {}
+    for item in items:
+        groups.setdefault(key(item), []).append(item)
+    return {value: tuple(group) for value, group in groups.items()}
+
+
+class ReferenceData(object):
+    """
+    the regions, states and cities by id, in the tables order, with the indexes of the lookups below.
+    """
+    __slots__ = ('regions', 'states', 'cities', 'cities_by_postal_code', 'states_by_postal_code', 'states_by_name',
+                 'cities_by_name')
+
+    def __init__(self, regions, states, cities):
+        """
+        :param regions: an iterable of (id, name, name_ar, name_fr)
+        :param states: an iterable of (id, name, name_ar, name_fr, matricule, code_postal, region_id)
+        :param cities: an iterable of (id, name, name_ar, name_en, code_postal, state_id, latitude, longitude)
+        """
+        cities = [CityData(*city) for city in cities]
+        city_ids = _group(cities, lambda city: city.state_id)
+        states = [StateData(*state, tuple(city.id for city in city_ids.get(state[0], ()))) for state in states]
+        state_ids = _group(states, lambda state: state.region_id)
+        self.regions = {region[0]: RegionData(*region, tuple(state.id for state in state_ids.get(region[0], ())))
+                        for region in regions}
+        self.states = {state.id: state for state in states}
+        self.cities = {city.id: city for city in cities}
+        self.cities_by_postal_code = _group(cities, lambda city: city.code_postal)
+        self.states_by_postal_code = {state.code_postal: state for state in states}
+        self.states_by_name = self.index_names(states)
+        self.cities_by_name = self.index_names(cities)
+
+    @staticmethod
+    def index_names(items) -> dict:
+        names = {}
+        for item in items:
+            for name in set(name.casefold() for name in item.names):
+                names.setdefault(name, []).append(item)
+        return {name: tuple(group) for name, group in names.items()}
+
+
+version_key = 'base_backend:reference_data:version'
+
+# (the reference data, the shared version it was loaded under, the monotonic time the version was last checked).
+_reference_data = None
+_reference_data_lock = threading.Lock()
+
+
+def get_cache():
+    return caches[SETTINGS.get("REFERENCE_DATA_CACHE", "default")]
+
+
+def get_version():
+    """
+    :return: the shared version of the reference data, started from the current time when it's missing.
+    """
+    cache = get_cache()
+    version = cache.get(version_key)
+    if version is None:
+        cache.add(version_key, int(time.time() * 1000), None)
+        version = cache.get(version_key)
+    return version
+
+
+def bump_version() -> None:
+    """
+    tells the other processes to reload their reference data.
+    """
+    cache = get_cache()
+    try:
+        cache.incr(version_key)
+    except ValueError:
+        cache.set(version_key, int(time.time() * 1000), None)
+
+
+def load_reference_data() -> ReferenceData:
+    region_model = apps.get_model('base_backend', 'Region')
+    state_model = apps.get_model('base_backend', 'State')
+    city_model = apps.get_model('base_backend', 'City')
+    return ReferenceData(
+        region_model.objects.order_by('pk').values_list('pk', 'name', 'name_ar', 'name_fr'),
+        state_model.objects.order_by('pk').values_list('pk', 'name', 'name_ar', 'name_fr', 'matricule', 'code_postal',
+                                                       'region_id'),
+        city_model.objects.order_by('pk').values_list('pk', 'name', 'name_ar', 'name_en', 'code_postal', 'state_id',
+                                                      'latitude', 'longitude').iterator())
+
+
+def get_reference_data() -> ReferenceData:
+    """
+    returns the cached reference data, it's loaded on first use and reloaded when the shared version moved.
+    """
+    global _reference_data
+    interval = SETTINGS.get("REFERENCE_DATA_CHECK_INTERVAL", 30)
+    cached = _reference_data
+    if cached is None or time.monotonic() - cached[2] >= interval:
+        with _reference_data_lock:
+            cached = _reference_data
+            if cached is None or time.monotonic() - cached[2] >= interval:
+                # read before loading, a change committing meanwhile is reloaded at the next check.
+                version = get_version()
+                data = cached[0] if cached is not None and cached[1] == version else load_reference_data()
+                cached = _reference_data = (data, version, time.monotonic())
+    return cached[0]
+
+
+def forget_reference_data() -> None:
+    global _reference_data
+    _reference_data = None
+
+
+def reference_data_committed() -> None:
+    # the copy of this process may have been reloaded before the commit.
+    forget_reference_data()
+    bump_version()
+
+
+def reset_reference_data(using=None, **kwargs) -> None:
+    """
+    drops the cached reference data, the next lookup reloads it, and the other processes' copies once the transaction
+    commits. connected to the Region, State and City save and delete signals.
+    """
+    forget_reference_data()
+    transaction.on_commit(reference_data_committed, using=using)
+
+
+def get_region(pk: int):
+    """
+    :return: the RegionData, None if it doesn't exist.
+    """
+    return get_reference_data().regions.get(pk)
+
+
+def get_state(pk: int):
+    """
+    :return: the StateData, None if it doesn't exist.
+    """
+    return get_reference_data().states.get(pk)
+
+
+def get_city(pk: int):
+    """
+    :return: the CityData, None if it doesn't exist.
+    """
+    return get_reference_data().cities.get(pk)
+
+
+def get_state_by_postal_code(code_postal: int):
+    """
+    :return: the StateData having the postal code, None if there is none.
+    """
+    return get_reference_data().states_by_postal_code.get(int(code_postal))
+
+
+def get_cities_by_postal_code(code_postal: int) -> tuple:
+    """
+    :return: the CityData sharing the postal code.
+    """
+    return get_reference_data().cities_by_postal_code.get(int(code_postal), ())
+
+
+def find_states(name: str) -> tuple:
+    """
+    :param name: the name of the state in any language (name, name_ar or name_fr), the case is ignored
+    :return: the matching StateData
+    """
+    return get_reference_data().states_by_name.get(name.strip().casefold(), ())
+
+
+def find_cities(name: str) -> tuple:
+    """
+    :param name: the name of the city in any language (name, name_ar or name_en), the case is ignored
+    :return: the matching CityData
+    """
+    return get_reference_data().cities_by_name.get(name.strip().casefold(), ())
+
+
+def state_choices(region_id: int = None, language: str = None) -> list:
+    """
+    :param region_id: limits the choices to the states of the region
+    :param language: the language of the labels, the active language by default
+    :return: the (id, name) choices of the states
+    """
+    data = get_reference_data()
+    if region_id is None:
+        states = data.states.values()
+    else:
+        region = data.regions.get(region_id)
+        states = [data.states[pk] for pk in region.state_ids] if region else ()
+    return [(state.id, state.localized_name(language)) for state in states]
+
+
+def city_choices(state_id: int = None, language: str = None) -> list:
+    """
+    :param state_id: limits the choices to the cities of the state
+    :param language: the language of the labels, the active language by default
+    :return: the (id, name) choices of the cities
+    """
+    data = get_reference_data()
+    if state_id is None:
+        cities = data.cities.values()
+    else:
+        state = data.states.get(state_id)
+        cities = [data.cities[pk] for pk in state.city_ids] if state else ()
+    return [(city.id, city.localized_name(language)) for city in cities]
+
+
+SearchMatch = namedtuple('SearchMatch', ['kind', 'place', 'score'])
+
+# the scores of the prefix matches, the trigram matches score their similarity, below 1.
+EXACT_SCORE, NAME_PREFIX_SCORE, WORD_PREFIX_SCORE = 4, 3, 2
+
+
+def trigrams(text: str) -> set:
+    """
+    the trigrams of the normalized text, computed like pg_trgm does: each word is padded with two spaces before and
+    one after.
+    """
+    grams = set()
+    for word in text.split():
+        word = '  %s ' % word
+        grams.update(word[i:i + 3] for i in range(len(word) - 2))
+    return grams
+
+
+class SearchIndex(object):
+    """
+    autocomplete index of the places names in all their languages, normalized with text_utils.normalize_text.
+    the prefixes are looked up by bisecting the sorted suffixes of the names starting at a word, the names not
+    matching any prefix are found by trigram similarity through an inverted index of their trigrams.
+    """
+    __slots__ = ('places', 'keys', 'key_places', 'names', 'name_trigrams', 'postings')
+
+    def __init__(self, places):
+        """
+        :param places: an iterable of (kind, place), the places being RegionData, StateData or CityData
+        """
+        self.places = []
+        # the word suffixes of the names, sorted, and the (place index, whether the suffix is the whole name) of each.
+        suffixes = []
+        # the distinct names and their place index, the trigrams postings refer to them.
+        self.names = []
+        self.name_trigrams = []
+        self.postings = {}
+        for kind, place in places:
+            position = len(self.places)
+            self.places.append((kind, place))
+            for name in set(filter(None, map(normalize_text, place.names))):
+                suffixes.append((name, position, True))
+                suffixes.extend((name[i + 1:], position, False) for i, char in enumerate(name) if char == ' ')
+                grams = trigrams(name)
+                for gram in grams:
+                    self.postings.setdefault(gram, []).append(len(self.names))
+                self.names.append((name, position))
+                self.name_trigrams.append(len(grams))
+        suffixes.sort()
+        self.keys = [suffix[0] for suffix in suffixes]
+        self.key_places = [suffix[1:] for suffix in suffixes]
+
+    def search(self, query: str, limit: int = 10, kinds=None) -> list:
+        """
+        :param query: the typed text, in any language, the accents and the case are ignored
+        :param limit: the maximum number of matches
+        :param kinds: limits the matches to these kinds ('region', 'state', 'city')
+        :return: the SearchMatch, the best first: exact names, names and then words starting with the query, and the
+        names sharing enough trigrams with it (typos).
+        """
+        query = normalize_text(query)
+        if not query:
+            return []
+        scores = {}
+        i = bisect_left(self.keys, query)
+        while i < len(self.keys) and self.keys[i].startswith(query):
+            position, whole = self.key_places[i]
+            score = (EXACT_SCORE if self.keys[i] == query else NAME_PREFIX_SCORE) if whole else WORD_PREFIX_SCORE
+            if score > scores.get(position, 0):
+                scores[position] = score
+            i += 1
+
+        if len(scores) < limit:
+            grams = trigrams(query)
+            shared = {}
+            for gram in grams:
+                for name in self.postings.get(gram, ()):
+                    shared[name] = shared.get(name, 0) + 1
+            for name, count in shared.items():
+                similarity = count / (len(grams) + self.name_trigrams[name] - count)
+                position = self.names[name][1]
+                if similarity >= TRIGRAM_THRESHOLD and similarity > scores.get(position, 0):
+                    scores[position] = similarity
+
+        matches = []
+        for position, score in scores.items():
+            kind, place = self.places[position]
+            if kinds is None or kind in kinds:
+                matches.append(SearchMatch(kind, place, score))
+        matches.sort(key=lambda match: (-match.score, len(match.place.name), match.place.name))
+        return matches[:limit]
+
+
+_search_index = None
+_search_index_lock = threading.Lock()
+
+
+def get_search_index() -> SearchIndex:
+    """
+    returns the search index of the cached reference data, it's rebuilt when the reference data is reloaded.
+    """
+    global _search_index
+    data = get_reference_data()
+    if _search_index is None or _search_index[0] is not data:
+        with _search_index_lock:
+            if _search_index is None or _search_index[0] is not data:
+                _search_index = (data, SearchIndex(
+                    [('region', region) for region in data.regions.values()] +
+                    [('state', state) for state in data.states.values()] +
+                    [('city', city) for city in data.cities.values()]))
+    return _search_index[1]
+
+
+def search_places(query: str, limit: int = 10, kinds=None) -> list:
+    """
+    autocompletes the regions, states and cities names, see SearchIndex.search.
+    :return: the SearchMatch (kind, place, score), the best first.
+    """
+    return get_search_index().search(query, limit, kinds)
+
+
+def search_queryset(queryset, query: str, fields=('name', 'name_ar')):
+    """
+    searches the names in the database with pg_trgm, for the tables that aren't worth caching. the `%` operator is
+    answered by the trigram GIN indexes created when REGIONS_TRIGRAM_INDEXES is set, the pg_trgm extension must be
+    installed (django.contrib.postgres.operations.TrigramExtension).
+    :param queryset: a queryset of Region, State or City
+    :param fields: the names fields searched
+    :return: the queryset filtered on the names similar to the query, annotated with and ordered by their similarity
+    """
+    similarities = [TrigramSimilarity(field, query) for field in fields]
+    return queryset.filter(reduce(or_, (TrigramSimilar(F(field), query) for field in fields))) \
+        .annotate(similarity=Greatest(*similarities) if len(similarities) > 1 else similarities[0]) \
+        .order_by('-similarity')
@@ -2,7 +2,20 @@
 Still under development
 """
 
+import json
+import math
+from decimal import Decimal
+from functools import lru_cache
+from itertools import chain, islice
+
+from django.http import HttpResponse, StreamingHttpResponse
 from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 
 class DefaultApiResponse(object):
@@ -14,6 +27,60 @@ class DefaultApiResponse(object):
             message=kwargs.get('message', 'success')
         )
 
+    def as_response(self, status: int = 200) -> HttpResponse:
+        """
+        :return: the json response of the payload, see caching.cache_response to cache it.
+        """
+        return HttpResponse(json_dumps(self.response), status=status, content_type='application/json')
+
+
+_encoder = JSONEncoder()
+
+
+def has_non_finite_number(data) -> bool:
+    """
+    :return: whether the data holds a NaN or an infinity, the decimals included.
+    """
+    if isinstance(data, float):
+        return not math.isfinite(data)
+    if isinstance(data, Decimal):
+        return not data.is_finite()
+    if isinstance(data, dict):
+        return any(has_non_finite_number(value) for value in data.values())
+    if isinstance(data, (list, tuple)):
+        return any(has_non_finite_number(value) for value in data)
+    return False
+
+
+def json_dumps(data) -> bytes:
+    """
+    serializes the data to compact utf-8 json like the rest framework JSONRenderer does, through orjson when it's
+    installed (pip install orjson) and the standard library otherwise. the values orjson doesn't know (decimals, lazy
+    translations...) and the datetimes go through the rest framework encoder so both outputs are the same.
+    :raise ValueError: if the data holds a NaN or an infinity, they aren't json. orjson writes them as null, the data is
+    only searched for them when the output has a null.
+    """
+    if orjson is not None:
+        content = orjson.dumps(data, default=_encoder.default,
+                               option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+        if b'null' in content and has_non_finite_number(data):
+            raise ValueError("Out of range float values are not JSON compliant")
+    else:
+        content = json.dumps(data, cls=JSONEncoder, ensure_ascii=False, allow_nan=False,
+                             separators=(',', ':')).encode()
+    # the line and paragraph separators are escaped so the output is a strict javascript subset.
+    if b'\xe2\x80\xa8' in content or b'\xe2\x80\xa9' in content:
+        content = content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+    return content
+
+
+@lru_cache(maxsize=None)
+def get_resource_name(serializer_class) -> str:
+    """
+    :return: the resource_name of the serializer class Meta, 'objects' by default.
+    """
+    return getattr(getattr(serializer_class, 'Meta', None), 'resource_name', 'objects')
+
 
 class CustomJSONRenderer(JSONRenderer):
     """
@@ -21,24 +88,77 @@ class CustomJSONRenderer(JSONRenderer):
     * adding a resource_name root element to all GET requests formatted with JSON
     * reformatting paginated results to the following structure {meta: {}, resource_name: [{},{}]}
 
-    NB: This solution requires a custom pagination serializer and an attribute of 'resource_name'
-    defined in the serializer
+    NB: The paginated results are expected in the shape of pagination.KeysetPagination and an attribute of
+    'resource_name' defined in the serializer
+    the resource name is read from the serializer class once, and the compact responses are serialized with
+    json_dumps (orjson when it's installed).
     """
 
     def render(self, data, accepted_media_type=None, renderer_context=None):
         response_data = dict()
         # determine the resource name for this request - default to objects if not defined
-        resource = getattr(renderer_context.get('view').get_serializer().Meta, 'resource_name', 'objects')
+        resource = get_resource_name(renderer_context.get('view').get_serializer_class())
 
-        # check if the results have been paginated
-        if data.get('paginated_results'):
+        # check if the results have been paginated, an empty page is still a page.
+        if isinstance(data, dict) and 'paginated_results' in data:
             # add the resource key and copy the results
             response_data['meta'] = data.get('meta')
             response_data[resource] = data.get('paginated_results')
         else:
             response_data[resource] = data
 
+        if self.compact and not self.ensure_ascii and self.get_indent(accepted_media_type, renderer_context) is None:
+            return json_dumps(response_data)
         # call super to render the response
         response = super(CustomJSONRenderer, self).render(response_data, accepted_media_type, renderer_context)
 
         return response
+
+
+def iter_json_envelope(resource: str, items, meta=None):
+    """
+    encodes the {meta: {}, resource: [{},{}]} envelope of CustomJSONRenderer piece by piece.
+    :param resource: the resource name
+    :param items: an iterable of lists of serialized items, each list is encoded at once, or of lists already encoded
+    with json_dumps
+    :param meta: the meta dict, left out if None
+    :return: a generator of bytes
+    """
+    yield b'{'
+    if meta is not None:
+        yield b'"meta":' + json_dumps(meta) + b','
+    yield json_dumps(resource) + b':['
+    separator = b''
+    for chunk in items:
+        content = chunk if isinstance(chunk, bytes) else json_dumps(chunk)
+        if len(content) > 2:
+            yield separator + content[1:-1]
+            separator = b','
+    yield b']}'
+
+
+class StreamingListMixin(object):
+    """
+    list route of a GenericAPIView streaming its {resource: [...]} envelope (see CustomJSONRenderer) instead of
+    rendering the whole list in memory: the rows are read stream_chunk_size at a time with QuerySet.iterator,
+    serialized and sent before the next chunk is read. meant for the large unpaginated lists.
+    the first chunk is read, serialized and encoded before the response starts, so the errors it raises (a failing
+    query, a serializer error, a value json can't hold...) get their error response instead of a truncated 200.
+    """
+    stream_chunk_size = 500
+
+    def iter_serialized(self, queryset):
+        rows = queryset.iterator(chunk_size=self.stream_chunk_size)
+        while True:
+            chunk = list(islice(rows, self.stream_chunk_size))
+            if not chunk:
+                return
+            yield self.get_serializer(chunk, many=True).data
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        resource = get_resource_name(self.get_serializer_class())
+        chunks = self.iter_serialized(queryset)
+        first = json_dumps(next(chunks, []))
+        return StreamingHttpResponse(iter_json_envelope(resource, chain([first], chunks)),
+                                     content_type='application/json')
@@ -0,0 +1,9 @@
+"""
+Signals sent by the base backend.
+"""
+
+from django.dispatch import Signal
+
+# sent once per soft deleted queryset, instead of a post_save per row, with the arguments:
+# sender: the model, pks: the list of the primary keys of the hidden rows, using: the database alias.
+soft_deleted = Signal()
@@ -0,0 +1,68 @@
+"""
+SMS sending, modelled on django's email backends.
+the backend is selected with the SMS_BACKEND setting (a dotted path), the available backends are:
+base_backend.sms.backends.function.SmsBackend: calls the SEND_SMS_FUNC setting, the default.
+base_backend.sms.backends.http.SmsBackend: posts the messages to a gateway over a pooled http session.
+base_backend.sms.backends.console.SmsBackend: writes the messages to the standard output.
+base_backend.sms.backends.locmem.SmsBackend: keeps the messages in base_backend.sms.outbox, for the tests.
+"""
+
+from functools import lru_cache
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+from .. import SETTINGS
+
+# the messages sent by the locmem backend.
+outbox = []
+
+
+class SmsMessage(object):
+    """
+    A single sms.
+    """
+
+    def __init__(self, phone: str, message: str):
+        self.phone = phone
+        self.message = message
+
+    def __repr__(self):
+        return "<SmsMessage to {0}>".format(self.phone)
+
+
+@lru_cache(maxsize=None)
+def get_backend_class(path: str):
+    try:
+        return import_string(path)
+    except ImportError as e:
+        raise ImproperlyConfigured("SMS_BACKEND couldn't be imported: %s" % e)
+
+
+def get_connection(backend=None, fail_silently=False, **kwargs):
+    """
+    returns an instance of the sms backend, SMS_BACKEND is used if the backend's dotted path is not given.
+    """
+    path = backend or SETTINGS.get("SMS_BACKEND", "base_backend.sms.backends.function.SmsBackend")
+    return get_backend_class(path)(fail_silently=fail_silently, **kwargs)
+
+
+def send_sms(phone: str, message: str, connection=None) -> int:
+    """
+    sends a single sms right away.
+    :return: the number of sent messages
+    """
+    connection = connection or get_connection()
+    return connection.send_messages([SmsMessage(phone, message)])
+
+
+def send_mass_sms(messages, connection=None) -> int:
+    """
+    sends many sms over a single connection.
+    :param messages: an iterable of SmsMessage or of (phone, message) tuples
+    :return: the number of sent messages
+    """
+    messages = [message if isinstance(message, SmsMessage) else SmsMessage(*message) for message in messages]
+    connection = connection or get_connection()
+    with connection:
+        return connection.send_messages(messages)
@@ -0,0 +1,85 @@
+"""Base sms backend class."""
+
+import threading
+import time
+
+from ... import SETTINGS
+
+
+class RateLimiter(object):
+    """
+    Token bucket allowing rate messages per second, acquire blocks until a message may be sent.
+    """
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.allowance = rate
+        self.checked_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            self.allowance = min(self.rate, self.allowance + (now - self.checked_at) * self.rate)
+            self.checked_at = now
+            if self.allowance < 1:
+                wait = (1 - self.allowance) / self.rate
+                time.sleep(wait)
+                self.checked_at = time.monotonic()
+                self.allowance = 0
+            else:
+                self.allowance -= 1
+
+
+class BaseSmsBackend(object):
+    """
+    Base class for sms backend implementations.
+    subclasses must implement send_messages, and may override open and close to manage a connection.
+    the rate limit (messages per second, rate_limit argument or SMS_RATE_LIMIT setting) is shared by the instances of
+    a backend class in the process, send_messages implementations call throttle before each message.
+    """
+    limiters = {}
+    limiters_lock = threading.Lock()
+
+    def __init__(self, fail_silently=False, rate_limit=None, **kwargs):
+        self.fail_silently = fail_silently
+        self.rate_limit = rate_limit if rate_limit is not None else SETTINGS.get("SMS_RATE_LIMIT", None)
+
+    def open(self):
+        """
+        opens a connection, returns True if a new one was opened.
+        """
+        pass
+
+    def close(self):
+        """
+        closes the connection.
+        """
+        pass
+
+    def __enter__(self):
+        try:
+            self.open()
+        except Exception:
+            self.close()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def throttle(self):
+        if not self.rate_limit:
+            return
+        with self.limiters_lock:
+            limiter = self.limiters.get(type(self))
+            if limiter is None or limiter.rate != self.rate_limit:
+                limiter = self.limiters[type(self)] = RateLimiter(self.rate_limit)
+        limiter.acquire()
+
+    def send_messages(self, messages) -> int:
+        """
+        sends the SmsMessage list.
+        :return: the number of sent messages
+        """
+        raise NotImplementedError('subclasses of BaseSmsBackend must override send_messages() method')
@@ -0,0 +1,21 @@
+"""Sms backend writing the messages to the console."""
+
+import sys
+import threading
+
+from .base import BaseSmsBackend
+
+
+class SmsBackend(BaseSmsBackend):
+    def __init__(self, *args, stream=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stream = stream or sys.stdout
+        self.lock = threading.RLock()
+
+    def send_messages(self, messages):
+        with self.lock:
+            for message in messages:
+                self.throttle()
+                self.stream.write("To: {0}\n{1}\n{2}\n".format(message.phone, message.message, '-' * 79))
+            self.stream.flush()
+        return len(messages)
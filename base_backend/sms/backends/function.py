@@ -0,0 +1,23 @@
+"""Sms backend calling the SEND_SMS_FUNC setting."""
+
+from ... import get_send_sms_function
+from .base import BaseSmsBackend
+
+
+class SmsBackend(BaseSmsBackend):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.function = get_send_sms_function()
+
+    def send_messages(self, messages):
+        sent = 0
+        for message in messages:
+            self.throttle()
+            try:
+                self.function(phone=message.phone, message=message.message)
+            except Exception:
+                if not self.fail_silently:
+                    raise
+            else:
+                sent += 1
+        return sent
@@ -0,0 +1,74 @@
+"""
+Sms backend posting the messages as json to an http gateway.
+the requests session is shared by the backend instances of the process, so the connections to the gateway are kept
+alive and reused from one sms to the next.
+
+settings:
+SMS_HTTP_URL: the gateway url, required.
+SMS_HTTP_HEADERS: extra headers sent with every request, the credentials usually (default {}).
+SMS_HTTP_TIMEOUT: seconds before a request is abandoned (default 10).
+SMS_HTTP_POOL_SIZE: connections kept open to the gateway (default 10).
+SMS_HTTP_BATCH_SIZE: messages posted per request (default 1), above 1 the payload is {"messages": [...]}.
+override build_payload to match your gateway's format.
+"""
+
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.core.exceptions import ImproperlyConfigured
+
+from ... import SETTINGS
+from .base import BaseSmsBackend
+
+
+class SmsBackend(BaseSmsBackend):
+    session = None
+    session_lock = threading.Lock()
+
+    def __init__(self, *args, url=None, headers=None, timeout=None, batch_size=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.url = url or SETTINGS.get("SMS_HTTP_URL", None)
+        if not self.url:
+            raise ImproperlyConfigured("you are trying to use the http sms backend, but SMS_HTTP_URL is not provided in"
+                                       " the settings.")
+        self.headers = headers or SETTINGS.get("SMS_HTTP_HEADERS", {})
+        self.timeout = timeout or SETTINGS.get("SMS_HTTP_TIMEOUT", 10)
+        self.batch_size = batch_size or SETTINGS.get("SMS_HTTP_BATCH_SIZE", 1)
+
+    @classmethod
+    def get_session(cls):
+        with cls.session_lock:
+            if cls.session is None:
+                pool_size = SETTINGS.get("SMS_HTTP_POOL_SIZE", 10)
+                session = requests.Session()
+                session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+                session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+                cls.session = session
+            return cls.session
+
+    def build_payload(self, messages) -> dict:
+        """
+        the json body posted for the messages, a single message when batch_size is 1.
+        """
+        if self.batch_size == 1:
+            return {'phone': messages[0].phone, 'message': messages[0].message}
+        return {'messages': [{'phone': message.phone, 'message': message.message} for message in messages]}
+
+    def send_messages(self, messages):
+        session = self.get_session()
+        sent = 0
+        for start in range(0, len(messages), self.batch_size):
+            batch = messages[start:start + self.batch_size]
+            for i in range(len(batch)):
+                self.throttle()
+            try:
+                response = session.post(self.url, json=self.build_payload(batch), headers=self.headers,
+                                        timeout=self.timeout)
+                response.raise_for_status()
+            except requests.RequestException:
+                if not self.fail_silently:
+                    raise
+            else:
+                sent += len(batch)
+        return sent
@@ -0,0 +1,77 @@
+"""
+Incremental sync of the base models for the django rest framework: the clients send back the cursor of their last
+sync and only get the rows changed since, the soft deleted rows (see DeletableModel) as tombstones.
+"""
+
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from . import SETTINGS
+from .cursors import InvalidCursor
+
+
+class SyncModelMixin(object):
+    """
+    adds a `changes` list route to a GenericViewSet of a BaseModel:
+        GET .../changes/?cursor=<cursor>&limit=<limit>
+        {"results": [...], "deleted": [pk, ...], "cursor": "...", "has_more": false}
+    results holds the serialized rows created or updated since the cursor, deleted the pks of the rows soft deleted
+    since, cursor is the one of the next sync, the client calls again right away while has_more is true.
+    the changes are read from get_sync_queryset, the view's scoping and filter backends apply.
+    """
+
+    # whether the sync reads the model's all_objects, for the tombstones of the soft deleted rows to be sent.
+    sync_all_objects = False
+
+    def get_sync_base_queryset(self):
+        """
+        the rows of the sync, before the filter backends. the hidden rows of the soft deletable models must be included
+        for their tombstones to be sent: the views syncing all the rows of the model set sync_all_objects, the views
+        scoping get_queryset (per user, per tenant...) override this method with the same scoping on all_objects:
+            def get_sync_base_queryset(self):
+                return Note.all_objects.filter(owner=self.request.user)
+        the view's get_queryset is used as is otherwise.
+        """
+        queryset = self.get_queryset()
+        if not self.sync_all_objects:
+            return queryset
+        manager = getattr(queryset.model, 'all_objects', None)
+        if manager is None:
+            raise ImproperlyConfigured("sync_all_objects requires %s to have an all_objects manager."
+                                       % queryset.model._meta.label)
+        return manager.all()
+
+    def get_sync_queryset(self):
+        """
+        the rows of the sync, see get_sync_base_queryset, the view's filter backends applied.
+        """
+        return self.filter_queryset(self.get_sync_base_queryset())
+
+    def get_sync_limit(self) -> int:
+        limit = SETTINGS.get("SYNC_PAGE_SIZE", 100)
+        if 'limit' in self.request.query_params:
+            try:
+                limit = int(self.request.query_params['limit'])
+            except ValueError:
+                raise ValidationError({'limit': "a positive integer is expected."})
+            if limit <= 0:
+                raise ValidationError({'limit': "a positive integer is expected."})
+        return min(limit, SETTINGS.get("SYNC_MAX_PAGE_SIZE", 1000))
+
+    @action(detail=False, methods=['get'])
+    def changes(self, request, *args, **kwargs):
+        try:
+            changes = self.get_sync_queryset().changes_since(request.query_params.get('cursor') or None,
+                                                             self.get_sync_limit())
+        except InvalidCursor as e:
+            raise ValidationError({'cursor': str(e)})
+        updated = [row for row in changes.rows if getattr(row, 'visible', True)]
+        deleted = [row.pk for row in changes.rows if not getattr(row, 'visible', True)]
+        return Response({
+            'results': self.get_serializer(updated, many=True).data,
+            'deleted': deleted,
+            'cursor': changes.cursor,
+            'has_more': changes.has_more,
+        })
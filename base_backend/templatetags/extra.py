@@ -1,5 +1,7 @@
 from django import template
-from django.contrib.auth.models import Group
+
+from ..authorization import get_authorization, user_has_perm
+from ..ownership import is_owned_by
 
 register = template.Library()
 
@@ -7,24 +9,24 @@ register = template.Library()
 @register.filter(name='has_group')
 def has_group(user, group_name):
     """
-    checks if the user belongs to a group
+    checks if the user belongs to a group, the groups are loaded once per request (see authorization.py).
     :param user:
     :param group_name:
     :return:
     """
-    group = Group.objects.get(name=group_name)
-    return group in user.groups.all()
+    return get_authorization(user).has_group(group_name)
 
 
 @register.filter(name='has_perm')
 def has_perm(user, perm):
     """
-    checks if the user has the perm
+    checks if the user has the perm, the permissions are loaded once per request unless other authentication
+    backends than ModelBackend grant permissions (see authorization.py).
     :param user:
     :param perm: should be of the django's permissions' format <appname.perm_modelname> ex:"recipe.view_recipe"
     :return:
     """
-    return user.has_perm(perm)
+    return user_has_perm(user, perm)
 
 
 @register.filter(name='is_owner')
@@ -33,8 +35,8 @@ def is_owner(request, the_object):
     checks if the current user is the object's owner
     :param request:
     :param the_object: the object must specify an OWNER_FIELD property which will contain the name of the field which
-    refers to the USER object.
+    refers to the USER object, its id is compared so the owner isn't loaded.
     :return:
     """
 
-    return request.user == getattr(the_object, the_object.OWNER_FIELD)
+    return is_owned_by(the_object, request.user)
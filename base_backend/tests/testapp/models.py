@@ -0,0 +1,10 @@
+from django.db import models
+
+from base_backend.models import OwnedModel
+
+
+class OwnedNote(OwnedModel):
+    title = models.CharField(max_length=50)
+
+    class Meta(OwnedModel.Meta):
+        app_label = 'testapp'
@@ -0,0 +1,1577 @@
+import math
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import types
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.exceptions import PermissionDenied
+from django.core.management import call_command
+from django.db import connection, models
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, modify_settings, \
+    override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.request import Request
+from django.utils import timezone
+
+from base_backend import SETTINGS, get_otp_verification_table, get_otp_ttl, get_outbox_table, get_otp_store_class
+from base_backend.checks import check_settings
+from base_backend import geo
+from base_backend import regions
+from base_backend import utils
+from base_backend.authentication_backends import PhoneOrEmailBackend
+from base_backend.decorators import api_login_required_factory
+from base_backend import tokens
+from base_backend.authentication import AccessTokenAuthentication
+from base_backend import messaging
+from base_backend import outbox
+from base_backend import sms
+from base_backend.sms.backends import http as http_sms
+from base_backend.sms.backends.base import RateLimiter
+from base_backend.otp import CacheOtpStore
+
+
+@skipUnless(SETTINGS.get("USE_BASE_BACKEND_OTP_TABLE", False), "requires the base backend otp table.")
+class OtpIssuanceTests(TestCase):
+    def test_issue_otp_code_stores_a_pending_code(self):
+        verification = utils.issue_otp_code('+213799136332')
+
+        self.assertFalse(verification.confirmed)
+        self.assertEqual(get_otp_verification_table().objects.get(otp_code=verification.otp_code).number,
+                         '+213799136332')
+
+    def test_issue_otp_code_retries_on_pending_code_collision(self):
+        codes = iter(['A0000', 'A0000', 'B1111'])
+        with mock.patch.object(utils, 'generate_alphabetic_random_code', lambda: next(codes)):
+            first = utils.issue_otp_code('+213799136332')
+            second = utils.issue_otp_code('+213799136333')
+
+        self.assertEqual(first.otp_code, 'A0000')
+        self.assertEqual(second.otp_code, 'B1111')
+
+    def test_issue_otp_code_reuses_confirmed_codes(self):
+        get_otp_verification_table().objects.create(otp_code='A0000', number='+213799136332', confirmed=True)
+        with mock.patch.object(utils, 'generate_alphabetic_random_code', lambda: 'A0000'):
+            verification = utils.issue_otp_code('+213799136333')
+
+        self.assertEqual(verification.otp_code, 'A0000')
+
+    @skipUnless(get_otp_ttl() is not None, "requires an otp ttl.")
+    def test_issue_otp_code_reclaims_expired_codes(self):
+        table = get_otp_verification_table()
+        expired = table.objects.create(otp_code='AAAAA', number='+213799136332')
+        table.objects.filter(pk=expired.pk).update(created_at=timezone.now() - get_otp_ttl() * 2)
+        with mock.patch.object(utils, 'generate_alphabetic_random_code', lambda: 'AAAAA'):
+            verification = utils.issue_otp_code('+213799136333')
+
+        self.assertEqual(verification.otp_code, 'AAAAA')
+        self.assertFalse(table.objects.filter(pk=expired.pk).exists())
+
+    def test_codes_are_five_capital_letters(self):
+        code = utils.generate_alphabetic_random_code()
+        self.assertEqual(len(code), 5)
+        self.assertTrue(code.isalpha() and code.isupper())
+
+    def test_phone_sms_verification_sends_the_issued_code(self):
+        with mock.patch.object(utils, 'send_sms') as send_sms:
+            utils.phone_sms_verification('+213799136332')
+
+        code = get_otp_verification_table().objects.get(number='+213799136332').otp_code
+        send_sms.assert_called_once()
+        self.assertIn(code, send_sms.call_args[0][1])
+
+
+@skipUnless(SETTINGS.get("USE_BASE_BACKEND_OTP_TABLE", False) and get_otp_ttl() is not None,
+            "requires the base backend otp table with an otp ttl.")
+class OtpExpiryTests(TestCase):
+    def create_verification(self, code, age, **kwargs):
+        verification = get_otp_verification_table().objects.create(otp_code=code, number='+213799136332', **kwargs)
+        get_otp_verification_table().objects.filter(pk=verification.pk).update(created_at=timezone.now() - age)
+        return verification
+
+    def test_expired_codes_are_not_verified(self):
+        self.create_verification('A0000', get_otp_ttl() + timedelta(seconds=1))
+
+        self.assertEqual(utils.verify_sms_code_for_phone_confirmation('A0000'), (False, False))
+
+    def test_live_codes_are_verified(self):
+        self.create_verification('A0000', timedelta(seconds=1))
+
+        self.assertEqual(utils.verify_sms_code_for_phone_confirmation('A0000'), (True, '+213799136332'))
+
+    def test_purge_deletes_only_expired_rows_in_batches(self):
+        for i in range(5):
+            self.create_verification('A000{0}'.format(i), get_otp_ttl() + timedelta(minutes=1))
+        live = self.create_verification('B0000', timedelta(seconds=1))
+
+        out = StringIO()
+        call_command('purge_expired_verifications', batch_size=2, stdout=out)
+
+        self.assertEqual(list(get_otp_verification_table().objects.values_list('pk', flat=True)), [live.pk])
+        self.assertIn('5 expired rows deleted', out.getvalue())
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                       'LOCATION': 'otp-tests'}})
+class CacheOtpStoreTests(SimpleTestCase):
+    def setUp(self):
+        self.store = CacheOtpStore()
+        self.store.cache.clear()
+
+    def test_consume_returns_the_phone_once(self):
+        code = self.store.issue('+213799136332')
+
+        self.assertEqual(self.store.consume(code), '+213799136332')
+        self.assertIsNone(self.store.consume(code))
+
+    def test_issue_skips_reserved_codes(self):
+        codes = iter(['A0000', 'A0000', 'B1111'])
+        with mock.patch('base_backend.otp.generate_alphabetic_random_code', lambda: next(codes)):
+            self.assertEqual(self.store.issue('+213799136332'), 'A0000')
+            self.assertEqual(self.store.issue('+213799136333'), 'B1111')
+
+    def test_resend_returns_the_live_code(self):
+        code = self.store.issue('+213799136332')
+
+        self.assertEqual(self.store.resend('+213799136332'), code)
+
+    def test_resend_issues_a_new_code_once_consumed(self):
+        code = self.store.issue('+213799136332')
+        self.store.consume(code)
+
+        self.assertNotEqual(self.store.resend('+213799136332'), code)
+
+    def test_codes_per_phone_are_limited(self):
+        with mock.patch.dict(SETTINGS, {"OTP_MAX_ATTEMPTS": 2}):
+            self.store.issue('+213799136332')
+            self.store.resend('+213799136332')
+            with self.assertRaises(PermissionDenied):
+                self.store.resend('+213799136332')
+
+    def test_utils_go_through_the_configured_store(self):
+        with override_settings(BASE_BACKEND=dict(SETTINGS, OTP_STORE="base_backend.otp.CacheOtpStore")), \
+                mock.patch.object(utils, 'send_sms') as send_sms:
+            utils.phone_sms_verification('+213799136332')
+            code = send_sms.call_args[0][1].split(':')[1].split(',')[0].strip()
+
+            self.assertEqual(utils.verify_sms_code_for_phone_confirmation(code), (True, '+213799136332'))
+
+
+def uses_base_backend_user_and_otp_tables():
+    return SETTINGS.get("USE_BASE_BACKEND_OTP_TABLE", False) and SETTINGS.get("USE_BASE_BACKEND_USER_MODEL", False)
+
+
+@skipUnless(uses_base_backend_user_and_otp_tables(), "requires the base backend user model and otp table.")
+class ActivateUserOverOtpTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create(username='user', phones=['+213799136332'], user_type='C')
+        get_otp_verification_table().objects.create(otp_code='A0000', number='+213799136332')
+
+    def test_activation_takes_two_statements(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(utils.activate_user_over_otp('A0000'))
+
+        statements = [query['sql'] for query in queries if 'SAVEPOINT' not in query['sql']]
+        self.assertEqual(len(statements), 2, statements)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.is_active)
+
+    def test_code_is_consumed_once(self):
+        self.assertTrue(utils.activate_user_over_otp('A0000'))
+        self.assertFalse(utils.activate_user_over_otp('A0000'))
+
+    def test_code_without_user_stays_pending(self):
+        get_otp_verification_table().objects.create(otp_code='B0000', number='+213799136333')
+
+        self.assertFalse(utils.activate_user_over_otp('B0000'))
+        self.assertFalse(get_otp_verification_table().objects.get(otp_code='B0000').confirmed)
+
+    def test_cached_code_is_only_used_up_on_commit(self):
+        with override_settings(BASE_BACKEND=dict(SETTINGS, OTP_STORE="base_backend.otp.CacheOtpStore")):
+            store = get_otp_store_class()()
+            store.cache.clear()
+            orphan = store.issue('+213799136333')
+            self.assertFalse(utils.activate_user_over_otp(orphan))
+            with mock.patch.object(get_user_model().objects, 'filter', side_effect=RuntimeError):
+                with self.assertRaises(RuntimeError):
+                    utils.activate_user_over_otp(orphan)
+            # the rolled back attempts left the code usable.
+            self.assertEqual(store.consume(orphan), '+213799136333')
+
+            code = store.issue('+213799136332')
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertTrue(utils.activate_user_over_otp(code))
+                # claimed, a concurrent consumer is turned away before the commit.
+                self.assertIsNone(store.consume(code))
+            self.assertIsNone(store.cache.get(store.make_key('code', code)))
+
+    def test_failed_attempt_leaves_the_claim_of_another_request(self):
+        with override_settings(BASE_BACKEND=dict(SETTINGS, OTP_STORE="base_backend.otp.CacheOtpStore")):
+            store = get_otp_store_class()()
+            store.cache.clear()
+            code = store.issue('+213799136333')
+            # claimed by a request whose transaction is still open.
+            self.assertEqual(get_otp_store_class()().consume(code), '+213799136333')
+
+            self.assertFalse(utils.activate_user_over_otp(code))
+            self.assertIsNone(store.consume(code))
+
+
+@skipUnless(uses_base_backend_user_and_otp_tables() and connection.vendor == 'postgresql',
+            "requires the base backend user model and otp table on postgresql.")
+class ConcurrentActivationTests(TransactionTestCase):
+    def test_concurrent_consumers_activate_once(self):
+        get_user_model().objects.create(username='user', phones=['+213799136332'], user_type='C')
+        get_otp_verification_table().objects.create(otp_code='A0000', number='+213799136332')
+        barrier = threading.Barrier(8)
+        results = []
+
+        def consume():
+            barrier.wait()
+            try:
+                results.append(utils.activate_user_over_otp('A0000'))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=consume) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(results), [False] * 7 + [True])
+
+
+@skipUnless(SETTINGS.get("USE_BASE_BACKEND_USER_MODEL", False), "requires the base backend user model.")
+class PhoneOrEmailBackendTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create(username='user', email='User@Example.com', is_active=True,
+                                                    phones=['+213 799-136-332', '+213799136333'], user_type='C')
+        self.user.set_password('password')
+        self.user.save()
+
+    def test_phones_are_stored_normalized(self):
+        self.user.refresh_from_db()
+
+        self.assertEqual(self.user.phones, ['+213799136332', '+213799136333'])
+
+    def test_authenticate_with_any_phone(self):
+        backend = PhoneOrEmailBackend()
+
+        self.assertEqual(backend.authenticate(None, '+213799136333', 'password'), self.user)
+        self.assertEqual(backend.authenticate(None, '+213 799 136 332', 'password'), self.user)
+
+    def test_authenticate_with_case_insensitive_email(self):
+        self.assertEqual(PhoneOrEmailBackend().authenticate(None, 'user@example.COM', 'password'), self.user)
+
+    def test_authenticate_rejects_wrong_password(self):
+        self.assertIsNone(PhoneOrEmailBackend().authenticate(None, '+213799136333', 'wrong'))
+
+
+@skipUnless(SETTINGS.get("USE_BASE_BACKEND_ACCESS_TOKEN_TABLE", False), "requires the base backend access token table.")
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                       'LOCATION': 'token-tests'}})
+class AccessTokenTests(TestCase):
+    def setUp(self):
+        tokens.get_local_tokens().clear()
+        tokens.get_tokens_cache().clear()
+        tokens.get_token_uses().flushed_at = time.monotonic()
+        self.user = get_user_model().objects.create(username='user', phones=['+213799136332'], user_type='C',
+                                                    is_active=True)
+        self.token = tokens.create_access_token(self.user)
+        self.view = api_login_required_factory()(lambda request: HttpResponse(request.user.pk))
+
+    def test_tokens_are_stored_hashed(self):
+        self.assertFalse(self.user.access_tokens.filter(key=self.token).exists())
+        self.assertTrue(self.user.access_tokens.filter(key=tokens.hash_token(self.token)).exists())
+
+    def test_hot_tokens_only_load_the_user(self):
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION='Bearer ' + self.token)
+        self.view(request)
+
+        with self.assertNumQueries(1):
+            response = self.view(RequestFactory().get('/', HTTP_AUTHORIZATION=self.token))
+
+        self.assertEqual(response.content, str(self.user.pk).encode())
+
+    def test_tokens_are_shared_through_the_cache(self):
+        tokens.resolve_access_token(self.token)
+        tokens.get_local_tokens().clear()
+
+        with self.assertNumQueries(1):
+            self.assertEqual(tokens.resolve_access_token(self.token), self.user)
+
+    def test_deactivated_and_deleted_users_are_rejected_right_away(self):
+        tokens.resolve_access_token(self.token)
+        get_user_model().objects.filter(pk=self.user.pk).update(is_active=False)
+        with self.assertRaises(PermissionDenied):
+            self.view(RequestFactory().get('/', HTTP_AUTHORIZATION=self.token))
+
+        get_user_model().all_objects.filter(pk=self.user.pk).update(is_active=True, visible=False)
+        self.assertIsNone(tokens.resolve_access_token(self.token))
+
+    def test_keyword_without_token_is_rejected(self):
+        with self.assertRaises(PermissionDenied):
+            self.view(RequestFactory().get('/', HTTP_AUTHORIZATION='Bearer'))
+        with self.assertRaises(PermissionDenied):
+            self.view(RequestFactory().get('/', HTTP_AUTHORIZATION='Bearer %s extra' % self.token))
+
+    def test_revoked_tokens_are_rejected(self):
+        tokens.resolve_access_token(self.token)
+        tokens.revoke_access_token(self.token)
+
+        with self.assertRaises(PermissionDenied):
+            self.view(RequestFactory().get('/', HTTP_AUTHORIZATION=self.token))
+
+    def test_unknown_tokens_are_rejected(self):
+        with self.assertRaises(PermissionDenied):
+            self.view(RequestFactory().get('/', HTTP_AUTHORIZATION='unknown'))
+
+
+@skipUnless(SETTINGS.get("USE_BASE_BACKEND_ACCESS_TOKEN_TABLE", False), "requires the base backend access token table.")
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                       'LOCATION': 'token-tests'}})
+class AccessTokenAuthenticationTests(TestCase):
+    def setUp(self):
+        tokens.get_local_tokens().clear()
+        tokens.get_tokens_cache().clear()
+        tokens.get_token_uses().flush()
+        self.user = get_user_model().objects.create(username='user', phones=['+213799136332'], user_type='C',
+                                                    is_active=True)
+        self.token = tokens.create_access_token(self.user)
+
+    def authenticate(self, token):
+        request = Request(RequestFactory().get('/', HTTP_AUTHORIZATION='Bearer ' + token))
+        return AccessTokenAuthentication().authenticate(request)
+
+    def test_authenticate_returns_the_user_and_token(self):
+        user, access_token = self.authenticate(self.token)
+
+        self.assertEqual(user, self.user)
+        self.assertEqual(access_token.key, tokens.hash_token(self.token))
+
+    def test_other_keywords_are_ignored(self):
+        request = Request(RequestFactory().get('/', HTTP_AUTHORIZATION='Basic ' + self.token))
+
+        self.assertIsNone(AccessTokenAuthentication().authenticate(request))
+
+    def test_expired_tokens_are_rejected(self):
+        with mock.patch.dict(SETTINGS, {"ACCESS_TOKEN_LIFETIME": -1}):
+            token = tokens.create_access_token(self.user)
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+
+    def test_rotation_replaces_the_token(self):
+        new_token = tokens.rotate_access_token(self.token)
+
+        self.assertEqual(self.authenticate(new_token)[0], self.user)
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(self.token)
+
+    def test_last_use_is_written_in_batches(self):
+        self.authenticate(self.token)
+        # the user's primary key lookups only, the last use isn't written.
+        with self.assertNumQueries(10):
+            for i in range(10):
+                self.authenticate(self.token)
+        with self.assertNumQueries(1):
+            tokens.get_token_uses().flush()
+
+        self.assertIsNotNone(self.user.access_tokens.get().last_used_at)
+
+    def test_caches_follow_the_settings(self):
+        tokens.get_token_uses().record(-1)
+        with override_settings(BASE_BACKEND=dict(SETTINGS, ACCESS_TOKEN_LRU_SIZE=3,
+                                                 ACCESS_TOKEN_LAST_USED_FLUSH_INTERVAL=600)):
+            self.assertEqual(tokens.get_local_tokens().max_size, 3)
+            self.assertEqual(tokens.get_token_uses().interval, 600)
+            self.assertIn(-1, tokens.get_token_uses().used)
+        self.assertEqual(tokens.get_local_tokens().max_size, SETTINGS.get("ACCESS_TOKEN_LRU_SIZE", 1024))
+
+    def test_last_use_is_flushed_outside_the_request(self):
+        uses = tokens.TokenUses(0)
+        with mock.patch.object(tokens.threading, 'Thread') as thread, self.assertNumQueries(0):
+            uses.record(1)
+            uses.record(2)
+        thread.assert_called_once_with(target=uses.flush_in_background, daemon=True)
+        self.assertEqual(uses.used, {1, 2})
+        self.assertTrue(uses.flushing)
+
+    def test_inactive_users_are_rejected(self):
+        self.authenticate(self.token)
+        get_user_model().objects.filter(pk=self.user.pk).update(is_active=False)
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(self.token)
+
+
+class FakeUnregisteredError(Exception):
+    pass
+
+
+def fake_firebase_messaging(sent):
+    """
+    a stand-in for firebase_admin.messaging, tokens starting with 'dead' are reported as unregistered, the batches
+    holding a token starting with 'broken' fail as a whole.
+    """
+
+    def send_each_for_multicast(msg):
+        sent.append(list(msg.tokens))
+        if any(token.startswith('broken') for token in msg.tokens):
+            raise ConnectionError('firebase is unreachable')
+        return types.SimpleNamespace(responses=[
+            types.SimpleNamespace(success=False, message_id=None, exception=FakeUnregisteredError())
+            if token.startswith('dead') else
+            types.SimpleNamespace(success=True, message_id='id-' + token, exception=None)
+            for token in msg.tokens
+        ])
+
+    return types.SimpleNamespace(
+        MulticastMessage=lambda data, tokens: types.SimpleNamespace(data=data, tokens=tokens),
+        send_each_for_multicast=send_each_for_multicast,
+        UnregisteredError=FakeUnregisteredError,
+    )
+
+
+@skipUnless(SETTINGS.get("USE_BASE_BACKEND_USER_MODEL", False), "requires the base backend user model.")
+class NotifyUsersTests(TestCase):
+    def setUp(self):
+        self.sent = []
+        fake = fake_firebase_messaging(self.sent)
+        patcher = mock.patch.object(messaging, 'get_firebase_messaging', lambda: fake)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_tokens_are_sent_in_multicast_batches(self):
+        tokens = ['token-{0}'.format(i) for i in range(1200)]
+
+        results = messaging.notify_users(tokens, {'title': 'title', 'message': 'message'})
+
+        self.assertEqual(sorted(len(batch) for batch in self.sent), [200, 500, 500])
+        self.assertEqual(results['token-7'], 'id-token-7')
+        self.assertEqual(len(results), 1200)
+
+    def test_unregistered_tokens_are_pruned(self):
+        alive = get_user_model().objects.create(username='alive', phones=['+213799136332'], user_type='C',
+                                                notification_token='token-alive')
+        dead = get_user_model().objects.create(username='dead', phones=['+213799136333'], user_type='C',
+                                               notification_token='dead-token')
+
+        results = messaging.notify_users(get_user_model().objects.all(), {'title': 'title', 'message': 'message'},
+                                         batch_size=1)
+
+        self.assertIsInstance(results['dead-token'], FakeUnregisteredError)
+        alive.refresh_from_db()
+        dead.refresh_from_db()
+        self.assertEqual(alive.notification_token, 'token-alive')
+        self.assertIsNone(dead.notification_token)
+
+    def test_failed_batches_dont_stop_the_others(self):
+        dead = get_user_model().objects.create(username='dead', phones=['+213799136333'], user_type='C',
+                                               notification_token='dead-token')
+
+        with self.assertLogs('base_backend.messaging', 'ERROR'):
+            results = messaging.notify_users(['token-1', 'broken-token', 'dead-token', 'token-2'],
+                                             {'title': 'title', 'message': 'message'}, batch_size=1)
+
+        self.assertIsInstance(results['broken-token'], ConnectionError)
+        self.assertEqual((results['token-1'], results['token-2']), ('id-token-1', 'id-token-2'))
+        dead.refresh_from_db()
+        self.assertIsNone(dead.notification_token)
+
+
+@skipUnless(SETTINGS.get("USE_BASE_BACKEND_OUTBOX_TABLE", False), "requires the base backend outbox table.")
+class OutboxTests(TestCase):
+    def test_send_sms_costs_one_insert(self):
+        with self.assertNumQueries(1), mock.patch.object(utils, 'deliver_sms') as deliver_sms:
+            utils.send_sms('+213799136332', 'message')
+
+        deliver_sms.assert_not_called()
+        self.assertEqual(get_outbox_table().objects.get().payload, {'phone': '+213799136332', 'message': 'message'})
+
+    def test_drain_delivers_and_deletes_the_messages(self):
+        utils.send_sms('+213799136332', 'message')
+        utils.send_email('subject', 'user@example.com', 'message')
+
+        with mock.patch.object(utils, 'deliver_sms') as deliver_sms, \
+                mock.patch.object(utils, 'deliver_email') as deliver_email:
+            call_command('drain_outbox', once=True, stdout=StringIO())
+
+        deliver_sms.assert_called_once_with(phone='+213799136332', message='message')
+        deliver_email.assert_called_once_with(subject='subject', email='user@example.com', message='message')
+        self.assertFalse(get_outbox_table().objects.exists())
+
+    def test_failed_deliveries_are_retried_later_then_dead_lettered(self):
+        utils.send_sms('+213799136332', 'message')
+        table = get_outbox_table()
+
+        with mock.patch.object(utils, 'deliver_sms', side_effect=ConnectionError), \
+                mock.patch.dict(SETTINGS, {"OUTBOX_MAX_ATTEMPTS": 2}):
+            self.assertEqual(outbox.process(), 1)
+            message = table.objects.get()
+            self.assertEqual((message.status, message.attempts), (table.PENDING, 1))
+            self.assertGreater(message.available_at, timezone.now())
+            self.assertEqual(outbox.process(), 0)
+
+            table.objects.update(available_at=timezone.now())
+            outbox.process()
+
+        message = table.objects.get()
+        self.assertEqual((message.status, message.attempts), (table.DEAD, 2))
+        self.assertIn('ConnectionError', message.last_error)
+
+
+@mock.patch.dict(SETTINGS, {"SMS_BACKEND": "base_backend.sms.backends.locmem.SmsBackend",
+                            "USE_BASE_BACKEND_OUTBOX_TABLE": False})
+class SmsBackendTests(SimpleTestCase):
+    def setUp(self):
+        sms.outbox.clear()
+
+    def test_send_sms_goes_through_the_configured_backend(self):
+        utils.send_sms('+213799136332', 'message')
+
+        self.assertEqual([(message.phone, message.message) for message in sms.outbox], [('+213799136332', 'message')])
+
+    def test_send_mass_sms_uses_a_single_connection(self):
+        self.assertEqual(sms.send_mass_sms([('+213799136332', 'first'), ('+213799136333', 'second')]), 2)
+        self.assertEqual(len(sms.outbox), 2)
+
+    def test_http_backend_reuses_the_pooled_session(self):
+        session = mock.Mock()
+        with mock.patch.object(http_sms.SmsBackend, 'session', session):
+            backend = sms.get_connection('base_backend.sms.backends.http.SmsBackend', url='https://sms.example.com',
+                                         batch_size=2)
+            sent = backend.send_messages([sms.SmsMessage('+213799136332', 'first'),
+                                          sms.SmsMessage('+213799136333', 'second'),
+                                          sms.SmsMessage('+213799136334', 'third')])
+
+        self.assertEqual(sent, 3)
+        self.assertEqual(session.post.call_count, 2)
+        self.assertEqual(len(session.post.call_args_list[0][1]['json']['messages']), 2)
+
+    def test_rate_limiter_spaces_the_messages(self):
+        limiter = RateLimiter(100)
+        started = time.monotonic()
+        for i in range(110):
+            limiter.acquire()
+
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
+
+
+class SettingsTests(SimpleTestCase):
+    def test_resolvers_are_memoized(self):
+        get_otp_store_class()
+        with mock.patch('base_backend.import_string') as import_string:
+            get_otp_store_class()
+
+        import_string.assert_not_called()
+
+    def test_settings_are_reloaded_when_they_change(self):
+        with override_settings(BASE_BACKEND=dict(SETTINGS, OTP_STORE="base_backend.otp.CacheOtpStore",
+                                                 OTP_TTL=60)):
+            self.assertIs(get_otp_store_class(), CacheOtpStore)
+            self.assertEqual(get_otp_ttl(), timedelta(seconds=60))
+
+        self.assertEqual(SETTINGS.get("OTP_TTL", None), getattr(settings, 'BASE_BACKEND', {}).get("OTP_TTL", None))
+
+    def test_check_reports_invalid_settings(self):
+        with override_settings(BASE_BACKEND={"OTP_TTL": -1, "OTP_STORE": "base_backend.otp.Missing", "OTP_TLL": 60,
+                                             "PASSWORD_RESET_TABLE": "missing"}):
+            ids = sorted(message.id for message in check_settings())
+
+        self.assertEqual(ids, ['base_backend.E001', 'base_backend.E002', 'base_backend.E003', 'base_backend.W001'])
+
+    def test_check_accepts_the_current_settings(self):
+        self.assertEqual(check_settings(), [])
+
+
+class ImportTimeTests(SimpleTestCase):
+    # the time, in microseconds, the base_backend modules may spend importing themselves.
+    IMPORT_TIME_BUDGET = 100000
+    HEAVY_MODULES = ('firebase_admin', 'requests')
+
+    def test_imports_stay_light(self):
+        script = ("import sys, django; django.setup(); "
+                  "import base_backend.utils, base_backend.messaging, base_backend.authentication_backends, "
+                  "base_backend.decorators, base_backend.otp, base_backend.sms; "
+                  "print(','.join(name for name in {0!r} if name in sys.modules))").format(self.HEAVY_MODULES)
+        process = subprocess.run([sys.executable, '-X', 'importtime', '-c', script], env=os.environ,
+                                 capture_output=True, text=True, check=True)
+
+        self.assertEqual(process.stdout.strip(), '', "heavy optional modules were imported at startup.")
+        own_time = 0
+        for line in process.stderr.splitlines():
+            # import time: self [us] | cumulative | imported package
+            parts = line.split('|')
+            if line.startswith('import time:') and parts[-1].strip().startswith('base_backend'):
+                own_time += int(parts[0].split(':')[1])
+        self.assertLess(own_time, self.IMPORT_TIME_BUDGET)
+
+    def test_templatetags_dont_need_rest_framework(self):
+        script = ("import sys, django; django.setup(); import base_backend.templatetags.extra; "
+                  "print('rest_framework' in sys.modules)")
+        process = subprocess.run([sys.executable, '-c', script], env=os.environ, capture_output=True, text=True,
+                                 check=True)
+        self.assertEqual(process.stdout.strip(), 'False')
+
+
+@skipUnless(SETTINGS.get("USE_BASE_BACKEND_REGIONS", False), "requires the base backend regions tables.")
+class LoadBaseRegionsTests(TestCase):
+    def test_states_and_cities_are_loaded_and_updated(self):
+        from base_backend.models import City, State
+        out = StringIO()
+        call_command('load_base_regions', stdout=out)
+        City.objects.filter(code_postal=1001).update(name='changed')
+        call_command('load_base_regions', stdout=out)
+
+        self.assertEqual(State.objects.count(), 48)
+        self.assertEqual(City.objects.count(), 1541)
+        adrar = City.objects.select_related('state').get(code_postal=1001)
+        self.assertEqual((adrar.name, adrar.name_ar, adrar.code_postal, adrar.state.name),
+                         ('Adrar', 'أدرار', 1001, 'Adrar'))
+        self.assertEqual(State.objects.get(matricule=16).code_postal, 16000)
+        self.assertIn('48 states and 1541 cities loaded', out.getvalue())
+
+    def test_loaded_cities_keep_their_ids(self):
+        from base_backend.models import City
+        call_command('load_base_regions', stdout=StringIO())
+        ids = dict(City.objects.values_list('code_postal', 'pk'))
+        # a city loaded by an older version of the command, under another id.
+        City.objects.filter(code_postal=1001).update(id=10000)
+        call_command('load_base_regions', stdout=StringIO())
+
+        self.assertEqual(City.objects.count(), 1541)
+        self.assertEqual(City.objects.get(code_postal=1001).pk, 10000)
+        self.assertEqual(City.objects.get(code_postal=16001).pk, ids[16001])
+
+
+class GeoIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.random = random.Random(42)
+        self.points = [(i, i % 48 + 1, self.random.uniform(19, 37), self.random.uniform(-9, 12))
+                       for i in range(1, 2000)]
+        self.index = geo.GeoIndex(self.points)
+
+    @staticmethod
+    def haversine(latitude, longitude, other_latitude, other_longitude):
+        latitude, longitude, other_latitude, other_longitude = map(math.radians, (latitude, longitude,
+                                                                                  other_latitude, other_longitude))
+        a = math.sin((other_latitude - latitude) / 2) ** 2 + \
+            math.cos(latitude) * math.cos(other_latitude) * math.sin((other_longitude - longitude) / 2) ** 2
+        return 2 * geo.EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+    def test_nearest_matches_a_linear_scan(self):
+        for i in range(200):
+            latitude, longitude = self.random.uniform(18, 38), self.random.uniform(-10, 13)
+            expected = min(self.points, key=lambda point: self.haversine(latitude, longitude, point[2], point[3]))
+
+            match = self.index.nearest(latitude, longitude)
+
+            self.assertEqual((match.city_id, match.state_id), (expected[0], expected[1]))
+            self.assertAlmostEqual(match.distance, self.haversine(latitude, longitude, expected[2], expected[3]),
+                                   places=6)
+
+    def test_within_matches_a_linear_scan(self):
+        for i in range(50):
+            latitude, longitude = self.random.uniform(18, 38), self.random.uniform(-10, 13)
+            expected = sorted(point[0] for point in self.points
+                              if self.haversine(latitude, longitude, point[2], point[3]) <= 150)
+
+            matches = self.index.within(latitude, longitude, 150)
+
+            self.assertEqual(sorted(match.city_id for match in matches), expected)
+            self.assertEqual([match.distance for match in matches], sorted(match.distance for match in matches))
+
+    def test_empty_index(self):
+        self.assertIsNone(geo.GeoIndex([]).nearest(36.75, 3.05))
+        self.assertEqual(geo.GeoIndex([]).within(36.75, 3.05, 10), [])
+
+
+@skipUnless(SETTINGS.get("USE_BASE_BACKEND_REGIONS", False), "requires the base backend regions tables.")
+class NearestCityTests(TestCase):
+    def setUp(self):
+        call_command('load_base_regions', stdout=StringIO())
+        geo.reset_city_index()
+
+    def test_nearest_city_and_state(self):
+        from base_backend.models import City
+        # Algiers' main post office.
+        match = geo.nearest_city(36.7731, 3.0597)
+
+        self.assertEqual(match.state_id, 16)
+        self.assertEqual(geo.nearest_state(36.7731, 3.0597), 16)
+        self.assertLess(match.distance, 5)
+        self.assertTrue(City.objects.filter(pk=match.city_id, state_id=16).exists())
+
+    def test_index_is_dropped_when_a_city_changes(self):
+        from base_backend.models import City
+        geo.nearest_city(36.7731, 3.0597)
+        city = City.objects.get(pk=1)
+        city.latitude, city.longitude = 36.7731, 3.0597
+        city.save()
+
+        self.assertEqual(geo.nearest_city(36.7731, 3.0597).city_id, 1)
+
+
+@skipUnless(SETTINGS.get("USE_BASE_BACKEND_REGIONS", False), "requires the base backend regions tables.")
+class ReferenceDataTests(TestCase):
+    def setUp(self):
+        call_command('load_base_regions', stdout=StringIO())
+
+    def test_lookups_are_answered_from_the_cache(self):
+        regions.get_reference_data()
+        with self.assertNumQueries(0):
+            algiers = regions.get_state_by_postal_code(16000)
+            adrar = regions.get_city(1)
+            self.assertEqual((algiers.matricule, algiers.region_id), (16, 1))
+            self.assertIn(algiers.id, regions.get_region(1).state_ids)
+            self.assertEqual((adrar.name, adrar.localized_name('ar'), adrar.localized_name('fr')),
+                             ('Adrar', 'أدرار', 'Adrar'))
+            self.assertIn(adrar, regions.get_cities_by_postal_code(1001))
+            self.assertIn(adrar, regions.find_cities('ADRAR'))
+            self.assertIn(adrar, regions.find_cities('أدرار'))
+            self.assertEqual(len(regions.city_choices()), 1541)
+            self.assertEqual(regions.city_choices(state_id=1)[0], (1, 'Adrar'))
+            self.assertEqual(len(regions.state_choices(region_id=1)), 48)
+
+    def test_cache_is_dropped_when_a_city_changes(self):
+        from base_backend.models import City
+        regions.get_reference_data()
+        city = City.objects.get(pk=1)
+        city.name = 'changed'
+        city.save()
+
+        self.assertEqual(regions.get_city(1).name, 'changed')
+
+    def test_other_processes_reload_once_the_change_commits(self):
+        from base_backend.models import City
+        regions.get_reference_data()
+        version = regions.get_version()
+        city = City.objects.get(pk=1)
+        city.name = 'changed'
+        with self.captureOnCommitCallbacks(execute=True):
+            city.save()
+
+        self.assertNotEqual(regions.get_version(), version)
+
+    def test_copy_is_reloaded_when_the_version_moves(self):
+        from base_backend.models import City
+        regions.get_reference_data()
+        # written by another process, no signal is received here.
+        City.objects.filter(pk=1).update(name='changed')
+        with mock.patch.dict(SETTINGS, {"REFERENCE_DATA_CHECK_INTERVAL": 0}):
+            with self.assertNumQueries(0):
+                self.assertEqual(regions.get_city(1).name, 'Adrar')
+            regions.bump_version()
+
+            self.assertEqual(regions.get_city(1).name, 'changed')
+
+    def test_city_field_renders_without_queries(self):
+        from base_backend.forms import ProfileForm
+        regions.get_reference_data()
+        form = ProfileForm()
+
+        with self.assertNumQueries(0):
+            html = str(form['city'])
+
+        self.assertEqual(html.count('<option'), 1542)
+        self.assertEqual(form.fields['city'].clean('1').pk, 1)
+
+
+class NormalizeTextTests(SimpleTestCase):
+    def test_accents_case_and_arabic_variants_are_folded(self):
+        from base_backend.text_utils import normalize_text
+        self.assertEqual(normalize_text("Aïn-Témouchent"), 'ain temouchent')
+        self.assertEqual(normalize_text('  BÉJAÏA '), 'bejaia')
+        self.assertEqual(normalize_text('الجَزائِر'), normalize_text('الجزائر'))
+        self.assertEqual(normalize_text('أدرار'), normalize_text('ادرار'))
+        self.assertEqual(normalize_text('عين الصفراء'), normalize_text('عين الصفرـــاء'))
+        self.assertEqual(normalize_text('مدينة'), normalize_text('مدينه'))
+
+
+@skipUnless(SETTINGS.get("USE_BASE_BACKEND_REGIONS", False), "requires the base backend regions tables.")
+class SearchPlacesTests(TestCase):
+    def setUp(self):
+        call_command('load_base_regions', stdout=StringIO())
+
+    def test_prefixes_are_matched_in_every_language(self):
+        regions.get_search_index()
+        with self.assertNumQueries(0):
+            self.assertEqual(regions.search_places('Adrar', kinds=('city',))[0].place.id, 1)
+            self.assertEqual(regions.search_places('adr', kinds=('city',))[0].place.name, 'Adrar')
+            self.assertEqual(regions.search_places('ادرا', kinds=('city',))[0].place.name, 'Adrar')
+            self.assertEqual(regions.search_places('bejai', kinds=('state',))[0].place.matricule, 6)
+            self.assertTrue(all(match.place.state_id == 16 for match in regions.search_places('bab el ou', limit=1)))
+
+    def test_exact_names_rank_first_and_typos_are_tolerated(self):
+        matches = regions.search_places('Alger')
+        self.assertEqual(matches[0].score, regions.EXACT_SCORE)
+        self.assertEqual([match.score for match in matches], sorted((match.score for match in matches), reverse=True))
+        self.assertEqual(regions.search_places('Tamanrasset', kinds=('state',))[0].place.id,
+                         regions.search_places('Tamanraset', kinds=('state',))[0].place.id)
+
+    def test_keystrokes_are_answered_under_a_millisecond(self):
+        regions.get_search_index()
+        queries = [prefix[:length] for prefix in ('constantine', 'oran', 'tizi ouzou', 'قسنطينة', 'boumerdes')
+                   for length in range(1, len(prefix) + 1)]
+        started = time.perf_counter()
+        for query in queries:
+            regions.search_places(query)
+        self.assertLess((time.perf_counter() - started) / len(queries), 0.001)
+
+    def test_index_is_rebuilt_with_the_reference_data(self):
+        from base_backend.models import City
+        index = regions.get_search_index()
+        City.objects.filter(pk=1).update(name='Zzyzx')
+        regions.reset_reference_data()
+
+        self.assertIsNot(regions.get_search_index(), index)
+        self.assertEqual(regions.search_places('zzyz')[0].place.id, 1)
+
+    def test_database_search_uses_the_trigram_operator(self):
+        from base_backend.models import City
+        sql = str(regions.search_queryset(City.objects.all(), 'adrar').query)
+        self.assertIn(' % ', sql)
+        self.assertIn('SIMILARITY(', sql.upper())
+
+
+@skipUnless(SETTINGS.get("USE_BASE_BACKEND_USER_MODEL", False) and
+            SETTINGS.get("USE_BASE_BACKEND_PROFILE_MODEL", False), "requires the base backend user and profile models.")
+class SoftDeleteTests(TestCase):
+    def setUp(self):
+        from base_backend.models import Profile
+        self.users = [get_user_model().objects.create(username='user%d' % i, phones=['+21379913633%d' % i],
+                                                      user_type='C', is_active=True) for i in range(3)]
+        self.profiles = [Profile.objects.create(user=user, address='address') for user in self.users]
+
+    @skipUnless(connection.vendor == 'postgresql', "UPDATE ... RETURNING is only used on postgresql.")
+    def test_update_returning(self):
+        from base_backend.models import Profile
+        joined = Profile.objects.filter(user__username__in=['user1', 'user2'])
+        with self.assertNumQueries(1):
+            pks = utils.update_returning(joined, {'address': 'moved'}, 'id')
+
+        self.assertEqual(sorted(pks), [self.profiles[1].pk, self.profiles[2].pk])
+        self.assertEqual(Profile.objects.filter(address='moved').count(), 2)
+        with self.assertNumQueries(0):
+            self.assertEqual(utils.update_returning(Profile.objects.none(), {'address': 'x'}, 'id'), [])
+
+    def test_soft_delete_falls_back_on_the_other_databases(self):
+        from base_backend.models import Profile
+        with mock.patch.object(connection, 'vendor', 'sqlite'):
+            self.assertIsNone(utils.update_returning(Profile.objects.all(), {'address': 'x'}, 'id'))
+            self.assertEqual(Profile.objects.filter(user=self.users[0]).delete(), (1, {'base_backend.Profile': 1}))
+
+        self.assertFalse(Profile.all_objects.filter(address='x').exists())
+        self.assertFalse(Profile.all_objects.get(user=self.users[0]).visible)
+
+    def test_default_managers_leave_the_hidden_rows_out(self):
+        from base_backend.models import Profile
+        self.users[0].delete()
+
+        self.assertEqual(get_user_model().objects.count(), 2)
+        self.assertEqual(get_user_model().all_objects.count(), 3)
+        self.assertEqual(get_user_model()._default_manager.filter(pk=self.users[0].pk).count(), 0)
+        self.assertFalse(Profile.objects.filter(user=self.users[0]).exists())
+        self.assertFalse(Profile.all_objects.get(user=self.users[0]).visible)
+        self.assertEqual(Profile.objects.count(), 2)
+
+    def test_queryset_soft_delete_cascades_to_the_profiles(self):
+        from base_backend.models import Profile
+        before = Profile.objects.get(pk=self.profiles[0].pk).updated_at
+
+        with self.assertNumQueries(2):
+            hidden = get_user_model().objects.filter(pk__in=[self.users[0].pk, self.users[1].pk]).soft_delete()
+
+        self.assertEqual(hidden, 2)
+        self.assertEqual(list(get_user_model().objects.values_list('pk', flat=True)), [self.users[2].pk])
+        self.assertFalse(get_user_model().all_objects.filter(pk=self.users[0].pk, is_active=True).exists())
+        self.assertEqual(list(Profile.objects.values_list('pk', flat=True)), [self.profiles[2].pk])
+        self.assertGreater(Profile.all_objects.get(pk=self.profiles[0].pk).updated_at, before)
+
+    def test_instance_delete_only_updates_the_soft_delete_columns(self):
+        from django.db.models.signals import post_save
+        from base_backend.models import Profile
+        user = self.users[0]
+        user.first_name = 'unsaved'
+        saved = mock.Mock()
+        post_save.connect(saved, sender=get_user_model())
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                user.delete()
+        finally:
+            post_save.disconnect(saved, sender=get_user_model())
+
+        updates = [query['sql'] for query in queries.captured_queries]
+        self.assertEqual(len(updates), 2)
+        self.assertTrue(updates[0].startswith('UPDATE "base_backend_profile" SET "visible" = false, "updated_at"'))
+        self.assertTrue(updates[1].startswith('UPDATE "base_backend_user" SET "visible" = false, "is_active" = false '
+                                              'WHERE'))
+        saved.assert_not_called()
+        self.assertEqual(get_user_model().all_objects.get(pk=user.pk).first_name, '')
+        self.assertFalse(Profile.all_objects.get(user=user).visible)
+
+    def test_queryset_delete_is_soft_and_sends_one_signal_per_model(self):
+        from base_backend.models import Profile
+        from base_backend.signals import soft_deleted
+        received = []
+
+        def receiver(sender, pks, using, **kwargs):
+            received.append((sender, sorted(pks)))
+
+        soft_deleted.connect(receiver)
+        try:
+            with self.assertNumQueries(2):
+                result = get_user_model().objects.filter(user_type='C').delete()
+            # the hidden rows aren't hidden again.
+            with self.assertNumQueries(2):
+                get_user_model().all_objects.filter(user_type='C').delete()
+        finally:
+            soft_deleted.disconnect(receiver)
+
+        self.assertEqual(result, (3, {get_user_model()._meta.label: 3}))
+        self.assertEqual(received, [(Profile, sorted(profile.pk for profile in self.profiles)),
+                                    (get_user_model(), sorted(user.pk for user in self.users))])
+        self.assertEqual(get_user_model().all_objects.count(), 3)
+
+    def test_hard_delete(self):
+        from base_backend.models import Profile
+        Profile.objects.filter(pk=self.profiles[0].pk).hard_delete()
+
+        self.assertFalse(Profile.all_objects.filter(pk=self.profiles[0].pk).exists())
+
+
+@skipUnless(SETTINGS.get("USE_BASE_BACKEND_USER_MODEL", False) and
+            SETTINGS.get("USE_BASE_BACKEND_PROFILE_MODEL", False), "requires the base backend user and profile models.")
+class SyncTests(TestCase):
+    def setUp(self):
+        from base_backend.models import Profile
+        self.users = [get_user_model().objects.create(username='user%d' % i, phones=['+21379913633%d' % i],
+                                                      user_type='C') for i in range(5)]
+        self.profiles = [Profile.objects.create(user=user, address='address %d' % i)
+                         for i, user in enumerate(self.users)]
+
+    def make_view(self):
+        from rest_framework import serializers, viewsets
+        from base_backend.models import Profile
+        from base_backend.sync import SyncModelMixin
+
+        class ProfileSerializer(serializers.ModelSerializer):
+            class Meta:
+                model = Profile
+                fields = ['id', 'address']
+
+        class ProfileViewSet(SyncModelMixin, viewsets.GenericViewSet):
+            queryset = Profile.objects.all()
+            serializer_class = ProfileSerializer
+            authentication_classes = []
+            permission_classes = []
+            sync_all_objects = True
+
+        return ProfileViewSet.as_view({'get': 'changes'})
+
+    def sync(self, **params):
+        from rest_framework.test import APIRequestFactory
+        response = self.make_view()(APIRequestFactory().get('/profiles/changes/', params))
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_changes_are_paginated_with_a_cursor(self):
+        from base_backend.models import Profile
+        with self.assertNumQueries(1):
+            changes = Profile.objects.changes_since(limit=3)
+        self.assertEqual([row.pk for row in changes.rows], [profile.pk for profile in self.profiles[:3]])
+        self.assertTrue(changes.has_more)
+
+        rest = Profile.objects.changes_since(changes.cursor, limit=3)
+        self.assertEqual([row.pk for row in rest.rows], [profile.pk for profile in self.profiles[3:]])
+        self.assertFalse(rest.has_more)
+        self.assertEqual(Profile.objects.changes_since(rest.cursor).rows, [])
+        self.assertEqual(Profile.objects.changes_since(rest.cursor).cursor, rest.cursor)
+
+    def test_only_the_deltas_and_the_tombstones_are_sent(self):
+        first = self.sync()
+        self.assertEqual(len(first['results']), 5)
+        self.assertFalse(first['has_more'])
+
+        self.profiles[1].address = 'moved'
+        self.profiles[1].save()
+        self.profiles[3].delete()
+        delta = self.sync(cursor=first['cursor'])
+
+        self.assertEqual(delta['results'], [{'id': self.profiles[1].pk, 'address': 'moved'}])
+        self.assertEqual(delta['deleted'], [self.profiles[3].pk])
+        self.assertEqual(self.sync(cursor=delta['cursor'])['results'], [])
+
+    def test_scoped_view_keeps_its_scoping(self):
+        from rest_framework import serializers, viewsets
+        from rest_framework.test import APIRequestFactory, force_authenticate
+        from base_backend.models import Profile
+        from base_backend.sync import SyncModelMixin
+
+        class ProfileSerializer(serializers.ModelSerializer):
+            class Meta:
+                model = Profile
+                fields = ['id']
+
+        class OwnProfileViewSet(SyncModelMixin, viewsets.GenericViewSet):
+            serializer_class = ProfileSerializer
+            permission_classes = []
+
+            def get_queryset(self):
+                return Profile.objects.filter(user=self.request.user)
+
+        class OwnProfileWithTombstonesViewSet(OwnProfileViewSet):
+            def get_sync_base_queryset(self):
+                return Profile.all_objects.filter(user=self.request.user)
+
+        def sync(view_class):
+            request = APIRequestFactory().get('/profiles/changes/')
+            force_authenticate(request, self.users[0])
+            return view_class.as_view({'get': 'changes'})(request).data
+
+        self.assertEqual(sync(OwnProfileViewSet)['results'], [{'id': self.profiles[0].pk}])
+        self.profiles[0].delete()
+        self.profiles[1].delete()
+        self.assertEqual(sync(OwnProfileViewSet)['deleted'], [])
+        self.assertEqual(sync(OwnProfileWithTombstonesViewSet)['deleted'], [self.profiles[0].pk])
+
+    def test_empty_queryset_is_synced(self):
+        from rest_framework import serializers, viewsets
+        from rest_framework.test import APIRequestFactory
+        from base_backend.models import Profile
+        from base_backend.sync import SyncModelMixin
+
+        class ProfileSerializer(serializers.ModelSerializer):
+            class Meta:
+                model = Profile
+                fields = ['id']
+
+        class OwnProfileViewSet(SyncModelMixin, viewsets.GenericViewSet):
+            serializer_class = ProfileSerializer
+            authentication_classes = []
+            permission_classes = []
+
+            def get_queryset(self):
+                if not self.request.user.is_authenticated:
+                    return Profile.objects.none()
+                return Profile.objects.filter(user=self.request.user)
+
+        response = OwnProfileViewSet.as_view({'get': 'changes'})(APIRequestFactory().get('/profiles/changes/'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['results'], response.data['deleted']), ([], []))
+
+    def test_user_is_not_synced(self):
+        self.assertFalse(hasattr(get_user_model().all_objects.all(), 'changes_since'))
+
+    def test_invalid_cursor(self):
+        from rest_framework.test import APIRequestFactory
+        response = self.make_view()(APIRequestFactory().get('/profiles/changes/', {'cursor': 'garbage'}))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('cursor', response.data)
+
+
+@skipUnless(SETTINGS.get("USE_BASE_BACKEND_OUTBOX_TABLE", False), "requires the base backend outbox table.")
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        table = get_outbox_table()
+        self.messages = [table.objects.create(kind=table.SMS, payload={'i': i}) for i in range(7)]
+        # two rows sharing a timestamp are ordered by pk.
+        table.objects.filter(pk=self.messages[4].pk).update(created_at=self.messages[3].created_at)
+
+    def make_view(self):
+        from rest_framework import generics, serializers
+        from base_backend.pagination import KeysetPagination
+        from base_backend.rest_utils import CustomJSONRenderer
+
+        class MessageSerializer(serializers.ModelSerializer):
+            class Meta:
+                model = get_outbox_table()
+                fields = ['id']
+                resource_name = 'messages'
+
+        class MessageList(generics.ListAPIView):
+            queryset = get_outbox_table().objects.all()
+            serializer_class = MessageSerializer
+            pagination_class = KeysetPagination
+            renderer_classes = [CustomJSONRenderer]
+            authentication_classes = []
+            permission_classes = []
+
+        return MessageList.as_view()
+
+    def get(self, **params):
+        import json
+        from rest_framework.test import APIRequestFactory
+        response = self.make_view()(APIRequestFactory().get('/messages/', params))
+        response.render()
+        return response.status_code, json.loads(response.content)
+
+    def test_pages_follow_the_cursors_without_counting(self):
+        pages = []
+        params = {'page_size': 3}
+        while True:
+            with CaptureQueriesContext(connection) as queries:
+                status, body = self.get(**params)
+            self.assertEqual(status, 200)
+            self.assertEqual(len(queries), 1)
+            self.assertNotIn('COUNT(', queries[0]['sql'].upper())
+            pages.append([message['id'] for message in body['messages']])
+            if not body['meta']['has_more']:
+                self.assertIsNone(body['meta']['next'])
+                break
+            self.assertIn('cursor=', body['meta']['next'])
+            params['cursor'] = body['meta']['next_cursor']
+
+        expected = sorted(self.messages, key=lambda message: (message.created_at if message is not self.messages[4]
+                                                              else self.messages[3].created_at, message.pk),
+                          reverse=True)
+        self.assertEqual(pages, [[message.pk for message in expected[i:i + 3]] for i in range(0, 7, 3)])
+
+    def test_empty_page_keeps_the_envelope(self):
+        get_outbox_table().objects.all().delete()
+        status, body = self.get()
+        self.assertEqual(body, {'meta': {'next': None, 'next_cursor': None, 'page_size': 100, 'has_more': False},
+                                'messages': []})
+
+    def test_invalid_cursor(self):
+        status, body = self.get(cursor='garbage')
+        self.assertEqual(status, 404)
+
+
+class JsonRenderingTests(SimpleTestCase):
+    data = {'decimal': Decimal('1.50'), 'date': timezone.now(), 'text': 'ligne\u2028جديد',
+            'nested': [{'a': 1}, None, True, 2.5]}
+
+    def test_orjson_and_stdlib_outputs_match_the_rest_framework_renderer(self):
+        import json
+        from rest_framework.renderers import JSONRenderer
+        from base_backend import rest_utils
+        expected = JSONRenderer().render(self.data)
+
+        self.assertEqual(json.loads(rest_utils.json_dumps(self.data)), json.loads(expected))
+        self.assertNotIn(b'\xe2\x80\xa8', rest_utils.json_dumps(self.data))
+        with mock.patch.object(rest_utils, 'orjson', None):
+            self.assertEqual(rest_utils.json_dumps(self.data), expected)
+
+    def test_envelope_is_streamed_chunk_by_chunk(self):
+        import json
+        from base_backend.rest_utils import iter_json_envelope
+        chunks = [[{'id': i} for i in range(start, start + 3)] for start in range(0, 9, 3)] + [[]]
+
+        parts = list(iter_json_envelope('cities', iter(chunks), meta={'count': 9}))
+
+        self.assertEqual(json.loads(b''.join(parts)), {'meta': {'count': 9}, 'cities': [{'id': i} for i in range(9)]})
+        self.assertEqual(json.loads(b''.join(iter_json_envelope('cities', iter([])))), {'cities': []})
+
+    def test_non_finite_numbers_are_rejected_with_and_without_orjson(self):
+        from base_backend import rest_utils
+        for data in ({'value': float('nan')}, [None, {'a': float('-inf')}], {'value': Decimal('NaN')}):
+            with self.subTest(data):
+                with self.assertRaises(ValueError):
+                    rest_utils.json_dumps(data)
+                with mock.patch.object(rest_utils, 'orjson', None), self.assertRaises(ValueError):
+                    rest_utils.json_dumps(data)
+
+
+@skipUnless(SETTINGS.get("USE_BASE_BACKEND_OUTBOX_TABLE", False), "requires the base backend outbox table.")
+class StreamingListTests(TestCase):
+    def setUp(self):
+        table = get_outbox_table()
+        table.objects.bulk_create([table(kind=table.SMS, payload={'i': i}) for i in range(25)])
+
+    @staticmethod
+    def get_view(score=0.5):
+        from rest_framework import generics, serializers
+        from base_backend.rest_utils import StreamingListMixin
+        table = get_outbox_table()
+
+        class MessageSerializer(serializers.ModelSerializer):
+            score = serializers.SerializerMethodField()
+
+            class Meta:
+                model = table
+                fields = ['id', 'payload', 'score']
+                resource_name = 'messages'
+
+            def get_score(self, message):
+                return score
+
+        class MessageList(StreamingListMixin, generics.ListAPIView):
+            queryset = table.objects.order_by('pk')
+            serializer_class = MessageSerializer
+            authentication_classes = []
+            permission_classes = []
+            stream_chunk_size = 10
+
+        return MessageList.as_view()
+
+    def test_list_is_streamed(self):
+        import json
+        from rest_framework.test import APIRequestFactory
+        response = self.get_view()(APIRequestFactory().get('/messages/'))
+        self.assertTrue(response.streaming)
+        with CaptureQueriesContext(connection) as queries:
+            body = json.loads(b''.join(response.streaming_content))
+
+        self.assertEqual([message['payload']['i'] for message in body['messages']], list(range(25)))
+        self.assertLessEqual(len([query for query in queries if query['sql'].startswith('SELECT')]), 3)
+
+    def test_first_chunk_errors_are_raised_by_the_view(self):
+        from rest_framework.test import APIRequestFactory
+        # raised before the response starts, instead of cutting a 200 response short.
+        with self.assertRaises(ValueError):
+            self.get_view(score=float('nan'))(APIRequestFactory().get('/messages/'))
+
+
+@skipUnless(SETTINGS.get("USE_BASE_BACKEND_REGIONS", False), "requires the base backend regions tables.")
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from base_backend.models import Region, State
+        cache.clear()
+        region = Region.objects.create(name='Algeria', name_ar='الجزائر', name_fr='Algérie')
+        self.state = State.objects.create(name='Adrar', name_ar='أدرار', name_fr='Adrar', matricule=1,
+                                          code_postal=1000, region=region)
+        self.calls = 0
+
+    def view(self):
+        from base_backend.caching import cache_response
+        from base_backend.models import State
+        from base_backend.rest_utils import DefaultApiResponse
+
+        @cache_response(State, per_user=False)
+        def states(request):
+            self.calls += 1
+            return DefaultApiResponse(data=list(State.objects.values_list('name', flat=True))).as_response()
+
+        return states
+
+    def test_conditional_get_and_cached_body_skip_the_database(self):
+        import json
+        view = self.view()
+        first = view(RequestFactory().get('/states/'))
+        self.assertEqual(json.loads(first.content)['data'], ['Adrar'])
+
+        with self.assertNumQueries(0):
+            cached = view(RequestFactory().get('/states/'))
+            not_modified = view(RequestFactory().get('/states/', HTTP_IF_NONE_MATCH=first['ETag']))
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual((cached.status_code, cached.content, cached['ETag']), (200, first.content, first['ETag']))
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], first['ETag'])
+
+    def test_hits_keep_the_view_headers(self):
+        from django.http import HttpResponse
+        from base_backend.caching import cache_response
+        from base_backend.models import State
+
+        @cache_response(State, per_user=False)
+        def states(request):
+            response = HttpResponse(b'[]', content_type='application/json')
+            response['Cache-Control'] = 'max-age=60'
+            response['Link'] = '</states/?page=2>; rel="next"'
+            return response
+
+        first = states(RequestFactory().get('/states/'))
+        cached = states(RequestFactory().get('/states/'))
+
+        for header in ('Content-Type', 'Cache-Control', 'Link', 'ETag', 'Vary'):
+            self.assertEqual(cached[header], first[header], header)
+
+    def test_version_counters_dont_expire(self):
+        from base_backend import caching
+        from base_backend.models import State
+        cache = caching.get_cache()
+        with mock.patch.object(cache, 'add', wraps=cache.add) as add:
+            caching.get_model_versions([State])
+        self.assertEqual(add.call_args[0][2], None)
+
+    def test_saving_a_row_bumps_the_version(self):
+        import json
+        view = self.view()
+        first = view(RequestFactory().get('/states/'))
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.state.name = 'Adrar 2'
+            self.state.save()
+            # the version only moves once the transaction commits.
+            self.assertEqual(view(RequestFactory().get('/states/', HTTP_IF_NONE_MATCH=first['ETag'])).status_code,
+                             304)
+        # the responses version and the reference data version.
+        self.assertEqual(len(callbacks), 2)
+
+        response = view(RequestFactory().get('/states/', HTTP_IF_NONE_MATCH=first['ETag']))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+        self.assertEqual(json.loads(response.content)['data'], ['Adrar 2'])
+
+    @skipUnless(SETTINGS.get("USE_BASE_BACKEND_OUTBOX_TABLE", False), "requires the base backend outbox table.")
+    def test_unwatched_models_writes_skip_the_cache(self):
+        from base_backend.caching import watched_models
+        self.assertNotIn(get_outbox_table(), watched_models)
+        with self.captureOnCommitCallbacks() as callbacks, mock.patch('base_backend.caching.get_cache') as get_cache:
+            get_outbox_table().objects.create(kind=get_outbox_table().SMS, payload={})
+        self.assertEqual(callbacks, [])
+        get_cache.assert_not_called()
+
+    def test_rest_framework_view_is_cached_per_user(self):
+        import json
+        from rest_framework import generics, serializers
+        from rest_framework.test import APIRequestFactory, force_authenticate
+        from base_backend.caching import CachedResponseMixin
+        from base_backend.models import State
+
+        class StateSerializer(serializers.ModelSerializer):
+            class Meta:
+                model = State
+                fields = ['id', 'name']
+
+        class StateList(CachedResponseMixin, generics.ListAPIView):
+            queryset = State.objects.all()
+            serializer_class = StateSerializer
+            permission_classes = []
+
+        users = [get_user_model().objects.create(username='user%d' % i, phones=['+21379913633%d' % i],
+                                                 user_type='C', is_active=True) for i in range(2)]
+
+        def get(user, **headers):
+            request = APIRequestFactory().get('/states/', **headers)
+            force_authenticate(request, user)
+            response = StateList.as_view()(request)
+            if hasattr(response, 'render'):
+                response.render()
+            return response
+
+        first = get(users[0])
+        self.assertEqual(json.loads(first.content), [{'id': self.state.pk, 'name': 'Adrar'}])
+        with self.assertNumQueries(0):
+            self.assertEqual(get(users[0], HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+            self.assertEqual(get(users[0]).content, first.content)
+        self.assertNotEqual(get(users[1])['ETag'], first['ETag'])
+
+
+class DeleteGroupBackend(ModelBackend):
+    """
+    grants auth.delete_group on top of the ModelBackend permissions.
+    """
+
+    def has_perm(self, user_obj, perm, obj=None):
+        return perm == 'auth.delete_group' or super().has_perm(user_obj, perm, obj)
+
+
+@skipUnless(SETTINGS.get("USE_BASE_BACKEND_USER_MODEL", False), "requires the base backend user model.")
+class AuthorizationTests(TestCase):
+    def setUp(self):
+        from django.contrib.auth.models import Group, Permission
+        from django.core.cache import cache
+        cache.clear()
+        self.user = get_user_model().objects.create(username='staff', phones=['+213799136331'], user_type='C',
+                                                    is_active=True)
+        self.group = Group.objects.create(name='editors')
+        self.group.permissions.add(Permission.objects.get(codename='change_group'))
+        self.user.groups.add(self.group)
+        self.user.user_permissions.add(Permission.objects.get(codename='view_group'))
+
+    def fresh_user(self):
+        return get_user_model().objects.get(pk=self.user.pk)
+
+    def test_templatetags_load_the_context_once(self):
+        from django.template import Context, Engine
+        engine = Engine(libraries={'extra': 'base_backend.templatetags.extra'})
+        template = engine.from_string('{% load extra %}{% for i in rows %}{{ user|has_group:"editors" }}'
+                                      '{{ user|has_group:"x" }}{{ user|has_perm:"auth.change_group" }}'
+                                      '{{ user|has_perm:"auth.delete_group" }}{% endfor %}')
+        user = self.fresh_user()
+        with self.assertNumQueries(2):
+            content = template.render(Context({'user': user, 'rows': range(50)}))
+        self.assertEqual(content, 'TrueFalseTrueFalse' * 50)
+
+    def test_other_backends_permissions_still_count(self):
+        from django.template import Context, Engine
+        engine = Engine(libraries={'extra': 'base_backend.templatetags.extra'})
+        template = engine.from_string('{% load extra %}{{ user|has_perm:"auth.delete_group" }}')
+        self.assertEqual(template.render(Context({'user': self.fresh_user()})), 'False')
+        with override_settings(AUTHENTICATION_BACKENDS=['base_backend.tests.tests.DeleteGroupBackend']):
+            self.assertEqual(template.render(Context({'user': self.fresh_user()})), 'True')
+        with override_settings(AUTHENTICATION_BACKENDS=['base_backend.authentication_backends.PhoneOrEmailBackend']):
+            user = self.fresh_user()
+            with self.assertNumQueries(2):
+                self.assertEqual(template.render(Context({'user': user})), 'False')
+
+    def test_context(self):
+        from django.contrib.auth.models import AnonymousUser
+        from base_backend.authorization import get_authorization
+        authorization = get_authorization(self.fresh_user())
+        self.assertEqual(authorization.groups, frozenset({'editors'}))
+        self.assertEqual(authorization.permissions, frozenset({'auth.change_group', 'auth.view_group'}))
+        self.assertTrue(authorization.has_perms(['auth.change_group', 'auth.view_group']))
+        self.assertTrue(authorization.has_module_perms('auth'))
+        self.assertFalse(get_authorization(AnonymousUser()).has_perm('auth.view_group'))
+
+        self.user.is_active = False
+        self.assertFalse(get_authorization(self.user).has_perm('auth.view_group'))
+
+    def test_shared_cache_is_invalidated(self):
+        from django.contrib.auth.models import Group
+        from base_backend.authorization import get_authorization
+        with override_settings(BASE_BACKEND=dict(SETTINGS, AUTHORIZATION_CACHE='default')):
+            get_authorization(self.fresh_user())
+            with self.assertNumQueries(1):
+                self.assertTrue(get_authorization(self.fresh_user()).has_group('editors'))
+
+            self.user.groups.add(Group.objects.create(name='reviewers'))
+            self.assertTrue(get_authorization(self.fresh_user()).has_group('reviewers'))
+
+            self.group.permissions.clear()
+            self.assertFalse(get_authorization(self.fresh_user()).has_perm('auth.change_group'))
+
+            self.group.user_set.remove(self.user)
+            self.assertFalse(get_authorization(self.fresh_user()).has_group('editors'))
+
+    def test_permission_and_decorator(self):
+        from base_backend.decorators import group_required
+        from base_backend.permissions import HasPermissions, IsInGroup
+        view = types.SimpleNamespace(required_groups=['editors'], required_permissions=['auth.change_group'])
+        request = types.SimpleNamespace(user=self.fresh_user())
+        self.assertTrue(IsInGroup().has_permission(request, view))
+        self.assertTrue(HasPermissions().has_permission(request, view))
+        view.required_permissions.append('auth.delete_group')
+        self.assertFalse(HasPermissions().has_permission(request, view))
+
+        protected = group_required('admins', raise_exception=True)(lambda request: HttpResponse('ok'))
+        request = RequestFactory().get('/')
+        request.user = self.fresh_user()
+        with self.assertRaises(PermissionDenied):
+            protected(request)
+        self.assertEqual(group_required('editors')(lambda request: HttpResponse('ok'))(request).content, b'ok')
+
+
+@skipUnless(SETTINGS.get("USE_BASE_BACKEND_PROFILE_MODEL", False), "requires the base backend profile model.")
+class OwnerScopingTests(TestCase):
+    def setUp(self):
+        from base_backend.models import Profile
+        self.users = [get_user_model().objects.create(username='owner%d' % i, phones=['+21379913634%d' % i],
+                                                      user_type='C', is_active=True) for i in range(3)]
+        self.profiles = [Profile.objects.create(user=user, address='address %d' % i)
+                         for i, user in enumerate(self.users)]
+
+    def get_view(self):
+        from rest_framework import generics, serializers
+        from base_backend.filters import IsAdminOrIsOwnerFilterBackend
+        from base_backend.models import Profile
+        from base_backend.permissions import IsAdminOrIsOwner
+
+        class ProfileSerializer(serializers.ModelSerializer):
+            class Meta:
+                model = Profile
+                fields = ['id', 'address']
+
+        class Profiles(generics.ListAPIView):
+            queryset = Profile.objects.all()
+            serializer_class = ProfileSerializer
+            permission_classes = [IsAdminOrIsOwner]
+            filter_backends = [IsAdminOrIsOwnerFilterBackend]
+            pagination_class = None
+
+        return Profiles.as_view()
+
+    def get(self, user):
+        from rest_framework.test import APIRequestFactory, force_authenticate
+        request = APIRequestFactory().get('/profiles/')
+        force_authenticate(request, user)
+        response = self.get_view()(request)
+        response.render()
+        return response
+
+    def test_list_is_scoped_in_one_query(self):
+        import json
+        with self.assertNumQueries(1):
+            response = self.get(self.users[1])
+        self.assertEqual(json.loads(response.content), [{'id': self.profiles[1].pk, 'address': 'address 1'}])
+
+        self.users[0].is_staff = True
+        with self.assertNumQueries(1):
+            self.assertEqual(len(json.loads(self.get(self.users[0]).content)), 3)
+
+    def test_object_permissions_compare_the_owner_id(self):
+        from django.contrib.auth.models import AnonymousUser
+        from base_backend.models import Profile
+        from base_backend.permissions import IsOwner, IsOwnerOrReadOnly
+        profiles = list(Profile.objects.order_by('pk'))
+        request = types.SimpleNamespace(user=self.users[0], method='PATCH')
+        with self.assertNumQueries(0):
+            self.assertEqual([IsOwner().has_object_permission(request, None, profile) for profile in profiles],
+                             [True, False, False])
+            self.assertFalse(IsOwnerOrReadOnly().has_object_permission(request, None, profiles[1]))
+            self.assertFalse(IsOwner().has_object_permission(types.SimpleNamespace(user=AnonymousUser()), None,
+                                                             profiles[0]))
+
+    def test_anonymous_gets_nothing(self):
+        from django.contrib.auth.models import AnonymousUser
+        from base_backend.filters import IsOwnerFilterBackend
+        from base_backend.models import Profile
+        request = types.SimpleNamespace(user=AnonymousUser())
+        with self.assertNumQueries(0):
+            self.assertEqual(list(IsOwnerFilterBackend().filter_queryset(request, Profile.objects.all(), None)), [])
+
+    def test_owner_field_must_hold_the_owner(self):
+        from django.core.exceptions import ImproperlyConfigured
+        from base_backend.ownership import get_owner_field
+        user_model = get_user_model()
+        # a reverse relation and a many to many relation, neither has a column holding the owner.
+        for name in ('profile', 'groups'):
+            with self.subTest(name), mock.patch.object(user_model, 'OWNER_FIELD', name, create=True):
+                with self.assertRaises(ImproperlyConfigured):
+                    get_owner_field(user_model)
+
+
+@skipUnless(SETTINGS.get("USE_BASE_BACKEND_USER_MODEL", False), "requires the base backend user model.")
+@modify_settings(INSTALLED_APPS={'append': 'base_backend.tests.testapp'})
+class OwnedModelTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        from base_backend.tests.testapp.models import OwnedNote
+        # the test app has no migrations, its table is dropped with the test case's transaction.
+        with connection.schema_editor() as editor:
+            editor.create_model(OwnedNote)
+
+    def setUp(self):
+        from base_backend.tests.testapp.models import OwnedNote
+        self.users = [get_user_model().objects.create(username='writer%d' % i, phones=['+21379913635%d' % i],
+                                                      user_type='C', is_active=True) for i in range(2)]
+        self.notes = [OwnedNote.objects.create(owner=self.users[i % 2], title='note %d' % i) for i in range(4)]
+
+    def test_owned_by(self):
+        from django.contrib.auth.models import AnonymousUser
+        from base_backend.tests.testapp.models import OwnedNote
+        with self.assertNumQueries(1) as queries:
+            notes = list(OwnedNote.objects.owned_by(self.users[0]).order_by('-created_at', '-id'))
+        self.assertEqual(notes, [self.notes[2], self.notes[0]])
+        self.assertNotIn('JOIN', queries.captured_queries[0]['sql'])
+        with self.assertNumQueries(0):
+            self.assertEqual(list(OwnedNote.objects.owned_by(AnonymousUser())), [])
+            self.assertEqual([note.is_owned_by(self.users[1]) for note in notes], [False, False])
+
+    def test_owner_index(self):
+        from base_backend.tests.testapp.models import OwnedNote
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, OwnedNote._meta.db_table)
+        indexes = [constraint['columns'] for constraint in constraints.values()
+                   if constraint['index'] and not constraint['primary_key']]
+        self.assertIn(['owner_id', 'created_at', 'id'], indexes)
+        # kept for the subclasses replacing the composite index.
+        self.assertIn(['owner_id'], indexes)
@@ -1,3 +1,6 @@
+import unicodedata
+
+
 def trim_text_to_90chars(text: str) -> list:
     """
     needed that in one of my projects where i had to trim the length of a line in a pdf to 90chars,
@@ -17,3 +20,20 @@ def trim_text_to_90chars(text: str) -> list:
             a_line = " " + word
     lines.append(a_line)
     return lines
+
+
+# the arabic letters written in several ways, folded to a single form.
+ARABIC_VARIANTS = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا', 'ى': 'ي', 'ئ': 'ي', 'ؤ': 'و', 'ة': 'ه', 'ـ': None,
+})
+
+
+def normalize_text(text: str) -> str:
+    """
+    folds the text for searching: lowercase, without the latin accents, the arabic diacritics (harakat) nor the
+    tatweel, with the arabic letter variants unified and the punctuation turned into single spaces.
+    "Béjaïa" -> "bejaia", "الجَزائِر" -> "الجزاير", "Aïn-Témouchent" -> "ain temouchent".
+    """
+    text = unicodedata.normalize('NFKD', text.casefold())
+    text = ''.join(char for char in text if not unicodedata.combining(char)).translate(ARABIC_VARIANTS)
+    return ' '.join(''.join(char if char.isalnum() else ' ' for char in text).split())
@@ -0,0 +1,273 @@
+"""
+API access tokens, stored hashed in the access token table (see get_access_token_table).
+resolving a token goes through a small in-process LRU, then through the shared django cache and only then to the
+database. only the token's identity (its pk, its user's pk and its expiry) is cached, the user is loaded from the
+database by its primary key on each request, so a deactivated, deleted or changed user is seen right away.
+
+settings:
+ACCESS_TOKEN_CACHE: the django cache alias shared by the processes (default 'default').
+ACCESS_TOKEN_CACHE_TTL: seconds a resolved token is kept in the shared cache (default 300).
+ACCESS_TOKEN_LRU_SIZE: the number of tokens kept by each process (default 1024).
+ACCESS_TOKEN_LRU_TTL: seconds a token is kept by a process (default 30), revoking a token clears the shared cache and
+the local LRU of the revoking process, the other processes forget it after this delay.
+ACCESS_TOKEN_LIFETIME: seconds a token stays valid after its creation (default None, the tokens never expire).
+ACCESS_TOKEN_LAST_USED_FLUSH_INTERVAL: the tokens last use is recorded in memory and written to the database at most
+once per interval (default 60 seconds), from a background thread, with a single UPDATE for all the tokens used in
+between.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import timedelta
+from functools import lru_cache
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import connections, transaction
+from django.utils import timezone
+
+from . import SETTINGS, get_access_token_table
+from .utils import generate_token
+
+
+class ResolvedToken(namedtuple('ResolvedToken', ['pk', 'key', 'user_id', 'expires_at'])):
+    """
+    what the caches hold of an access token, the user isn't part of it.
+    """
+    __slots__ = ()
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at is not None and self.expires_at <= timezone.now()
+
+
+class LRUCache(object):
+    """
+    Thread safe, bounded mapping evicting the least recently used entries, the entries also expire after ttl seconds.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+@lru_cache(maxsize=None)
+def get_local_tokens() -> LRUCache:
+    """
+    the tokens cache of the process, built again when the settings change (see reload_settings).
+    """
+    return LRUCache(SETTINGS.get("ACCESS_TOKEN_LRU_SIZE", 1024), SETTINGS.get("ACCESS_TOKEN_LRU_TTL", 30))
+
+
+def get_tokens_cache():
+    return caches[SETTINGS.get("ACCESS_TOKEN_CACHE", "default")]
+
+
+def hash_token(token: str) -> str:
+    """
+    the tokens are random, a plain sha256 is enough to keep them unusable if the table leaks.
+    """
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def make_cache_key(key: str) -> str:
+    return "base_backend:token:{0}".format(key)
+
+
+class TokenUses(object):
+    """
+    Records the tokens last use in memory, and writes them in batches from a background thread, the request crossing
+    the interval only starts it.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.used = set()
+        self.flushed_at = time.monotonic()
+        self.flushing = False
+        self.lock = threading.Lock()
+
+    def record(self, pk):
+        with self.lock:
+            self.used.add(pk)
+            due = not self.flushing and time.monotonic() - self.flushed_at >= self.interval
+            if due:
+                self.flushing = True
+        if due:
+            threading.Thread(target=self.flush_in_background, daemon=True).start()
+
+    def flush_in_background(self):
+        try:
+            self.flush()
+        finally:
+            with self.lock:
+                self.flushing = False
+            # the connections of this thread, it won't be reused.
+            connections.close_all()
+
+    def flush(self):
+        """
+        writes the pending uses with one UPDATE, the flush time is used as the last use of all of them. the uses are
+        kept for the next flush if the UPDATE fails.
+        """
+        with self.lock:
+            used, self.used = self.used, set()
+            self.flushed_at = time.monotonic()
+        if used:
+            try:
+                get_access_token_table().objects.filter(pk__in=used).update(last_used_at=timezone.now())
+            except Exception:
+                with self.lock:
+                    self.used.update(used)
+                raise
+
+
+@lru_cache(maxsize=None)
+def get_token_uses() -> TokenUses:
+    """
+    the tokens uses of the process, built again when the settings change (see reload_settings).
+    """
+    return TokenUses(SETTINGS.get("ACCESS_TOKEN_LAST_USED_FLUSH_INTERVAL", 60))
+
+
+def create_access_token(user) -> str:
+    """
+    issues a new access token for the user, it expires after ACCESS_TOKEN_LIFETIME.
+    :return: the raw token, it must be handed to the client since only its hash is stored.
+    """
+    return issue_access_token(user.pk)
+
+
+def issue_access_token(user_id) -> str:
+    token = generate_token()
+    lifetime = SETTINGS.get("ACCESS_TOKEN_LIFETIME", None)
+    expires_at = timezone.now() + timedelta(seconds=lifetime) if lifetime is not None else None
+    get_access_token_table().objects.create(key=hash_token(token), user_id=user_id, expires_at=expires_at)
+    return token
+
+
+def get_access_token(token: str):
+    """
+    finds the access token, through the caches.
+    :param token: the raw token
+    :return: the ResolvedToken, None if the token is unknown or expired.
+    """
+    if not token:
+        return None
+    key = hash_token(token)
+    access_token = get_local_tokens().get(key)
+    if access_token is None:
+        cache = get_tokens_cache()
+        access_token = cache.get(make_cache_key(key))
+        if access_token is None:
+            row = get_access_token_table().objects.filter(key=key).values_list(
+                'pk', 'key', 'user_id', 'expires_at').first()
+            if row is None:
+                return None
+            access_token = ResolvedToken(*row)
+            cache.set(make_cache_key(key), access_token, SETTINGS.get("ACCESS_TOKEN_CACHE_TTL", 300))
+        get_local_tokens().set(key, access_token)
+    if access_token.expired:
+        return None
+    get_token_uses().record(access_token.pk)
+    return access_token
+
+
+def get_token_user(access_token):
+    """
+    loads the token's user by its primary key, the default manager leaves the deleted users out.
+    :return: the user, None if it's deleted or inactive.
+    """
+    UserModel = get_user_model()
+    try:
+        user = UserModel._default_manager.get(pk=access_token.user_id)
+    except UserModel.DoesNotExist:
+        return None
+    return user if user.is_active else None
+
+
+def resolve_access_token(token: str):
+    """
+    finds the active user owning the token.
+    :param token: the raw token
+    :return: the user, None if the token is unknown or expired or if the user is inactive or deleted.
+    """
+    access_token = get_access_token(token)
+    if access_token is None:
+        return None
+    return get_token_user(access_token)
+
+
+def rotate_access_token(token: str):
+    """
+    replaces the token with a new one for the same user, with a new lifetime.
+    :param token: the raw token
+    :return: the new raw token, None if the token is unknown or expired.
+    """
+    access_token = get_access_token(token)
+    if access_token is None:
+        return None
+    with transaction.atomic():
+        new_token = issue_access_token(access_token.user_id)
+        revoke_access_token(token)
+    return new_token
+
+
+def invalidate_access_tokens(*keys) -> None:
+    """
+    forgets the cached resolutions of the hashed tokens.
+    """
+    get_tokens_cache().delete_many([make_cache_key(key) for key in keys])
+    for key in keys:
+        get_local_tokens().delete(key)
+
+
+def revoke_access_token(token: str) -> None:
+    """
+    deletes the token, to be used on logout.
+    :param token: the raw token
+    """
+    key = hash_token(token)
+    get_access_token_table().objects.filter(key=key).delete()
+    invalidate_access_tokens(key)
+
+
+def revoke_user_access_tokens(user) -> None:
+    """
+    deletes all the tokens of the user, to be used when the password changes.
+    """
+    tokens = get_access_token_table().objects.filter(user=user)
+    keys = list(tokens.values_list('key', flat=True))
+    tokens.delete()
+    invalidate_access_tokens(*keys)
@@ -1,20 +1,25 @@
 import os
 import random
 import secrets
+import string
 from functools import wraps
 
-from json import JSONDecodeError
+from json import JSONDecodeError, JSONDecoder
 
-import requests
 from . import SETTINGS
 from django.contrib.auth import get_user_model
 from django.core.exceptions import PermissionDenied
 from django.core.mail import send_mail
-from django.db import models
+from django.db import connections, models, transaction, IntegrityError
 from django.db.models import Q, Func
+from django.db.models.sql import UpdateQuery
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 
-from . import get_password_reset_table, get_otp_verification_table, get_send_sms_function
+from . import get_password_reset_table, get_otp_verification_table, \
+    get_password_reset_ttl, get_otp_store, get_otp_ttl, get_outbox_table
+from . import sms
+from .outbox import outbox_enabled, enqueue
 
 
 # from restaurant.settings import EMAIL_HOST_USER
@@ -31,18 +36,10 @@ def generate_token(length=32):
 def generate_alphabetic_random_code() -> str:
     """
     generates a 5 alphabetic capital characters random code, this is being used as OTP.
+    the 26^5 (about 11.9M) codes leave room for a million pending codes, a draw collides with 1 chance in 12.
     :return: String
     """
-    alphabet = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'J', 'K', 'L', 'M', 'N', 'O', 'P', 'Q', 'R', 'S', 'T', 'U',
-                'V', 'W', 'X', 'Y', 'Z']
-    random_alphabet = random.choice(alphabet)
-    randoms = [random_alphabet]
-    for i in range(4):
-        randoms.append(str(random.randint(0, 9)))
-
-    code = ''.join(randoms)
-
-    return code
+    return ''.join(secrets.choice(string.ascii_uppercase) for i in range(5))
 
 
 def generate_all_chars_random_code() -> str:
@@ -74,42 +71,139 @@ def generate_random_password() -> str:
     return password
 
 
+def normalize_phone(phone: str) -> str:
+    """
+    removes the separators users type in phone numbers (spaces, dashes, dots and parentheses), so the stored and the
+    looked up numbers compare equal.
+    """
+    return ''.join(char for char in phone if char not in ' -.()\t')
+
+
+def phone_lookup(phone: str) -> Q:
+    """
+    builds the filter matching the users owning the phone number, works with the phones array of the base backend
+    user model and with user models declaring a single phone field.
+    the array containment (@>) is answered by the GIN index of the base backend user model phones.
+    :param phone: the phone number
+    :return: Q
+    """
+    phone = normalize_phone(phone)
+    if any(field.name == 'phones' for field in get_user_model()._meta.get_fields()):
+        return Q(phones__contains=[phone])
+    return Q(phone=phone)
+
+
+def not_expired(ttl) -> Q:
+    """
+    builds the filter matching the rows created within the ttl, matches everything if the ttl is None.
+    :param ttl: a timedelta or None
+    :return: Q
+    """
+    if ttl is None:
+        return Q()
+    return Q(created_at__gte=timezone.now() - ttl)
+
+
+def update_returning(queryset, values: dict, field: str):
+    """
+    updates the rows of the queryset with a single UPDATE ... RETURNING, on postgresql only. the statement is the one
+    QuerySet.update compiles (the filters on related models become a pk IN subquery), RETURNING is appended to it.
+    the callers fall back to select_for_update().values_list() then update() in the same transaction elsewhere.
+    :param values: the updated fields values
+    :param field: the name of the field returned for each updated row
+    :return: the list of the returned values, None on the other databases, nothing is updated then.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    if queryset.query.is_sliced:
+        raise TypeError("Cannot update a query once a slice has been taken.")
+    if queryset.query.is_empty():
+        return []
+    query = queryset.query.chain(UpdateQuery)
+    query.add_update_values(values)
+    sql, params = query.get_compiler(connection=connection).as_sql()
+    column = queryset.model._meta.get_field(field).column
+    with connection.cursor() as cursor:
+        cursor.execute("{0} RETURNING {1}".format(sql, connection.ops.quote_name(column)), params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def issue_otp_code(phone: str):
+    """
+    stores a new random code (OTP) for the phone number in the otp verification table.
+    instead of querying the table for a free code before inserting it, the code is inserted straight away and the
+    unique constraint on pending codes (see SmsVerification) rejects the collisions, which are retried with a new code.
+    the expired codes are left out of the constraint: the colliding expired row is deleted and its code reused.
+    custom otp tables should declare the same constraint, otherwise collisions go undetected.
+    :param phone: phone number provided by the user
+    :return: the otp verification instance
+    """
+    table = get_otp_verification_table()
+    attempts = SETTINGS.get("OTP_ISSUE_MAX_ATTEMPTS", 10)
+    ttl = get_otp_ttl()
+    code = generate_alphabetic_random_code()
+    with transaction.atomic():
+        for attempt in range(attempts):
+            try:
+                # the savepoint keeps the outer transaction usable after a collision.
+                with transaction.atomic():
+                    return table.objects.create(otp_code=code, number=phone)
+            except IntegrityError:
+                if attempt == attempts - 1:
+                    raise
+            # an expired code the purge didn't delete yet still holds its slot in the constraint, it's freed and
+            # reused, a live code makes us draw another one.
+            if ttl is None or not table.objects.filter(otp_code=code, confirmed=False,
+                                                       created_at__lt=timezone.now() - ttl).delete()[0]:
+                code = generate_alphabetic_random_code()
+
+
 def phone_sms_verification(phone: str):
     """
     creates a tuple of a random code (OTP) and a phone number and stores them in the otp verification table,
     to verify the phone number provided by a user.
-    requires the use of the sms verification table, either implementing your own or using the one provided by the *
-    library.
+    the code is kept by the active otp store (see OTP_STORE), the default store requires the use of the sms
+    verification table, either implementing your own or using the one provided by the library.
     :param phone: phone number provided by the user
     :return:
     """
-    code = generate_alphabetic_random_code()
-    sms = get_otp_verification_table().objects.filter(otp_code=code, confirmed=False)
-
-    while sms.exists():
-        code = generate_alphabetic_random_code()
-        sms = get_otp_verification_table().objects.filter(otp_code=code, confirmed=False)
-
-    get_otp_verification_table().objects.create(otp_code=code, number=phone)
+    code = get_otp_store().issue(phone)
     message = "use this code: {0}, to confirm your {1} account phone number.".format(code, SETTINGS.get("APP_NAME"))
     send_sms(phone, message)
 
 
-def phone_reconfirmation(phone: get_otp_verification_table()):
-    message = "use this code: {0}, to confirm your {1} account phone number.".format(phone.otp_code,
-                                                                                     SETTINGS.get("APP_NAME"))
-    send_sms(phone.number, message)
+def phone_reconfirmation(phone):
+    """
+    sends again the live code of the phone number, a new one is issued if the previous code expired.
+    :param phone: the phone number, or an otp verification instance for backward compatibility
+    :return:
+    """
+    number = getattr(phone, 'number', phone)
+    code = get_otp_store().resend(number)
+    message = "use this code: {0}, to confirm your {1} account phone number.".format(code, SETTINGS.get("APP_NAME"))
+    send_sms(number, message)
 
 
 def send_sms(phone, message):
     """
-    send an sms containing the message parameter to the phone parameter
+    send an sms containing the message parameter to the phone parameter, the sms is queued in the outbox when
+    USE_BASE_BACKEND_OUTBOX_TABLE is set.
     :param phone: the target phone
     :param message: the message to be sent
     :return:
     """
-    send_sms_function = get_send_sms_function()
-    send_sms_function(phone=phone, message=message)
+    if outbox_enabled():
+        enqueue(get_outbox_table().SMS, phone=phone, message=message)
+    else:
+        deliver_sms(phone, message)
+
+
+def deliver_sms(phone, message):
+    """
+    sends the sms right away, through the SMS_BACKEND (see the sms module).
+    """
+    sms.send_sms(phone, message)
 
 
 def reset_user_password(token, attr, password):
@@ -121,15 +215,19 @@ def reset_user_password(token, attr, password):
     :param password: the new password
     :return: True if the password
     """
-    password_reset = get_object_or_404(get_password_reset_table(), Q(Q(phone=attr) | Q(email=attr)), token=token)
-    if not password_reset.used:
-        password_reset.used = True
-        password_reset.save()
-        user = get_object_or_404(get_user_model(), Q(Q(phone=attr) | Q(email=attr)))
+    credentials = Q(Q(phone=attr) | Q(email=attr), token=token)
+    # only pending and unexpired requests are looked up, which is what the partial token index covers.
+    pending = get_password_reset_table().objects.filter(credentials, not_expired(get_password_reset_ttl()), used=False)
+    if pending.update(used=True, updated_at=timezone.now()):
+        user = get_object_or_404(get_user_model(), phone_lookup(attr) | Q(email__iexact=attr))
         user.set_password(password)
         user.save()
+        if SETTINGS.get("USE_BASE_BACKEND_ACCESS_TOKEN_TABLE", False) or SETTINGS.get("ACCESS_TOKEN_TABLE", None):
+            from .tokens import revoke_user_access_tokens
+            revoke_user_access_tokens(user)
         return True
     else:
+        get_object_or_404(get_password_reset_table(), credentials)
         return False
 
 
@@ -150,28 +248,35 @@ def verify_sms_code_for_phone_confirmation(code: str):
     :param code:
     :return:
     """
-    verification = get_otp_verification_table().objects.filter(otp_code=code)
-    if verification.exists():
-        verification = verification.first()
-        verification.confirmed = True
-        verification.save()
-        return True, verification.number
+    number = get_otp_store().consume(code)
+    if number is not None:
+        return True, number
     return False, False
 
 
 def activate_user_over_otp(code):
     """
-    verifies the provided code if it belongs to account confirmation OTP then activates the user
+    verifies the provided code if it belongs to account confirmation OTP then activates the user, the code is only
+    used up if the user is activated.
     :param code:
     :return:
     """
-    status, response = verify_sms_code_for_phone_confirmation(code)
-    if status:
-        user = get_user_model().objects.filter(phone=response)
-        the_user = user.first()
-        the_user.is_active = True
-        the_user.save()
-        return True
+    store = get_otp_store()
+    phone = None
+    try:
+        with transaction.atomic():
+            phone = store.consume(code)
+            if phone is not None and get_user_model().objects.filter(phone_lookup(phone)).update(is_active=True):
+                return True
+            # keeps the code usable when no user owns the phone number.
+            transaction.set_rollback(True)
+    except Exception:
+        if phone is not None:
+            store.release(code)
+        raise
+    # only the claim made by this call is released, a code claimed by another request stays in use.
+    if phone is not None:
+        store.release(code)
     return False
 
 
@@ -197,6 +302,69 @@ def api_errors_extractor(form_errors) -> list:
         return list(zip(list_keys, values))
 
 
+def iter_json(file, chunk_size: int = 64 * 1024):
+    """
+    Streams the items of a json document whose root is an array or an object, without loading the whole document.
+    the file is read chunk by chunk and each item is decoded as soon as it's complete.
+    :param file: a text file object
+    :param chunk_size: the number of characters read at once
+    :return: a generator of the array items, or of the (key, value) pairs of the object
+    """
+    decoder = JSONDecoder()
+    buffer = ''
+    position = 0
+    eof = False
+
+    def fill():
+        nonlocal buffer, position, eof
+        chunk = file.read(chunk_size)
+        buffer = buffer[position:] + chunk
+        position = 0
+        eof = not chunk
+
+    def skip(characters):
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in characters:
+                position += 1
+            if position < len(buffer) or eof:
+                return
+            fill()
+
+    def decode():
+        nonlocal position
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+                # a value ending the buffer may be truncated (a number for instance), unless the file is over.
+                if end < len(buffer) or eof:
+                    position = end
+                    return value
+            except JSONDecodeError:
+                if eof:
+                    raise
+            fill()
+
+    skip(' \t\r\n')
+    if position >= len(buffer) or buffer[position] not in '[{':
+        raise JSONDecodeError("the document root must be an array or an object", buffer, position)
+    is_object = buffer[position] == '{'
+    closing = '}' if is_object else ']'
+    position += 1
+    while True:
+        skip(' \t\r\n,')
+        if position >= len(buffer):
+            raise JSONDecodeError("unterminated document", buffer, position)
+        if buffer[position] == closing:
+            return
+        if is_object:
+            key = decode()
+            skip(' \t\r\n:')
+            yield key, decode()
+        else:
+            yield decode()
+
+
 def handle_uploaded_file(file, directory) -> None:
     """
     Stores the file at the desired location.
@@ -210,11 +378,23 @@ def handle_uploaded_file(file, directory) -> None:
 def send_email(subject: str, email: str, message: str) -> int:
     """
     still under development.
+    the email is queued in the outbox when USE_BASE_BACKEND_OUTBOX_TABLE is set, 1 is returned once it's queued.
+    """
+    if outbox_enabled():
+        enqueue(get_outbox_table().EMAIL, subject=subject, email=email, message=message)
+        return 1
+    return deliver_email(subject, email, message)
+
+
+def deliver_email(subject: str, email: str, message: str) -> int:
+    """
+    sends the email right away, from the DEFAULT_FROM_EMAIL address.
     """
     return send_mail(
         subject=subject,
         message=message,
         # from_email=EMAIL_HOST_USER,
+        from_email=None,
         recipient_list=email if isinstance(email, list) else [email]
     )
 